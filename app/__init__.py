@@ -1,13 +1,44 @@
+import importlib
+
 from flask import Flask
 from .routes import main
-from app.utils.constants import SECRET_KEY, MAX_FILE_SIZE_BYTES
+from app.services.directory_service import DirectoryService
+from app.services.janitor_service import JanitorService
+from app.services.merge_service import MergeService
+from app.services.session_service import SessionService
+from app.utils.constants import SECRET_KEY, MAX_FILE_SIZE_BYTES, JANITOR_ENABLED, PRELOAD_MODULES
+from app.utils.readers import available_engines, get_engine
 
 
-def create_app() -> Flask:
+def create_app(start_janitor: bool = JANITOR_ENABLED) -> Flask:
     app: Flask = Flask(__name__)
     app.config['SECRET_KEY'] = SECRET_KEY
     app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE_BYTES
+    app.session_interface = SessionService()
 
     app.register_blueprint(main)
 
-    return app
\ No newline at end of file
+    DirectoryService.ensure_upload_dirs()
+    if start_janitor:
+        JanitorService.start()
+
+    return app
+
+
+def warm(app: Flask) -> None:
+    """Do once what each worker would otherwise do on its first requests, before a prefork server forks.
+
+    Modules only imported when first used are imported, reader engines looked
+    up, templates compiled and a tiny batch merged (filling pandas' and Arrow's
+    own lazy imports), so workers forked afterwards share all of it with the
+    master instead of each building a copy.
+    """
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    for name in available_engines():
+        engine = get_engine(name)
+        if engine.module:
+            importlib.import_module(engine.module)
+    for template in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template)
+    MergeService.warm()
\ No newline at end of file
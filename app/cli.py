@@ -0,0 +1,203 @@
+"""Validate and merge workbooks against a guideline in batch, without the web server.
+
+    python -m app.cli guideline.csv exports/ --output-dir merged
+    python -m app.cli guideline.csv 'exports/**/*.xlsx' --format parquet --workers 8
+
+Inputs are directories (their workbooks, not recursing) or glob patterns. Each
+workbook is validated as an upload is (every sheet's headers, then the values
+of the best matching sheet) and that sheet is merged to the output directory,
+with mappings saved from the results page applied. Workbooks are processed by a
+pool of worker processes. The header comparisons, outputs and errors go to a
+JSON manifest, and throughput is reported at the end; the exit status is 1 if
+any workbook failed.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from app.services.directory_service import DirectoryService
+from app.services.file_service import FileService
+from app.services.guideline_service import GuidelineService
+from app.services.merge_service import MergeService
+from app.services.validation_service import validate_file
+from app.utils.constants import (
+    MERGE_ENGINE, MERGE_ENGINE_PANDAS, MERGE_ENGINE_ARROW, OUTPUT_FORMAT_CSV, OUTPUT_CONTENT_TYPES,
+    UPLOAD_WORKERS, CLI_MANIFEST_FILENAME, CLI_OUTPUT_DIR
+)
+
+# (guideline path, input path, output path or None to validate only, output format, merge engine)
+Task = Tuple[str, str, Optional[str], str, str]
+
+
+def find_inputs(patterns: List[str]) -> List[str]:
+    """Workbooks named by directories and glob patterns, each once, in sorted order per pattern."""
+    found: List[str] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            paths = glob.glob(pattern, recursive=True)
+        found.extend(
+            path for path in sorted(paths) if os.path.isfile(path) and FileService.allowed_input_file(path)
+        )
+    return list(dict.fromkeys(os.path.abspath(path) for path in found))
+
+
+def output_paths(inputs: List[str], output_dir: str, output_format: str) -> List[str]:
+    """One output per input, named after it; inputs sharing a name get numbered outputs."""
+    names: List[str] = MergeService.unique_names([
+        f'{os.path.splitext(os.path.basename(path))[0]}.{output_format}' for path in inputs
+    ])
+    return [os.path.join(output_dir, name) for name in names]
+
+
+def process_file(task: Task) -> Dict:
+    """Validate one workbook and merge its best matching sheet (runs in a worker process).
+
+    The workbook is staged in the upload store, as an upload would be, so its
+    parse is cached there rather than next to the input, and removed afterwards.
+    Errors are reported in the returned entry instead of being raised.
+    """
+    guideline_path, input_path, output_path, output_format, engine = task
+    entry: Dict = {'file': input_path, 'output': output_path, 'bytes': os.path.getsize(input_path), 'rows': 0}
+    start: float = time.perf_counter()
+    staged_path: Optional[str] = None
+    try:
+        with open(input_path, 'rb') as f:
+            staged_path, _ = FileService.save_input_file(
+                FileStorage(f, filename=secure_filename(os.path.basename(input_path)))
+            )
+        entry.update(validate_file(guideline_path, staged_path))
+        if output_path:
+            entry['rows'] = _write_output(
+                output_path, guideline_path, staged_path, output_format, engine, entry['sheet']
+            )
+    except Exception as e:
+        entry.update(error=str(e), output=None)
+    finally:
+        FileService.cleanup_file(staged_path)
+    entry['seconds'] = round(time.perf_counter() - start, 4)
+    return entry
+
+
+def _write_output(
+    output_path: str,
+    guideline_path: str,
+    input_path: str,
+    output_format: str,
+    engine: str,
+    sheet_index: int
+) -> int:
+    """Merge to output_path, which only appears once complete; returns the number of rows written."""
+    rows: List[int] = [0]
+
+    def count(batch_rows: int) -> None:
+        rows[0] += batch_rows
+
+    chunks: Iterator[str | bytes] = MergeService.iter_output(
+        guideline_path, input_path, output_format, engine=engine, on_rows=count, sheet_index=sheet_index
+    )
+    temp_path: str = f'{output_path}.partial'
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return rows[0]
+
+
+def run(tasks: List[Task], workers: int) -> Iterator[Dict]:
+    """Process the tasks, yielding each entry as soon as its workbook is done."""
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(process_file, tasks)
+        return
+    with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+        yield from pool.imap_unordered(process_file, tasks)
+
+
+def summarize(entries: List[Dict], seconds: float) -> Dict:
+    """Totals and throughput of a run."""
+    rows: int = sum(entry['rows'] for entry in entries)
+    megabytes: float = sum(entry['bytes'] for entry in entries) / 1024 / 1024
+    return {
+        'files': len(entries),
+        'failed': sum(1 for entry in entries if 'error' in entry),
+        'rows': rows,
+        'input_mb': round(megabytes, 2),
+        'seconds': round(seconds, 3),
+        'files_per_second': round(len(entries) / seconds, 2) if seconds else None,
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        'mb_per_second': round(megabytes / seconds, 2) if seconds else None
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('guideline', help='guideline CSV')
+    parser.add_argument('inputs', nargs='+', help='directories or glob patterns of workbooks')
+    parser.add_argument('--output-dir', default=CLI_OUTPUT_DIR, help='where merged outputs are written')
+    parser.add_argument('--format', default=OUTPUT_FORMAT_CSV, choices=list(OUTPUT_CONTENT_TYPES))
+    parser.add_argument('--engine', default=MERGE_ENGINE, choices=[MERGE_ENGINE_PANDAS, MERGE_ENGINE_ARROW])
+    parser.add_argument('--workers', type=int, default=UPLOAD_WORKERS, help='worker processes')
+    parser.add_argument('--manifest', help=f'manifest path (default: {CLI_MANIFEST_FILENAME} in the output directory)')
+    parser.add_argument('--validate-only', action='store_true', help='compare headers and values without merging')
+    args = parser.parse_args(argv)
+
+    guideline_path: str = os.path.abspath(args.guideline)
+    try:
+        GuidelineService.load(guideline_path)
+    except (OSError, ValueError) as e:
+        print(f"Invalid guideline {args.guideline}: {str(e)}", file=sys.stderr)
+        return 2
+    inputs: List[str] = find_inputs(args.inputs)
+    if not inputs:
+        print("No workbooks found", file=sys.stderr)
+        return 2
+
+    DirectoryService.ensure_upload_dirs()
+    os.makedirs(args.output_dir, exist_ok=True)
+    outputs: List[Optional[str]] = (
+        [None] * len(inputs) if args.validate_only else output_paths(inputs, args.output_dir, args.format)
+    )
+    tasks: List[Task] = [
+        (guideline_path, input_path, output_path, args.format, args.engine)
+        for input_path, output_path in zip(inputs, outputs)
+    ]
+
+    entries: List[Dict] = []
+    start: float = time.perf_counter()
+    for entry in run(tasks, args.workers):
+        entries.append(entry)
+        status: str = f"failed: {entry['error']}" if 'error' in entry else f"{entry['rows']} rows"
+        print(f"[{len(entries)}/{len(tasks)}] {entry['file']}: {status} in {entry['seconds']:.2f}s")
+    summary: Dict = summarize(entries, time.perf_counter() - start)
+
+    # Manifest entries in input order, whichever worker finished first
+    order: Dict[str, int] = {input_path: index for index, input_path in enumerate(inputs)}
+    entries.sort(key=lambda entry: order[entry['file']])
+    manifest_path: str = args.manifest or os.path.join(args.output_dir, CLI_MANIFEST_FILENAME)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'guideline': guideline_path, 'format': args.format, 'summary': summary, 'files': entries}, f, indent=2)
+
+    print(
+        f"{summary['files']} files ({summary['failed']} failed), {summary['rows']} rows, "
+        f"{summary['input_mb']:.1f} MB in {summary['seconds']:.1f}s: {summary['files_per_second']} files/s, "
+        f"{summary['rows_per_second']} rows/s, {summary['mb_per_second']} MB/s"
+    )
+    print(f"Manifest written to {manifest_path}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,117 +1,579 @@
 import os
-from typing import Dict
+import time
+from functools import partial, wraps
+from typing import Dict, List, Iterator, Tuple
 
-from flask import Blueprint, render_template, request, flash, make_response, session, Response
-from pandas import DataFrame
+from flask import Blueprint, render_template, request, flash, session, Response, jsonify, url_for, g, make_response
 from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import BadRequest
 from werkzeug.utils import secure_filename
 
 from app.services.file_service import FileService
 from app.services.merge_service import MergeService
-from app.services.directory_service import DirectoryService
+from app.services.guideline_service import Guideline, GuidelineService
+from app.services.validation_service import ValidationService
+from app.services.janitor_service import JanitorService
+from app.services.job_service import JobService
+from app.services.metrics_service import MetricsService
+from app.services.profiling_service import ProfileCapture, ProfilingService
+from app.services.session_service import SessionService
+from app.services.upload_service import OffsetMismatch, UploadService
 from app.utils.constants import (
     ERROR, MSG_MISSING_FILES, MSG_INVALID_GUIDELINE,
-    MSG_SESSION_EXPIRED, MSG_FILE_NOT_FOUND, CSV_CONTENT_TYPE,
-    INPUT_FILE, GUIDELINE_FILE, SESSION_GUIDELINE_PATH,
-    SESSION_SAVED_PATH, UPLOAD_TEMPLATE, RESULTS_TEMPLATE
+    MSG_SESSION_EXPIRED, MSG_FILE_NOT_FOUND, MSG_SHEET_NOT_FOUND, CSV_CONTENT_TYPE,
+    INPUT_FILE, GUIDELINE_FILE, SESSION_GUIDELINE_PATH, SESSION_CREATED, SESSION_REFRESH_SECONDS,
+    UPLOAD_TEMPLATE, RESULTS_TEMPLATE, ZIP_CONTENT_TYPE,
+    MSG_INVALID_FORMAT, MERGE_ALL_FORMAT_ZIP, MERGE_ALL_FORMAT_CSV, MERGE_ALL_FILENAME,
+    MSG_ERROR, MSG_JOB_NOT_FOUND, MSG_JOB_NOT_FINISHED, JOB_KIND_UPLOAD, JOB_KIND_MERGE,
+    JOB_STATUS_DONE, JOB_STATUS_FAILED, JOB_READ_CHUNK_BYTES, UPLOAD_IDS, UPLOAD_OFFSET_HEADER,
+    METRICS_CONTENT_TYPE, SERVER_TIMING_HEADER, PROFILING_TOKEN_HEADER, PROFILE_ID_HEADER,
+    OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_CSV_GZ, OUTPUT_CONTENT_TYPES, VALUE_CHECKS
 )
+from app.utils.streaming import iter_gzip
 
 main: Blueprint = Blueprint('main', __name__)
 
+@main.before_request
+def touch_session_files() -> None:
+    """Keep the files of an active session from being expired by the janitor."""
+    guideline_path: str | None = session.get(SESSION_GUIDELINE_PATH)
+    # Touched when the session itself is marked as used, not on every request
+    if guideline_path and time.time() - (session.updated or 0) > SESSION_REFRESH_SECONDS:
+        JanitorService.touch([guideline_path] + [saved['path'] for saved in SessionService.list_files(session.sid)])
+
+@main.before_request
+def start_request_timing() -> None:
+    g.request_start = time.perf_counter()
+    MetricsService.begin_request()
+
+@main.after_request
+def add_server_timing(response: Response) -> Response:
+    """Report the request's stage timings; its latency is recorded once the body has been sent."""
+    start: float = g.get('request_start', time.perf_counter())
+    response.headers[SERVER_TIMING_HEADER] = MetricsService.server_timing(
+        MetricsService.request_stages(), time.perf_counter() - start
+    )
+    endpoint: str = request.endpoint or 'unknown'
+    response.call_on_close(
+        lambda: MetricsService.observe('request_seconds', time.perf_counter() - start, endpoint=endpoint)
+    )
+    return response
+
+@main.route('/metrics', methods=['GET'])
+def metrics() -> Response:
+    """Latency histograms, rows and bytes processed and cache lookups, in the Prometheus text format."""
+    return Response(MetricsService.render(), content_type=METRICS_CONTENT_TYPE)
+
+def profiled(view):
+    """Profile the view (and the streaming of its response) when the request asks with the admin token."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        capture: ProfileCapture | None = ProfilingService.begin(
+            view.__name__, request.headers.get(PROFILING_TOKEN_HEADER)
+        )
+        if capture is None:
+            return view(*args, **kwargs)
+
+        try:
+            response: Response = make_response(view(*args, **kwargs))
+        except Exception:
+            capture.finish()
+            raise
+        if response.is_streamed:
+            response.response = capture.wrap(response.response)
+            response.call_on_close(capture.finish)
+        else:
+            capture.finish()
+        response.headers[PROFILE_ID_HEADER] = capture.profile_id
+        return response
+
+    return wrapper
+
 @main.route('/', methods=['GET', 'POST'])
+@profiled
 def upload_file() -> str:
-    DirectoryService.ensure_upload_dirs()
-
     if request.method == 'POST':
-        if GUIDELINE_FILE not in request.files or INPUT_FILE not in request.files:
-            flash(MSG_MISSING_FILES, ERROR)
+        try:
+            guideline_path, pending, errors = _save_uploads()
+        except BadRequest as e:
+            flash(e.description, ERROR)
             return render_template(UPLOAD_TEMPLATE)
 
-        guideline_file: FileStorage = request.files[GUIDELINE_FILE]
-        input_files: list[FileStorage] = request.files.getlist(INPUT_FILE)
+        # Header reads and comparisons run in worker processes; results come back in upload order
+        with MetricsService.stage('validate'):
+            comparisons: List[Dict | Exception] = ValidationService.validate_files(
+                guideline_path, [path for _, path, _ in pending]
+            )
+        results, saved_files, validation_errors = _collect_results(pending, comparisons)
 
-        if guideline_file.filename == '' or not FileService.allowed_guideline_file(guideline_file.filename):
-            flash(MSG_INVALID_GUIDELINE, ERROR)
-            return render_template(UPLOAD_TEMPLATE)
+        for error in errors + validation_errors:
+            flash(error, ERROR)
+
+        _store_session(guideline_path, saved_files)
+        return render_template(RESULTS_TEMPLATE, results=results)
+
+    return render_template(UPLOAD_TEMPLATE)
+
+def _save_uploads() -> Tuple[str, List[Tuple[str, str, str]], List[str]]:
+    """Save the posted guideline and input files.
+
+    Returns the guideline path, (original name, path, file id) for each saved input
+    file, and error messages for input files that could not be saved. Raises
+    BadRequest when files are missing or the guideline is invalid.
+    """
+    # Input files are posted with the form, or uploaded beforehand in chunks and referenced by upload id
+    upload_ids: List[str] = request.form.getlist(UPLOAD_IDS)
+    if GUIDELINE_FILE not in request.files or (INPUT_FILE not in request.files and not upload_ids):
+        raise BadRequest(MSG_MISSING_FILES)
+
+    guideline_file: FileStorage = request.files[GUIDELINE_FILE]
+    input_files: list[FileStorage] = request.files.getlist(INPUT_FILE)
+
+    if guideline_file.filename == '' or not FileService.allowed_guideline_file(guideline_file.filename):
+        raise BadRequest(MSG_INVALID_GUIDELINE)
+
+    guideline_path = None
+    try:
+        guideline_path, session_id = FileService.save_guideline_file(guideline_file)
+        GuidelineService.load(guideline_path)
+    except Exception as e:
+        print(f"Error processing guideline file: {str(e)}")  # Debug print
+        FileService.cleanup_file(guideline_path)
+        raise BadRequest(MSG_INVALID_GUIDELINE)
+
+    pending: list = []
+    errors: List[str] = []
+
+    for file in input_files:
+        if file and FileService.allowed_input_file(file.filename):
+            filepath = None
+            try:
+                filepath, file_id = FileService.save_input_file(file)
+                pending.append((file.filename, filepath, file_id))
+            except Exception as e:
+                errors.append(f'Error processing {file.filename}: {str(e)}')
+                FileService.cleanup_file(filepath)
 
+    for upload_id in upload_ids:
         try:
-            guideline_path, session_id = FileService.save_guideline_file(guideline_file)
-            guideline_df: DataFrame = FileService.process_guideline_file(guideline_path)
+            filename, filepath = UploadService.claim(upload_id)
+            pending.append((filename, filepath, upload_id))
         except Exception as e:
-            print(f"Error processing guideline file: {str(e)}")  # Debug print
-            FileService.cleanup_file(guideline_path)
-            flash(MSG_INVALID_GUIDELINE, ERROR)
-            return render_template(UPLOAD_TEMPLATE)
+            errors.append(f'Error processing upload {upload_id}: {str(e)}')
 
-        results: list = []
-        saved_files: list = []
-
-        for file in input_files:
-            if file and FileService.allowed_input_file(file.filename):
-                try:
-                    filepath, file_id = FileService.save_input_file(file)
-                    input_df: DataFrame = FileService.process_input_file(filepath)
-
-                    header_comparison: Dict = MergeService.compare_headers(guideline_df, input_df)
-
-                    results.append({
-                        'filename': file.filename,
-                        'file_id': file_id,
-                        'missing_headers': header_comparison.get('missing_headers', []),
-                        'extra_headers': header_comparison.get('extra_headers', []),
-                        'matched_headers': header_comparison.get('matched_headers', [])
-                    })
-
-                    saved_files.append({
-                        'id': file_id,
-                        'path': filepath,
-                        'original_name': file.filename
-                    })
-                except Exception as e:
-                    flash(f'Error processing {file.filename}: {str(e)}', ERROR)
-                    FileService.cleanup_file(filepath)
-
-        session[SESSION_GUIDELINE_PATH] = guideline_path
-        session[SESSION_SAVED_PATH] = saved_files
-        return render_template(RESULTS_TEMPLATE, results=results)
+    return guideline_path, pending, errors
 
-    return render_template(UPLOAD_TEMPLATE)
+def _collect_results(
+    pending: List[Tuple[str, str, str]],
+    comparisons: List[Dict | Exception]
+) -> Tuple[list, list, List[str]]:
+    """Split header comparisons into results to render, files kept for merging, and error messages."""
+    results: list = []
+    saved_files: list = []
+    errors: List[str] = []
+
+    for (filename, filepath, file_id), header_comparison in zip(pending, comparisons):
+        if isinstance(header_comparison, Exception):
+            errors.append(f'Error processing {filename}: {str(header_comparison)}')
+            FileService.cleanup_file(filepath)
+            continue
+
+        results.append({
+            'filename': filename,
+            'file_id': file_id,
+            'missing_headers': header_comparison.get('missing_headers', []),
+            'extra_headers': header_comparison.get('extra_headers', []),
+            'matched_headers': header_comparison.get('matched_headers', []),
+            'sheet': header_comparison.get('sheet', 0),
+            'sheets': header_comparison.get('sheets', []),
+            'value_checks': header_comparison.get(VALUE_CHECKS)
+        })
+
+        saved_files.append({
+            'id': file_id,
+            'path': filepath,
+            'original_name': filename,
+            'sheet': header_comparison.get('sheet', 0),
+            'sheets': [sheet['name'] for sheet in header_comparison.get('sheets', [])]
+        })
+
+    return results, saved_files, errors
+
+def _store_session(guideline_path: str, saved_files: List[Dict]) -> None:
+    session[SESSION_GUIDELINE_PATH] = guideline_path
+    SessionService.set_files(session.sid, saved_files)
+
+def _saved_file(file_id: str) -> Dict:
+    """A file saved in the session, by id."""
+    if SESSION_GUIDELINE_PATH not in session:
+        raise BadRequest(MSG_SESSION_EXPIRED)
+    saved: Dict | None = SessionService.get_file(session.sid, file_id)
+    if saved is None:
+        raise BadRequest(MSG_FILE_NOT_FOUND)
+    return saved
 
 @main.route('/merge_and_download/<file_id>', methods=['GET', 'POST'])
+@profiled
 def merge_and_download(file_id) -> Response | tuple[str, int]:
     try:
-        if SESSION_GUIDELINE_PATH not in session or SESSION_SAVED_PATH not in session:
-            raise BadRequest(MSG_SESSION_EXPIRED)
+        input_file: Dict = _saved_file(file_id)
+
+        # Get custom mappings from request if this is a POST
+        payload: Dict = request.json if request.method == 'POST' else {}
+        custom_mappings = payload.get('mappings', {}) if request.method == 'POST' else None
+
+        output_format: str = payload.get('format') or request.args.get('format', OUTPUT_FORMAT_CSV)
+        if output_format not in OUTPUT_CONTENT_TYPES:
+            raise BadRequest(MSG_INVALID_FORMAT)
 
-        input_file = next(
-            (f for f in session[SESSION_SAVED_PATH] if f['id'] == file_id),
-            None
+        # A sheet by name (the one picked at validation by default), or several merged into one CSV
+        sheet_names: List[str] = payload.get('sheets') or request.args.getlist('sheets')
+        if len(sheet_names) > 1:
+            if output_format not in (OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_CSV_GZ):
+                raise BadRequest(MSG_INVALID_FORMAT)
+            merged_chunks: Iterator[str | bytes] = MergeService.iter_merge_all(
+                session[SESSION_GUIDELINE_PATH],
+                [
+                    (f'{input_file["original_name"]}/{name}', input_file['path'], custom_mappings,
+                     _sheet_index(input_file, name))
+                    for name in sheet_names
+                ],
+                concatenate=True
+            )
+            if output_format == OUTPUT_FORMAT_CSV_GZ:
+                merged_chunks = iter_gzip(merged_chunks)
+        else:
+            sheet_name: str | None = (
+                sheet_names[0] if sheet_names else payload.get('sheet') or request.args.get('sheet')
+            )
+            merged_chunks = MergeService.iter_output(
+                session[SESSION_GUIDELINE_PATH],
+                input_file['path'],
+                output_format,
+                custom_mappings=custom_mappings,
+                sheet_index=_sheet_index(input_file, sheet_name)
+            )
+
+        original_name = os.path.splitext(input_file["original_name"])[0]
+        safe_filename: str = secure_filename(f"{original_name}")
+
+        # Plain CSV is still compressed on the wire for clients that accept gzip
+        content_encoding: str | None = None
+        if output_format == OUTPUT_FORMAT_CSV and request.accept_encodings['gzip']:
+            merged_chunks = iter_gzip(merged_chunks)
+            content_encoding = 'gzip'
+
+        # Stream the output batch by batch instead of building it in memory
+        return _download_response(
+            merged_chunks,
+            OUTPUT_CONTENT_TYPES[output_format],
+            f'{safe_filename}.{output_format}',
+            content_encoding=content_encoding
         )
 
-        if not input_file:
-            raise BadRequest(MSG_FILE_NOT_FOUND)
+    except Exception as e:
+        return str(e), 400
+
+@main.route('/merge_all', methods=['GET', 'POST'])
+def merge_all() -> Response | tuple[str, int]:
+    """Merge every file of the session into a ZIP of CSVs, or one CSV with a source file column."""
+    try:
+        if SESSION_GUIDELINE_PATH not in session:
+            raise BadRequest(MSG_SESSION_EXPIRED)
 
-        # Get custom mappings from request if this is a POST
-        custom_mappings = request.json.get('mappings', {}) if request.method == 'POST' else None
+        payload: Dict = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        inputs, output_format = _merge_all_inputs(payload)
 
-        merged_content: str = MergeService.merge_files(
+        concatenate: bool = output_format == MERGE_ALL_FORMAT_CSV
+        merged_chunks: Iterator[str | bytes] = MergeService.iter_merge_all(
             session[SESSION_GUIDELINE_PATH],
-            input_file['path'],
-            custom_mappings=custom_mappings
+            inputs,
+            concatenate=concatenate
         )
 
-        original_name = os.path.splitext(input_file["original_name"])[0]
-        safe_filename: str = secure_filename(f"{original_name}")
+        return _download_response(
+            merged_chunks,
+            CSV_CONTENT_TYPE if concatenate else ZIP_CONTENT_TYPE,
+            f'{MERGE_ALL_FILENAME}.{output_format}'
+        )
+
+    except Exception as e:
+        return str(e), 400
 
-        response: Response = make_response(merged_content)
-        response.headers['Content-Disposition'] = f'attachment; filename={safe_filename}.csv'
-        response.headers['Content-Type'] = CSV_CONTENT_TYPE
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+@main.route('/saved_mappings/<file_id>', methods=['POST'])
+def remove_saved_mappings(file_id) -> tuple[Response, int]:
+    """Remove mappings saved for the layout of a file's sheet: {"sheet": optional name, "remove": [input headers]}.
 
-        return response
+    Returns the sheet's header comparison and saved mappings without them.
+    """
+    try:
+        input_file: Dict = _saved_file(file_id)
+        payload: Dict = request.get_json(silent=True) or {}
+        sheet_index: int = _sheet_index(input_file, payload.get('sheet'))
+        guideline: Guideline = GuidelineService.load(session[SESSION_GUIDELINE_PATH])
+        input_headers: List[str] = FileService.read_input_headers(input_file['path'], sheet_index)
+        saved: Dict[str, str] = MergeService.merge_plan(
+            guideline, input_headers, removed=payload.get('remove', [])
+        ).custom_mappings
+        return jsonify({**MergeService.compare_headers(guideline, input_headers, saved), 'saved_mappings': saved}), 200
+    except (BadRequest, ValueError) as e:
+        return jsonify({'error': e.description if isinstance(e, BadRequest) else str(e)}), 400
+
+@main.route('/uploads', methods=['POST'])
+def create_upload() -> tuple[Response, int]:
+    """Start a resumable upload of an input file: {"filename": ..., "size": optional total bytes}."""
+    payload: Dict = request.get_json(silent=True) or {}
+    try:
+        upload: Dict = UploadService.create(payload.get('filename', ''), payload.get('size'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    upload['url'] = url_for('main.upload_chunk', upload_id=upload['upload_id'])
+    return jsonify(upload), 201
+
+@main.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id) -> tuple[Response, int]:
+    """Current offset of an upload: where the next chunk, or a resumed one, must start."""
+    try:
+        return jsonify(UploadService.status(upload_id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+@main.route('/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id) -> tuple[Response, int]:
+    """Append the raw request body at the Upload-Offset header's offset."""
+    try:
+        offset: int = int(request.headers[UPLOAD_OFFSET_HEADER])
+    except (KeyError, ValueError):
+        return jsonify({'error': f'{UPLOAD_OFFSET_HEADER} header required'}), 400
+
+    try:
+        new_offset: int = UploadService.append(upload_id, offset, request.stream)
+    except OffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response: Response = jsonify({'upload_id': upload_id, 'offset': new_offset})
+    response.headers[UPLOAD_OFFSET_HEADER] = str(new_offset)
+    return response, 200
+
+@main.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id) -> tuple[Response, int]:
+    """Finish an upload, optionally verifying {"sha256": ...}; its id can then be posted as upload_ids."""
+    payload: Dict = request.get_json(silent=True) or {}
+    try:
+        return jsonify(UploadService.complete(upload_id, payload.get('sha256'))), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def _sheet_index(saved: Dict, sheet_name: str | None) -> int:
+    """Index of a saved file's sheet by name; without a name, the sheet picked at validation."""
+    if sheet_name is None:
+        return saved.get('sheet', 0)
+    if sheet_name not in saved.get('sheets', []):
+        raise BadRequest(MSG_SHEET_NOT_FOUND)
+    return saved['sheets'].index(sheet_name)
+
+def _merge_all_inputs(payload: Dict) -> Tuple[list, str]:
+    """The session's files as (original name, path, custom mappings, sheet index), and the requested output format."""
+    output_format: str = payload.get('format') or request.args.get('format', MERGE_ALL_FORMAT_ZIP)
+    if output_format not in (MERGE_ALL_FORMAT_ZIP, MERGE_ALL_FORMAT_CSV):
+        raise BadRequest(MSG_INVALID_FORMAT)
+
+    # Custom mappings and sheet names per file id
+    mappings: Dict[str, Dict[str, str]] = payload.get('mappings', {})
+    sheets: Dict[str, str] = payload.get('sheets', {})
+    inputs: list = [
+        (saved['original_name'], saved['path'], mappings.get(saved['id']), _sheet_index(saved, sheets.get(saved['id'])))
+        for saved in SessionService.list_files(session.sid)
+    ]
+    if not inputs:
+        raise BadRequest(MSG_FILE_NOT_FOUND)
+
+    return inputs, output_format
+
+@main.route('/jobs/upload', methods=['POST'])
+def submit_upload_job() -> tuple[Response, int]:
+    """Save the uploaded files and validate them in the background; poll the returned job for progress."""
+    try:
+        guideline_path, pending, errors = _save_uploads()
+    except BadRequest as e:
+        return jsonify({'error': e.description}), 400
+
+    # Only the submitting session may fetch the results; a new visitor's session must outlive this request
+    session.setdefault(SESSION_CREATED, time.time())
+    job_id: str = JobService.submit(
+        JOB_KIND_UPLOAD,
+        [filename for filename, _, _ in pending],
+        partial(_run_upload_job, guideline_path=guideline_path, pending=pending, errors=errors),
+        session.sid
+    )
+    return _job_accepted(job_id)
+
+def _run_upload_job(job_id: str, guideline_path: str, pending: list, errors: List[str]) -> Dict:
+    def on_result(index: int, result: Dict | Exception) -> None:
+        failed: bool = isinstance(result, Exception)
+        JobService.update_file(
+            job_id, index,
+            status=JOB_STATUS_FAILED if failed else JOB_STATUS_DONE,
+            error=str(result) if failed else None
+        )
+
+    comparisons: List[Dict | Exception] = ValidationService.validate_files(
+        guideline_path, [path for _, path, _ in pending], on_result=on_result
+    )
+    results, saved_files, validation_errors = _collect_results(pending, comparisons)
+
+    return {
+        'guideline_path': guideline_path,
+        'results': results,
+        'saved_files': saved_files,
+        'errors': errors + validation_errors
+    }
+
+@main.route('/jobs/merge', methods=['POST'])
+def submit_merge_job() -> tuple[Response, int] | tuple[str, int]:
+    """Merge one file of the session (file_id), or all of them, to a file fetched from the job's result."""
+    try:
+        if SESSION_GUIDELINE_PATH not in session:
+            raise BadRequest(MSG_SESSION_EXPIRED)
+
+        payload: Dict = request.get_json(silent=True) or {}
+        file_id: str | None = payload.get('file_id')
+
+        if file_id:
+            input_file: Dict = _saved_file(file_id)
+            inputs: list = [(
+                input_file['original_name'], input_file['path'], payload.get('mappings'),
+                _sheet_index(input_file, payload.get('sheet'))
+            )]
+            output_format: str = payload.get('format', OUTPUT_FORMAT_CSV)
+            if output_format not in OUTPUT_CONTENT_TYPES:
+                raise BadRequest(MSG_INVALID_FORMAT)
+            filename: str = f'{secure_filename(os.path.splitext(input_file["original_name"])[0])}.{output_format}'
+        else:
+            inputs, output_format = _merge_all_inputs(payload)
+            filename = f'{MERGE_ALL_FILENAME}.{output_format}'
+
+        job_id: str = JobService.submit(
+            JOB_KIND_MERGE,
+            [name for name, _, _, _ in inputs],
+            partial(
+                _run_merge_job,
+                guideline_path=session[SESSION_GUIDELINE_PATH],
+                inputs=inputs,
+                single=bool(file_id),
+                output_format=output_format,
+                filename=filename
+            ),
+            session.sid
+        )
+        return _job_accepted(job_id)
 
     except Exception as e:
-        return str(e), 400
\ No newline at end of file
+        return str(e), 400
+
+def _run_merge_job(
+    job_id: str,
+    guideline_path: str,
+    inputs: list,
+    single: bool,
+    output_format: str,
+    filename: str
+) -> Dict:
+    if single:
+        _, input_path, custom_mappings, sheet_index = inputs[0]
+        chunks: Iterator[str | bytes] = MergeService.iter_output(
+            guideline_path,
+            input_path,
+            output_format,
+            custom_mappings=custom_mappings,
+            on_rows=lambda rows: JobService.update_file(job_id, 0, add_rows=rows),
+            sheet_index=sheet_index
+        )
+    else:
+        chunks = MergeService.iter_merge_all(
+            guideline_path,
+            inputs,
+            concatenate=output_format == MERGE_ALL_FORMAT_CSV,
+            on_rows=lambda index, rows: JobService.update_file(job_id, index, add_rows=rows)
+        )
+
+    result_path: str = JobService.result_path(job_id, output_format)
+    with open(result_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+    return {
+        'path': result_path,
+        'filename': filename,
+        'content_type': OUTPUT_CONTENT_TYPES.get(output_format, ZIP_CONTENT_TYPE)
+    }
+
+def _job_accepted(job_id: str) -> tuple[Response, int]:
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('main.job_status', job_id=job_id),
+        'result_url': url_for('main.job_result', job_id=job_id)
+    }), 202
+
+@main.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id) -> tuple[Response, int]:
+    """Job status with per-file progress (status, rows merged so far, error)."""
+    job: Dict | None = JobService.get(job_id, session.sid)
+    if job is None:
+        return jsonify({'error': MSG_JOB_NOT_FOUND}), 404
+
+    job.pop('result')
+    return jsonify(job), 200
+
+@main.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id) -> Response | str | tuple[str, int]:
+    """Results page of a finished upload job, or the output file of a finished merge job."""
+    job: Dict | None = JobService.get(job_id, session.sid)
+    if job is None:
+        return MSG_JOB_NOT_FOUND, 404
+    if job['status'] == JOB_STATUS_FAILED:
+        return job['error'] or MSG_ERROR, 400
+    if job['status'] != JOB_STATUS_DONE:
+        return MSG_JOB_NOT_FINISHED, 409
+
+    result: Dict = job['result']
+    if job['kind'] == JOB_KIND_UPLOAD:
+        for error in result['errors']:
+            flash(error, ERROR)
+        _store_session(result['guideline_path'], result['saved_files'])
+        return render_template(RESULTS_TEMPLATE, results=result['results'])
+
+    if not os.path.exists(result['path']):
+        return MSG_FILE_NOT_FOUND, 404
+    return _download_response(_iter_file(result['path']), result['content_type'], result['filename'])
+
+def _iter_file(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while chunk := f.read(JOB_READ_CHUNK_BYTES):
+            yield chunk
+
+def _counted_bytes(chunks: Iterator[str | bytes]) -> Iterator[bytes]:
+    for chunk in chunks:
+        data: bytes = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        MetricsService.inc('bytes_total', len(data), direction='out')
+        yield data
+
+def _download_response(
+    chunks: Iterator[str | bytes],
+    content_type: str,
+    filename: str,
+    content_encoding: str | None = None
+) -> Response:
+    response: Response = Response(_counted_bytes(chunks), content_type=content_type)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Expires'] = '0'
+
+    return response
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import threading
+import uuid
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from app.utils.constants import UPLOAD_FOLDER, BLOB_PREFIX, HASH_CHUNK_BYTES
+
+
+class BlobService:
+    """Content-addressed store for uploads: one blob per distinct file content.
+
+    A blob is saved as blob_<sha256><ext> in the upload folder, and every upload
+    of that content gets its usual path ({id}_{filename}) as a hard link to it.
+    Identical uploads therefore share one copy on disk and, since caches are
+    keyed by the blob, one parse. The blob's link count is its reference count:
+    removing an upload's path drops a reference, and release removes the blob
+    once no upload refers to it.
+    """
+    # (device, inode) -> blob path, for resolving an upload's path to its blob
+    _inodes: Dict[Tuple[int, int], str] = {}
+    _lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def save(stream: BinaryIO, path: str) -> str:
+        """Write the stream to path through the store, hashing it as it is written; returns the SHA-256."""
+        temp_path: str = BlobService._temp_path()
+        sha256 = hashlib.sha256()
+        try:
+            with open(temp_path, 'wb') as f:
+                while chunk := stream.read(HASH_CHUNK_BYTES):
+                    f.write(chunk)
+                    sha256.update(chunk)
+            digest: str = sha256.hexdigest()
+            BlobService.adopt(temp_path, digest, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return digest
+
+    @staticmethod
+    def adopt(source: str, digest: str, path: str) -> None:
+        """Make path refer to the blob for digest, creating the blob from source if it is new.
+
+        source is consumed unless it is path itself. Where hard links are not
+        supported the file is stored at path as is, without deduplication.
+        """
+        blob_path: str = BlobService.blob_path(digest, os.path.splitext(path)[1])
+        try:
+            try:
+                os.link(source, blob_path)
+            except FileExistsError:
+                pass
+            # A path adopted in place already is the blob when it created it; replacing a file
+            # with a link to itself would leave the temporary link behind
+            if source != path or not os.path.samefile(blob_path, path):
+                # Link under a temporary name first so path is replaced atomically (it may be source)
+                link_path: str = BlobService._temp_path()
+                os.link(blob_path, link_path)
+                os.replace(link_path, path)
+        except OSError as e:
+            print(f"Storing {path} without deduplication: {str(e)}")
+            if source != path:
+                os.replace(source, path)
+            return
+
+        BlobService._remember(blob_path)
+        if source != path and os.path.exists(source):
+            os.remove(source)
+
+    @staticmethod
+    def blob_path(digest: str, extension: str = '') -> str:
+        return os.path.join(UPLOAD_FOLDER, f"{BLOB_PREFIX}{digest}{extension.lower()}")
+
+    @staticmethod
+    def resolve(path: str) -> str:
+        """The blob backing an upload's path, or the path itself when it is not stored as a blob."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path
+        if stat.st_nlink < 2 or os.path.basename(path).startswith(BLOB_PREFIX):
+            return path
+
+        key: Tuple[int, int] = (stat.st_dev, stat.st_ino)
+        blob_path: Optional[str] = BlobService._lookup(key)
+        if blob_path is None:
+            BlobService._rescan()
+            blob_path = BlobService._lookup(key)
+        return blob_path or path
+
+    @staticmethod
+    def release(blob_path: str) -> bool:
+        """Remove a blob that no upload refers to any more; returns whether it was removed."""
+        if not os.path.basename(blob_path).startswith(BLOB_PREFIX):
+            return False
+        try:
+            if os.stat(blob_path).st_nlink > 1:
+                return False
+            os.remove(blob_path)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _lookup(key: Tuple[int, int]) -> Optional[str]:
+        blob_path: Optional[str] = BlobService._inodes.get(key)
+        if blob_path is None:
+            return None
+        try:
+            stat = os.stat(blob_path)
+        except OSError:
+            return None
+        return blob_path if (stat.st_dev, stat.st_ino) == key else None
+
+    @staticmethod
+    def _remember(blob_path: str) -> None:
+        stat = os.stat(blob_path)
+        with BlobService._lock:
+            BlobService._inodes[(stat.st_dev, stat.st_ino)] = blob_path
+
+    @staticmethod
+    def _rescan() -> None:
+        inodes: Dict[Tuple[int, int], str] = {}
+        for name in os.listdir(UPLOAD_FOLDER):
+            if name.startswith(BLOB_PREFIX) and not name.endswith('.tmp'):
+                try:
+                    stat = os.stat(os.path.join(UPLOAD_FOLDER, name))
+                except OSError:
+                    continue
+                inodes[(stat.st_dev, stat.st_ino)] = os.path.join(UPLOAD_FOLDER, name)
+        with BlobService._lock:
+            BlobService._inodes = inodes
+
+    @staticmethod
+    def _temp_path() -> str:
+        return os.path.join(UPLOAD_FOLDER, f".{uuid.uuid4().hex}.tmp")
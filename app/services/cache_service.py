@@ -0,0 +1,177 @@
+import glob
+import json
+import os
+import re
+import uuid
+from typing import Iterator, List, Optional
+
+import pyarrow as pa
+from pandas import DataFrame
+from app.services.blob_service import BlobService
+from app.utils.constants import (
+    UPLOAD_FOLDER, WORKBOOK_CACHE_EXTENSION, WORKBOOK_CACHE_MAX_BYTES, HEADERS_CACHE_EXTENSION, SHEET_CACHE_INFIX
+)
+
+_CACHE_EXTENSIONS: tuple = (WORKBOOK_CACHE_EXTENSION, HEADERS_CACHE_EXTENSION)
+_SHEET_SUFFIX = re.compile(re.escape(SHEET_CACHE_INFIX) + r'\d+$')
+
+
+class CacheService:
+    """Columnar (Arrow IPC) cache of parsed workbooks, stored next to each upload.
+
+    Cells are cached as strings (None for missing), which is the form the merge
+    writes them in, so a cached read merges exactly like a fresh parse. Caches
+    belong to the content-addressed blob behind an upload, so every upload of the
+    same file shares them. Each sheet has its own caches: the first sheet's are
+    named after the blob, other sheets' after the blob and the sheet index.
+    """
+
+    @staticmethod
+    def _base_path(input_path: str, sheet_index: int = 0) -> str:
+        blob_path: str = BlobService.resolve(input_path)
+        return blob_path if sheet_index == 0 else f"{blob_path}{SHEET_CACHE_INFIX}{sheet_index}"
+
+    @staticmethod
+    def cache_path(input_path: str, sheet_index: int = 0) -> str:
+        return f"{CacheService._base_path(input_path, sheet_index)}{WORKBOOK_CACHE_EXTENSION}"
+
+    @staticmethod
+    def headers_path(input_path: str, sheet_index: int = 0) -> str:
+        return f"{CacheService._base_path(input_path, sheet_index)}{HEADERS_CACHE_EXTENSION}"
+
+    @staticmethod
+    def owner_path(cache_path: str) -> str:
+        """The file a cache file belongs to."""
+        base: str = next(cache_path[:-len(ext)] for ext in _CACHE_EXTENSIONS if cache_path.endswith(ext))
+        return _SHEET_SUFFIX.sub('', base)
+
+    @staticmethod
+    def cache_files(input_path: str) -> List[str]:
+        """Every cache file of the blob behind input_path, for all sheets."""
+        blob_path: str = BlobService.resolve(input_path)
+        candidates: List[str] = [f"{blob_path}{ext}" for ext in _CACHE_EXTENSIONS] + [
+            path for path in glob.glob(f"{glob.escape(blob_path)}{SHEET_CACHE_INFIX}*")
+            if path.endswith(_CACHE_EXTENSIONS) and CacheService.owner_path(path) == blob_path
+        ]
+        return [path for path in candidates if os.path.exists(path)]
+
+    @staticmethod
+    def read_headers(input_path: str, sheet_index: int = 0) -> Optional[List[str]]:
+        """Return the header row read from an earlier upload of the same file, or None."""
+        try:
+            with open(CacheService.headers_path(input_path, sheet_index), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def write_headers(input_path: str, headers: List[str], sheet_index: int = 0) -> None:
+        headers_path: str = CacheService.headers_path(input_path, sheet_index)
+        temp_path: str = f"{headers_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(headers, f)
+        os.replace(temp_path, headers_path)
+
+    @staticmethod
+    def read_batches(input_path: str, sheet_index: int = 0) -> Optional[Iterator[DataFrame]]:
+        """Return the cached batches of a workbook sheet, or None when it has not been cached."""
+        record_batches = CacheService.read_record_batches(input_path, sheet_index)
+        if record_batches is None:
+            return None
+        return (record_batch.to_pandas() for record_batch in record_batches)
+
+    @staticmethod
+    def read_record_batches(input_path: str, sheet_index: int = 0) -> Optional[Iterator[pa.RecordBatch]]:
+        """Return the cached Arrow batches of a workbook sheet (zero-copy views of the memory map), or None."""
+        cache_path: str = CacheService.cache_path(input_path, sheet_index)
+        try:
+            source = pa.memory_map(cache_path, 'r')
+        except OSError:
+            return None
+
+        # The modification time doubles as the LRU clock
+        os.utime(cache_path)
+        return CacheService._iter_cached(source)
+
+    @staticmethod
+    def _iter_cached(source: pa.MemoryMappedFile) -> Iterator[pa.RecordBatch]:
+        with source:
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                yield reader.get_batch(index)
+
+    @staticmethod
+    def write_through(
+        input_path: str,
+        headers: List[str],
+        batches: Iterator[DataFrame],
+        sheet_index: int = 0
+    ) -> Iterator[DataFrame]:
+        """Pass batches through unchanged while writing them to the cache.
+
+        The cache file only appears once every batch has been written; an
+        interrupted read (error or client disconnect) leaves nothing behind.
+        """
+        cache_path: str = CacheService.cache_path(input_path, sheet_index)
+        temp_path: str = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+
+        completed: bool = False
+        try:
+            with pa.OSFile(temp_path, 'wb') as sink:
+                writer: Optional[pa.ipc.RecordBatchFileWriter] = None
+                for batch in batches:
+                    record_batch: pa.RecordBatch = CacheService.to_record_batch(batch)
+                    if writer is None:
+                        writer = pa.ipc.new_file(sink, record_batch.schema)
+                    writer.write_batch(record_batch)
+                    yield batch
+                if writer is None:
+                    writer = pa.ipc.new_file(sink, pa.schema([(header, pa.string()) for header in headers]))
+                writer.close()
+            completed = True
+        finally:
+            if completed:
+                os.replace(temp_path, cache_path)
+                CacheService.evict()
+            elif os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def to_record_batch(batch: DataFrame) -> pa.RecordBatch:
+        """Convert a batch of parsed cells to Arrow strings (None for missing), the cached form."""
+        arrays: List[pa.Array] = []
+        for position in range(batch.shape[1]):
+            values = batch.iloc[:, position]
+            strings = values.astype(str).where(values.notna(), None)
+            arrays.append(pa.array(strings, type=pa.string(), from_pandas=True))
+        return pa.RecordBatch.from_arrays(arrays, names=[str(column) for column in batch.columns])
+
+    @staticmethod
+    def evict(max_bytes: int = WORKBOOK_CACHE_MAX_BYTES) -> None:
+        """Delete least recently used cache files until the cache fits in max_bytes."""
+        if not os.path.exists(UPLOAD_FOLDER):
+            return
+
+        entries: List = []
+        for entry in os.scandir(UPLOAD_FOLDER):
+            if entry.is_file() and entry.name.endswith(WORKBOOK_CACHE_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total: int = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    @staticmethod
+    def remove(input_path: str) -> None:
+        for cache_path in CacheService.cache_files(input_path):
+            try:
+                os.remove(cache_path)
+            except Exception:
+                pass
@@ -4,13 +4,13 @@ from app.utils.constants import UPLOAD_FOLDER, TEMP_FOLDER
 class DirectoryService:
     @staticmethod
     def ensure_upload_dirs() -> None:
-        """Ensure all required directories exist"""
+        """Ensure all required directories exist (checked once, at startup)"""
         for directory in [UPLOAD_FOLDER, TEMP_FOLDER]:
             os.makedirs(directory, exist_ok=True)
 
     @staticmethod
     def cleanup_temp_files() -> None:
-        """Clean up temporary files"""
+        """Delete every file in both folders, in use or not (a reset; JanitorService does routine cleanup)"""
         for directory in [UPLOAD_FOLDER, TEMP_FOLDER]:
             if os.path.exists(directory):
                 for file in os.listdir(directory):
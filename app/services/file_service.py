@@ -1,14 +1,22 @@
+import csv
 import os
 import uuid
-from typing import Tuple, List
+from typing import Dict, Tuple, List, Optional, Iterable, Iterator
 
 import pandas as pd
 from pandas import DataFrame
+from app.services.blob_service import BlobService
+from app.services.cache_service import CacheService
+from app.services.metrics_service import MetricsService
 from app.utils.constants import (
     UPLOAD_FOLDER, ALLOWED_INPUT_EXTENSIONS,
-    ALLOWED_GUIDELINE_EXTENSION, OPENPYXL_ENGINE,
-    XLRD_ENGINE, GUIDELINE_FILENAME, MSG_ENCRYPTED_FILE, MSG_ERROR
+    ALLOWED_GUIDELINE_EXTENSION, CONTAINER_OOXML, GUIDELINE_FILENAME, MSG_ERROR,
+    MSG_INVALID_GUIDELINE, GUIDELINE_ENCODING, MERGE_BATCH_ROWS, STREAMING_READ_MIN_BYTES, NA_VALUES,
+    COLUMN_TYPES, GUIDELINE_TYPE_DIRECTIVE, GUIDELINE_ALLOWED_DIRECTIVE, ALLOWED_VALUES_SEPARATOR
 )
+from app.utils.containers import sniff_container
+from app.utils.readers import ReaderEngine, engine_for
+from app.utils.xlsx import read_header_row, read_sheet_names
 
 
 class FileService:
@@ -24,56 +32,218 @@ class FileService:
     def save_guideline_file(file) -> Tuple[str, str]:
         session_id: str = str(uuid.uuid4())
         guideline_path: str = os.path.join(UPLOAD_FOLDER, f"{session_id}_{GUIDELINE_FILENAME}")
-        file.save(guideline_path)
+        FileService._save(file.stream, guideline_path)
         return guideline_path, session_id
 
     @staticmethod
     def save_input_file(file) -> Tuple[str, str]:
         file_id = str(uuid.uuid4())
         filepath: str = os.path.join(UPLOAD_FOLDER, f"{file_id}_{file.filename}")
-        file.save(filepath)
+        FileService._save(file.stream, filepath)
         return filepath, file_id
 
+    @staticmethod
+    def _save(stream, path: str) -> None:
+        with MetricsService.stage('save'):
+            BlobService.save(stream, path)
+        MetricsService.inc('bytes_total', os.path.getsize(path), direction='in')
+
     @staticmethod
     def process_guideline_file(filepath: str) -> DataFrame:
         return pd.read_csv(filepath, low_memory=False)
 
     @staticmethod
-    def process_input_file(filepath: str) -> DataFrame:
-        """
-        Process input Excel file with multiple engine attempts and better error handling
+    def read_guideline_headers(filepath: str) -> List[str]:
+        """Read only the header row of the guideline CSV."""
+        with open(filepath, newline='', encoding=GUIDELINE_ENCODING) as f:
+            # Skip leading blank lines the same way pd.read_csv does
+            header_row = next((row for row in csv.reader(f) if any(row)), None)
+
+        if header_row is None:
+            raise ValueError(MSG_INVALID_GUIDELINE)
+
+        return FileService._normalize_headers(header_row)
+
+    @staticmethod
+    def read_guideline_rules(filepath: str, headers: List[str]) -> Tuple[Dict[str, str], Dict[str, frozenset]]:
+        """Column types and allowed-value sets from the directive cells under the guideline header.
+
+        A cell "type: integer" types its column, "allowed: a|b" lists the values it
+        accepts; other cells are example values and ignored. Unknown types raise
+        ValueError(MSG_INVALID_GUIDELINE). headers are those read by read_guideline_headers.
         """
-        exceptions: List = []
+        column_types: Dict[str, str] = {}
+        allowed_values: Dict[str, frozenset] = {}
+
+        with open(filepath, newline='', encoding=GUIDELINE_ENCODING) as f:
+            rows: Iterator[List[str]] = (row for row in csv.reader(f) if any(row))
+            next(rows, None)
+            for row in rows:
+                for header, cell in zip(headers, row):
+                    directive: str = cell.strip()
+                    if directive.lower().startswith(GUIDELINE_TYPE_DIRECTIVE):
+                        column_type: str = directive[len(GUIDELINE_TYPE_DIRECTIVE):].strip().lower()
+                        if column_type not in COLUMN_TYPES:
+                            raise ValueError(MSG_INVALID_GUIDELINE)
+                        column_types[header] = column_type
+                    elif directive.lower().startswith(GUIDELINE_ALLOWED_DIRECTIVE):
+                        allowed_values[header] = frozenset(
+                            value.strip()
+                            for value in directive[len(GUIDELINE_ALLOWED_DIRECTIVE):].split(ALLOWED_VALUES_SEPARATOR)
+                            if value.strip()
+                        )
 
-        # Try openpyxl first (for .xlsx)
+        return column_types, allowed_values
+
+    @staticmethod
+    def list_sheets(filepath: str) -> List[str]:
+        """Sheet names of an input Excel file, in workbook order, from the workbook metadata only."""
+        container: str = sniff_container(filepath)
         try:
-            return pd.read_excel(filepath, engine=OPENPYXL_ENGINE)
+            if container == CONTAINER_OOXML:
+                return read_sheet_names(filepath)
+            engine: ReaderEngine = engine_for(filepath, container=container)
+            return engine.sheet_names(filepath)
+        except ValueError:
+            raise
         except Exception as e:
-            error_msg = str(e).lower()
-            if "not a zip file" in error_msg or "file is not a zip file" in error_msg:
-                raise ValueError(MSG_ENCRYPTED_FILE)
-            exceptions.append(f"openpyxl error: {str(e)}")
+            print(f"Excel reading error (sheet names): {str(e)}")  # Log technical details
+            raise ValueError(MSG_ERROR)
+
+    @staticmethod
+    def read_input_headers(filepath: str, sheet_index: int = 0) -> List[str]:
+        """
+        Read only the header row of a sheet of an input Excel file, without parsing any data rows.
+        Headers already read from an earlier upload of the same content are reused.
+        """
+        cached: Optional[List[str]] = CacheService.read_headers(filepath, sheet_index)
+        MetricsService.cache_lookup('headers', cached is not None)
+        if cached is not None:
+            return cached
+
+        with MetricsService.stage('parse'):
+            container: str = sniff_container(filepath)
+            header_row: Optional[List] = None
+            if container == CONTAINER_OOXML:
+                try:
+                    header_row = read_header_row(filepath, sheet_index)
+                except Exception:
+                    # A blank header row, which pandas names column by column, or a package
+                    # layout the XML reader does not follow
+                    header_row = None
+            if header_row is None:
+                header_row = list(FileService._read_excel(
+                    filepath, container=container, sheet_name=sheet_index, nrows=1
+                ).columns)
+
+            headers: List[str] = FileService._normalize_headers(header_row)
+        CacheService.write_headers(filepath, headers, sheet_index)
+        return headers
+
+    @staticmethod
+    def _normalize_headers(header_row: Iterable[Optional[str]]) -> List[str]:
+        """Name and de-duplicate raw header cells the way pandas does when it parses a header row."""
+        values: List[Optional[str]] = list(header_row)
+        while values and values[-1] in (None, ''):
+            values.pop()
 
-        # Try xlrd as fallback (for .xls)
+        headers: List[str] = []
+        seen: dict = {}
+        for index, value in enumerate(values):
+            header = f'Unnamed: {index}' if value is None or value == '' else str(value)
+            base, count = header, seen.get(header, 0)
+            while header in seen:
+                count += 1
+                header = f'{base}.{count}'
+            seen[base] = count
+            seen.setdefault(header, 0)
+            headers.append(header)
+        return headers
+
+    @staticmethod
+    def process_input_file(filepath: str) -> DataFrame:
+        """
+        Read a whole input Excel file with the engine for its format
+        """
+        with MetricsService.stage('parse'):
+            return FileService._read_excel(filepath)
+
+    @staticmethod
+    def iter_input_batches(
+        filepath: str,
+        batch_rows: int = MERGE_BATCH_ROWS,
+        engine: Optional[ReaderEngine] = None,
+        sheet_index: int = 0
+    ) -> Iterator[DataFrame]:
+        """
+        Stream the data rows of a sheet of an input Excel file as dataframes of at most batch_rows rows.
+
+        Columns are named as in read_input_headers and values are kept as read (object dtype),
+        with the cells pd.read_excel treats as missing set to None. Cells beyond the header
+        width are dropped, as are trailing blank rows. Rows are read by the reader engine
+        configured for the file type (READER_ENGINES) unless engine is given; from
+        STREAMING_READ_MIN_BYTES on, by one that streams rows if one is configured, so
+        memory stays bounded by the batch size rather than growing with the sheet.
+        """
+        engine = engine or engine_for(filepath, streaming=os.path.getsize(filepath) >= STREAMING_READ_MIN_BYTES)
+        rows: Iterator[Tuple] = engine.iter_rows(filepath, sheet_index)
         try:
-            return pd.read_excel(filepath, engine=XLRD_ENGINE)
-        except Exception as e:
-            exceptions.append(f"xlrd error: {str(e)}")
+            try:
+                header_row: Tuple = next(rows, ())
+            except Exception as e:
+                print(f"Excel reading error ({engine.name}): {str(e)}")  # Log technical details
+                raise ValueError(MSG_ERROR)
+
+            headers: List[str] = FileService._normalize_headers(header_row)
+            width: int = len(headers)
+            padding: Tuple = (None,) * width
+
+            batch: List[Tuple] = []
+            pending_blank_rows: int = 0
+            for row in rows:
+                row = (tuple(row) + padding)[:width]
+                if all(value is None for value in row):
+                    pending_blank_rows += 1
+                    continue
+                batch.extend([padding] * pending_blank_rows)
+                pending_blank_rows = 0
+                batch.append(row)
+                if len(batch) >= batch_rows:
+                    yield FileService._mask_missing(DataFrame(batch, columns=headers, dtype=object))
+                    batch = []
+            if batch:
+                yield FileService._mask_missing(DataFrame(batch, columns=headers, dtype=object))
+        finally:
+            rows.close()
+
+    @staticmethod
+    def _mask_missing(batch: DataFrame) -> DataFrame:
+        return batch.mask(batch.isin(NA_VALUES), None)
 
-        # If both engines fail, try with default engine
+    @staticmethod
+    def _read_excel(filepath: str, container: Optional[str] = None, **read_kwargs) -> DataFrame:
+        """Read an Excel file with the one engine configured for its format (see engine_for)."""
+        engine: ReaderEngine = engine_for(filepath, container=container)
         try:
-            return pd.read_excel(filepath)
+            return pd.read_excel(filepath, engine=engine.pandas_engine, **read_kwargs)
         except Exception as e:
-            exceptions.append(f"default engine error: {str(e)}")
-
-        # If all attempts fail, raise a user-friendly error with technical details in logs
-        print(f"Excel reading errors:\n" + "\n".join(exceptions))  # Log technical details
-        raise ValueError(MSG_ERROR)
+            # Raise a user-friendly error with technical details in logs
+            print(f"Excel reading error ({engine.name}): {str(e)}")
+            raise ValueError(MSG_ERROR)
 
     @staticmethod
     def cleanup_file(filepath: str) -> None:
-        if filepath and os.path.exists(filepath):
+        if not filepath:
+            return
+
+        # The content-addressed blob behind the upload (the path itself if it has none)
+        blob_path: str = BlobService.resolve(filepath)
+        if os.path.exists(filepath):
             try:
                 os.remove(filepath)
             except Exception:
-                pass
\ No newline at end of file
+                pass
+
+        # Cached parses go with the last upload of the content
+        if blob_path == filepath or BlobService.release(blob_path):
+            CacheService.remove(blob_path)
\ No newline at end of file
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.services.file_service import FileService
+from app.services.metrics_service import MetricsService
+from app.utils.constants import (
+    GUIDELINE_REGISTRY_SIZE, GUIDELINE_MAPPING_CACHE_SIZE, HASH_CHUNK_BYTES, DATE_COLUMNS,
+    COLUMN_TYPE_TEXT, COLUMN_TYPE_DATE
+)
+
+
+class Guideline:
+    """A parsed guideline, shared by every upload of the same file content."""
+
+    def __init__(
+        self,
+        content_hash: str,
+        headers: List[str],
+        column_types: Optional[Dict[str, str]] = None,
+        allowed_values: Optional[Dict[str, frozenset]] = None
+    ) -> None:
+        self.content_hash: str = content_hash
+        self.headers: List[str] = headers
+        self.header_set: frozenset = frozenset(headers)
+        # Declared column types and allowed values, checked against input values on upload
+        self.column_types: Dict[str, str] = column_types or {}
+        self.allowed_values: Dict[str, frozenset] = allowed_values or {}
+        self.checked_columns: frozenset = frozenset(
+            header for header, column_type in self.column_types.items() if column_type != COLUMN_TYPE_TEXT
+        ) | frozenset(self.allowed_values)
+        # Guideline columns whose values are normalized as dates on merge
+        self.date_columns: frozenset = (self.header_set & DATE_COLUMNS) | frozenset(
+            header for header, column_type in self.column_types.items() if column_type == COLUMN_TYPE_DATE
+        )
+        # Input header -> guideline header it converts to (None when it matches nothing)
+        self.mapping_cache: Dict[str, Optional[str]] = {}
+        self._mapping_lock: threading.Lock = threading.Lock()
+
+    def trim_mapping_cache(self, max_size: int = GUIDELINE_MAPPING_CACHE_SIZE) -> Dict[str, Optional[str]]:
+        """Empty mapping_cache once it holds more than max_size headers, and return it.
+
+        Request threads share the cache and only read it with get, so clearing
+        it under the lock cannot drop an entry between a check and a read.
+        """
+        if len(self.mapping_cache) > max_size:
+            with self._mapping_lock:
+                if len(self.mapping_cache) > max_size:
+                    self.mapping_cache.clear()
+        return self.mapping_cache
+
+
+class GuidelineService:
+    _registry: "OrderedDict[str, Guideline]" = OrderedDict()
+    _path_hashes: Dict[Tuple[int, int, int, int], str] = {}
+    _lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(filepath: str) -> str:
+        """SHA-256 of the file, memoized per file (inode, so hard links share it), size and modification time."""
+        stat = os.stat(filepath)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        digest: Optional[str] = GuidelineService._path_hashes.get(key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            with GuidelineService._lock:
+                if len(GuidelineService._path_hashes) >= GUIDELINE_REGISTRY_SIZE * 16:
+                    GuidelineService._path_hashes.clear()
+                GuidelineService._path_hashes[key] = digest
+        return digest
+
+    @staticmethod
+    def load(filepath: str) -> Guideline:
+        """Return the parsed guideline for a file, parsing it only the first time its content is seen."""
+        digest: str = GuidelineService.content_hash(filepath)
+        with GuidelineService._lock:
+            guideline: Optional[Guideline] = GuidelineService._registry.get(digest)
+            if guideline is not None:
+                GuidelineService._registry.move_to_end(digest)
+        MetricsService.cache_lookup('guideline', guideline is not None)
+        if guideline is not None:
+            return guideline
+
+        headers: List[str] = FileService.read_guideline_headers(filepath)
+        guideline = Guideline(digest, headers, *FileService.read_guideline_rules(filepath, headers))
+        with GuidelineService._lock:
+            guideline = GuidelineService._registry.setdefault(digest, guideline)
+            GuidelineService._registry.move_to_end(digest)
+            while len(GuidelineService._registry) > GUIDELINE_REGISTRY_SIZE:
+                GuidelineService._registry.popitem(last=False)
+        return guideline
+
+    @staticmethod
+    def clear() -> None:
+        with GuidelineService._lock:
+            GuidelineService._registry.clear()
+            GuidelineService._path_hashes.clear()
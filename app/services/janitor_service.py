@@ -0,0 +1,214 @@
+import fcntl
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, TextIO, Tuple
+
+from app.services.blob_service import BlobService
+from app.services.cache_service import CacheService
+from app.services.file_service import FileService
+from app.services.job_service import JobService
+from app.services.plan_service import PlanService
+from app.services.session_service import SessionService
+from app.utils.constants import (
+    UPLOAD_FOLDER, TEMP_FOLDER, BLOB_PREFIX, WORKBOOK_CACHE_EXTENSION, HEADERS_CACHE_EXTENSION,
+    JANITOR_TTL_SECONDS, JANITOR_MAX_BYTES, JANITOR_LIVE_SECONDS, JANITOR_INTERVAL_SECONDS, JANITOR_LOCK_PATH,
+    MERGE_PLAN_TTL_SECONDS
+)
+
+_CACHE_EXTENSIONS: Tuple[str, ...] = (WORKBOOK_CACHE_EXTENSION, HEADERS_CACHE_EXTENSION)
+
+
+class JanitorService:
+    """Background cleanup of the upload and temp folders.
+
+    A file's modification time is its last use: requests touch the files of
+    their session, so files of live sessions stay recent. Each sweep removes
+    files unused for longer than the TTL, then, while the folders are over the
+    quota, evicts least recently used files, caches first (they can be rebuilt).
+    Files held by a session that has not expired are never evicted, nor are
+    files used within the live window (uploads and job results not yet saved
+    in a session).
+
+    Every worker process of a server starts a janitor, but only one sweeps: the
+    one holding an exclusive flock on JANITOR_LOCK_PATH, taken by the first to
+    try and kept until it stops. The others retry each interval, so one takes
+    over when the sweeping process exits.
+    """
+    _thread: Optional[threading.Thread] = None
+    _stop: threading.Event = threading.Event()
+    _lock: threading.Lock = threading.Lock()
+    # The lock file, open and locked while this process is the one sweeping
+    _lease: Optional[TextIO] = None
+
+    @staticmethod
+    def start(interval: float = JANITOR_INTERVAL_SECONDS) -> None:
+        """Start the sweeping thread, once per process."""
+        with JanitorService._lock:
+            if JanitorService._thread is not None and JanitorService._thread.is_alive():
+                return
+            JanitorService._stop.clear()
+            JanitorService._thread = threading.Thread(
+                target=JanitorService._run, args=(interval,), name='janitor', daemon=True
+            )
+            JanitorService._thread.start()
+
+    @staticmethod
+    def stop() -> None:
+        JanitorService._stop.set()
+
+    @staticmethod
+    def _run(interval: float) -> None:
+        try:
+            while not JanitorService._stop.wait(interval):
+                try:
+                    if JanitorService._acquire_lease():
+                        JanitorService.sweep()
+                except Exception as e:
+                    print(f"Error in janitor sweep: {str(e)}")
+        finally:
+            JanitorService._release_lease()
+
+    @staticmethod
+    def _acquire_lease() -> bool:
+        """Whether this process is the one sweeping, locking JANITOR_LOCK_PATH if no other process holds it."""
+        if JanitorService._lease is not None:
+            return True
+        os.makedirs(os.path.dirname(JANITOR_LOCK_PATH), exist_ok=True)
+        lease: TextIO = open(JANITOR_LOCK_PATH, 'a')
+        try:
+            fcntl.flock(lease.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lease.close()
+            return False
+        JanitorService._lease = lease
+        return True
+
+    @staticmethod
+    def _release_lease() -> None:
+        if JanitorService._lease is not None:
+            # Closing the file releases the lock
+            JanitorService._lease.close()
+            JanitorService._lease = None
+
+    @staticmethod
+    def touch(paths: Iterable[Optional[str]]) -> None:
+        """Mark files as used by a live session."""
+        now: float = time.time()
+        for path in paths:
+            if path:
+                try:
+                    os.utime(path, (now, now))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def sweep(
+        ttl: float = JANITOR_TTL_SECONDS,
+        max_bytes: int = JANITOR_MAX_BYTES,
+        live_seconds: float = JANITOR_LIVE_SECONDS,
+        now: Optional[float] = None,
+        plan_ttl: float = MERGE_PLAN_TTL_SECONDS
+    ) -> Dict[str, int]:
+        """Remove expired and unreferenced files, then evict down to max_bytes; returns what was done."""
+        now = now if now is not None else time.time()
+        removed: int = 0
+
+        for path, stat in JanitorService._scan():
+            name: str = os.path.basename(path)
+            if name.endswith(_CACHE_EXTENSIONS):
+                # Caches outlive their file only if a removal was interrupted
+                if not os.path.exists(CacheService.owner_path(path)):
+                    removed += JanitorService._remove(path)
+            elif name.startswith(BLOB_PREFIX):
+                if stat.st_nlink == 1 and BlobService.release(path):
+                    CacheService.remove(path)
+                    removed += 1
+            elif now - stat.st_mtime > ttl:
+                removed += JanitorService._remove(path)
+
+        JobService.purge(now - ttl)
+        SessionService.purge(now - ttl)
+        PlanService.purge(now - plan_ttl)
+        evicted, total = JanitorService._enforce_quota(max_bytes, now - live_seconds, SessionService.file_paths())
+
+        if removed or evicted:
+            print(f"Janitor removed {removed} expired and {evicted} evicted files, {total} bytes in use")
+        return {'removed': removed, 'evicted': evicted, 'bytes': total}
+
+    @staticmethod
+    def _enforce_quota(max_bytes: int, live_since: float, session_paths: Set[str]) -> Tuple[int, int]:
+        files: List[Tuple[str, os.stat_result]] = JanitorService._scan()
+
+        # Hard links of one blob take space once
+        links: Dict[Tuple[int, int], int] = {}
+        sizes: Dict[Tuple[int, int], int] = {}
+        for _, stat in files:
+            key = (stat.st_dev, stat.st_ino)
+            links[key] = links.get(key, 0) + 1
+            sizes[key] = stat.st_size
+        total: int = sum(sizes.values())
+        if total <= max_bytes:
+            return 0, total
+
+        caches = [(stat.st_mtime, path) for path, stat in files if path.endswith(_CACHE_EXTENSIONS)]
+        uploads = [
+            (stat.st_mtime, path) for path, stat in files
+            if not path.endswith(_CACHE_EXTENSIONS)
+            and not os.path.basename(path).startswith(BLOB_PREFIX)
+            and stat.st_mtime < live_since
+            and path not in session_paths
+        ]
+
+        evicted: int = 0
+        for _, path in sorted(caches) + sorted(uploads):
+            if total <= max_bytes:
+                break
+            # Removing an upload can also remove its blob and the blob's caches
+            blob_path: str = BlobService.resolve(path)
+            affected: Dict[str, os.stat_result] = {}
+            for candidate in [path, blob_path] + CacheService.cache_files(blob_path):
+                try:
+                    affected[candidate] = os.stat(candidate)
+                except OSError:
+                    pass
+
+            evicted += JanitorService._remove(path)
+            for candidate, stat in affected.items():
+                if not os.path.exists(candidate):
+                    key = (stat.st_dev, stat.st_ino)
+                    links[key] = links.get(key, 1) - 1
+                    if links[key] == 0:
+                        total -= stat.st_size
+
+        if total > max_bytes:
+            print(f"Upload storage is over quota ({total} of {max_bytes} bytes) with only live files left")
+        return evicted, total
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        name: str = os.path.basename(path)
+        try:
+            if name.endswith(_CACHE_EXTENSIONS) or name.endswith('.tmp') or os.path.dirname(path) == TEMP_FOLDER:
+                os.remove(path)
+            else:
+                FileService.cleanup_file(path)
+        except OSError:
+            return 0
+        return 0 if os.path.exists(path) else 1
+
+    @staticmethod
+    def _scan() -> List[Tuple[str, os.stat_result]]:
+        files: List[Tuple[str, os.stat_result]] = []
+        for directory in (UPLOAD_FOLDER, TEMP_FOLDER):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                # The databases and the janitor's own lock live in the temp folder and are not its to remove
+                if (entry.is_file(follow_symlinks=False) and '.sqlite3' not in entry.name
+                        and entry.path != JANITOR_LOCK_PATH):
+                    try:
+                        files.append((entry.path, entry.stat()))
+                    except OSError:
+                        pass
+        return files
@@ -0,0 +1,260 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.utils.constants import (
+    JOBS_DB_PATH, JOB_WORKERS, JOB_PROGRESS_ROWS, JOB_PROGRESS_SECONDS, TEMP_FOLDER, JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING, JOB_STATUS_DONE, JOB_STATUS_FAILED, MSG_JOB_INTERRUPTED
+)
+from app.utils.database import Database
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    result TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    session_id TEXT,
+    owner_pid INTEGER,
+    owner TEXT
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+# Columns added to jobs since it was first created, for databases created before them
+_ADDED_COLUMNS: Dict[str, str] = {'session_id': 'TEXT', 'owner_pid': 'INTEGER', 'owner': 'TEXT'}
+
+
+def _add_columns(connection: sqlite3.Connection) -> None:
+    columns = {row['name'] for row in connection.execute("PRAGMA table_info(jobs)")}
+    for column, column_type in _ADDED_COLUMNS.items():
+        if column not in columns:
+            connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+
+class JobService:
+    """Runs uploads and merges in background threads, with their state kept in SQLite.
+
+    A job is created queued with one progress row per file, and is then run by a
+    thread pool: the request that submitted it only waits for the insert. Tasks
+    report per-file progress through update_file and return a JSON-serializable
+    result, which is stored with the job.
+
+    Each job records the session that submitted it, and only that session can
+    see it, and its owner: the process running it (pid and a random id drawn
+    when the process starts its pool, since pids are reused). Several server
+    processes share the database, so a process only fails unfinished jobs whose
+    owner is gone, never another live process's.
+
+    Row counts are written at most every JOB_PROGRESS_ROWS rows or
+    JOB_PROGRESS_SECONDS per file; status changes write them at once.
+    """
+    _database: Database = Database(JOBS_DB_PATH, _SCHEMA, _add_columns)
+    _executor: Optional[ThreadPoolExecutor] = None
+    _owner: Optional[str] = None
+    _lock: threading.Lock = threading.Lock()
+    # (job id, file position) -> rows not written yet, and when the file's progress was last written
+    _progress: Dict[Tuple[str, int], Tuple[int, float]] = {}
+    _progress_lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        return JobService._database.connect()
+
+    @staticmethod
+    def _write(statements: List[tuple]) -> None:
+        with JobService._connect() as connection:
+            for sql, params in statements:
+                connection.execute(sql, params)
+
+    @staticmethod
+    def _get_executor() -> ThreadPoolExecutor:
+        with JobService._lock:
+            if JobService._executor is None:
+                JobService._owner = uuid.uuid4().hex
+                JobService._recover()
+                JobService._executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+            return JobService._executor
+
+    @staticmethod
+    def _recover() -> None:
+        # Jobs left queued or running by a process that has exited will never finish
+        unfinished = (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING)
+        rows: List[sqlite3.Row] = JobService._connect().execute(
+            "SELECT id, owner_pid, owner FROM jobs WHERE status IN (?, ?)", unfinished
+        ).fetchall()
+        stale: List[str] = [
+            row['id'] for row in rows if not JobService._owner_alive(row['owner_pid'], row['owner'])
+        ]
+        now: float = time.time()
+        JobService._write([
+            statement
+            for job_id in stale
+            for statement in (
+                ("UPDATE job_files SET status = ?, error = ? WHERE job_id = ? AND status IN (?, ?)",
+                 (JOB_STATUS_FAILED, MSG_JOB_INTERRUPTED, job_id, *unfinished)),
+                ("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ? AND status IN (?, ?)",
+                 (JOB_STATUS_FAILED, MSG_JOB_INTERRUPTED, now, job_id, *unfinished)),
+            )
+        ])
+
+    @staticmethod
+    def _owner_alive(pid: Optional[int], owner: Optional[str]) -> bool:
+        """Whether the process owning a job may still run it.
+
+        A job with this process's pid but another owner id was left by an
+        earlier process that had the same pid.
+        """
+        if pid is None:
+            return False
+        if pid == os.getpid():
+            return owner == JobService._owner
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # Exists, under another user
+            return True
+        return True
+
+    @staticmethod
+    def shutdown() -> None:
+        with JobService._lock:
+            if JobService._executor is not None:
+                JobService._executor.shutdown(wait=True)
+            JobService._executor = None
+
+    @staticmethod
+    def submit(kind: str, file_names: List[str], task: Callable[[str], Dict[str, Any]], session_id: str) -> str:
+        """Record a queued job of a session and run task(job_id) in the background; returns the job id."""
+        executor: ThreadPoolExecutor = JobService._get_executor()
+        job_id: str = str(uuid.uuid4())
+        now: float = time.time()
+        JobService._write(
+            [("INSERT INTO jobs (id, kind, status, created, updated, session_id, owner_pid, owner) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+              (job_id, kind, JOB_STATUS_QUEUED, now, now, session_id, os.getpid(), JobService._owner))]
+            + [("INSERT INTO job_files (job_id, position, name, status) VALUES (?, ?, ?, ?)",
+                (job_id, position, name, JOB_STATUS_QUEUED))
+               for position, name in enumerate(file_names)]
+        )
+        executor.submit(JobService._run, job_id, task)
+        return job_id
+
+    @staticmethod
+    def _run(job_id: str, task: Callable[[str], Dict[str, Any]]) -> None:
+        JobService._set_status(job_id, JOB_STATUS_RUNNING, from_status=JOB_STATUS_QUEUED)
+        try:
+            result: Dict[str, Any] = task(job_id)
+        except Exception as e:
+            print(f"Error in job {job_id}: {str(e)}")
+            JobService._set_status(job_id, JOB_STATUS_FAILED, from_status=JOB_STATUS_RUNNING, error=str(e))
+            return
+        JobService._set_status(job_id, JOB_STATUS_DONE, from_status=JOB_STATUS_RUNNING, result=result)
+
+    @staticmethod
+    def _set_status(
+        job_id: str,
+        status: str,
+        from_status: str,
+        error: Optional[str] = None,
+        result: Optional[Dict[str, Any]] = None
+    ) -> None:
+        # Files still at from_status follow the job; files a task already finished keep their own status
+        JobService._write(JobService._take_progress(job_id) + [
+            ("UPDATE jobs SET status = ?, error = ?, result = ?, updated = ? WHERE id = ?",
+             (status, error, json.dumps(result) if result is not None else None, time.time(), job_id)),
+            ("UPDATE job_files SET status = ?, error = COALESCE(error, ?) WHERE job_id = ? AND status IN (?, ?)",
+             (status, error, job_id, from_status, JOB_STATUS_QUEUED)),
+        ])
+
+    @staticmethod
+    def update_file(
+        job_id: str,
+        position: int,
+        status: Optional[str] = None,
+        add_rows: int = 0,
+        error: Optional[str] = None
+    ) -> None:
+        """Record progress for one file of a job: a new status, rows processed since the last call, an error."""
+        key: Tuple[str, int] = (job_id, position)
+        now: float = time.monotonic()
+        with JobService._progress_lock:
+            rows, written = JobService._progress.get(key, (0, 0.0))
+            rows += add_rows
+            if status is None and error is None and rows < JOB_PROGRESS_ROWS and now - written < JOB_PROGRESS_SECONDS:
+                JobService._progress[key] = (rows, written)
+                return
+            JobService._progress[key] = (0, now)
+        JobService._write([
+            ("UPDATE job_files SET status = COALESCE(?, status), rows = rows + ?, error = COALESCE(?, error) "
+             "WHERE job_id = ? AND position = ?",
+             (status, rows, error, job_id, position))
+        ])
+
+    @staticmethod
+    def _take_progress(job_id: str) -> List[tuple]:
+        """Statements writing the rows of a job not written yet, which is then forgotten."""
+        with JobService._progress_lock:
+            keys: List[Tuple[str, int]] = [key for key in JobService._progress if key[0] == job_id]
+            pending: List[Tuple[int, int]] = [(key[1], JobService._progress.pop(key)[0]) for key in keys]
+        return [
+            ("UPDATE job_files SET rows = rows + ? WHERE job_id = ? AND position = ?", (rows, job_id, position))
+            for position, rows in pending
+            if rows
+        ]
+
+    @staticmethod
+    def get(job_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """The job with its per-file progress, or None for an unknown id or a job of another session."""
+        connection: sqlite3.Connection = JobService._connect()
+        job: Optional[sqlite3.Row] = connection.execute(
+            "SELECT * FROM jobs WHERE id = ? AND session_id = ?", (job_id, session_id)
+        ).fetchone()
+        if job is None:
+            return None
+        files: List[sqlite3.Row] = connection.execute(
+            "SELECT name, status, rows, error FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+        ).fetchall()
+
+        return {
+            'id': job['id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'error': job['error'],
+            'result': json.loads(job['result']) if job['result'] else None,
+            'created': job['created'],
+            'updated': job['updated'],
+            'files': [dict(file) for file in files]
+        }
+
+    @staticmethod
+    def purge(before: float) -> None:
+        """Forget finished jobs last updated before the given time."""
+        finished = (JOB_STATUS_DONE, JOB_STATUS_FAILED)
+        JobService._write([
+            ("DELETE FROM job_files WHERE job_id IN "
+             "(SELECT id FROM jobs WHERE updated < ? AND status IN (?, ?))", (before, *finished)),
+            ("DELETE FROM jobs WHERE updated < ? AND status IN (?, ?)", (before, *finished)),
+        ])
+
+    @staticmethod
+    def result_path(job_id: str, extension: str) -> str:
+        """Where a job writes its output file."""
+        return os.path.join(TEMP_FOLDER, f"{job_id}.{extension}")
@@ -1,122 +1,701 @@
-from io import StringIO
-from typing import Dict, List
+import os
+import warnings
+from functools import partial
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from pandas import DataFrame
+from pandas.tseries.api import guess_datetime_format
+from app.services.cache_service import CacheService
+from app.services.file_service import FileService
+from app.services.guideline_service import Guideline, GuidelineService
+from app.services.metrics_service import MetricsService
+from app.services.plan_service import MergePlan, PlanService
 from app.utils.constants import (
-    OPENPYXL_ENGINE, HEADERS_EXTRA, HEADERS_MISSING, HEADERS_MATCHED,
-    FULL_HEADER_CONVERSIONS
+    HEADERS_EXTRA, HEADERS_MISSING, HEADERS_MATCHED,
+    FULL_HEADER_CONVERSIONS, HEADER_CONVERSIONS_PATH,
+    MERGE_ALL_WORKERS, MERGE_ALL_QUEUE_CHUNKS, SOURCE_FILE_COLUMN,
+    DATE_COLUMNS, EXCEL_EPOCH, EXCEL_SERIAL_MIN, EXCEL_SERIAL_MAX,
+    MERGE_ENGINE, MERGE_ENGINE_PANDAS, MERGE_ENGINE_ARROW, MSG_INVALID_ENGINE, MSG_INVALID_FORMAT,
+    OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_CSV_GZ, OUTPUT_FORMAT_XLSX, OUTPUT_FORMAT_PARQUET,
+    COLUMN_TYPE_TEXT, COLUMN_TYPE_INTEGER, COLUMN_TYPE_NUMBER, COLUMN_TYPE_DATE, VALUE_CHECK_SAMPLE_ROWS
 )
+from app.utils.header_matcher import HeaderMatcher
+from app.utils.streaming import iter_gzip, iter_parquet, iter_prefetched, iter_xlsx, iter_zip
+
+# Cell value types read as Excel serial dates in a date column
+_NUMBER_TYPES: set = {int, float, np.int64, np.float64}
+# Marks headers not looked up yet in a guideline's mapping cache (None caches "no mapping")
+_UNMAPPED: object = object()
 
 
 class MergeService:
+    # Compiled once at startup from the conversion table
+    header_matcher: HeaderMatcher = HeaderMatcher.load(FULL_HEADER_CONVERSIONS, HEADER_CONVERSIONS_PATH)
+    # Merge plans compiled under other conversions or date columns are recompiled
+    plan_rules: str = PlanService.rules_hash(header_matcher.signature, DATE_COLUMNS)
+
     @staticmethod
     def _convert_header(header: str) -> str:
         """Convert input header to standardized format using predefined mappings."""
-        # First try exact match
-        if header in FULL_HEADER_CONVERSIONS:
-            return FULL_HEADER_CONVERSIONS[header]
+        return MergeService.header_matcher.convert(header)
 
-        # Then try case-insensitive match
-        header_lower = header.lower()
-        for pattern, replacement in FULL_HEADER_CONVERSIONS.items():
-            if pattern.lower() == header_lower:
-                return replacement
-
-        # Finally try substring match
-        for pattern, replacement in FULL_HEADER_CONVERSIONS.items():
-            if pattern.lower() in header_lower:
-                return replacement
+    @staticmethod
+    def _get_automatic_mappings(
+        input_headers: List[str],
+        guideline_headers: Collection[str] | Guideline
+    ) -> Dict[str, str]:
+        """Get automatic header mappings based on FULL_HEADER_CONVERSIONS.
 
-        return header
+        With a registered Guideline the per-header results are memoized on it,
+        so repeat uploads against the same guideline skip the conversion.
+        """
+        if isinstance(guideline_headers, Guideline):
+            header_set = guideline_headers.header_set
+            cache = guideline_headers.trim_mapping_cache()
+        else:
+            header_set, cache = set(guideline_headers), {}
 
-    @staticmethod
-    def _get_automatic_mappings(input_headers: List[str], guideline_headers: List[str]) -> Dict[str, str]:
-        """Get automatic header mappings based on FULL_HEADER_CONVERSIONS."""
         mappings = {}
         for input_header in input_headers:
-            converted = MergeService._convert_header(input_header)
-            if converted in guideline_headers:
-                mappings[input_header] = converted
+            mapped = cache.get(input_header, _UNMAPPED)
+            if mapped is _UNMAPPED:
+                converted = MergeService._convert_header(input_header)
+                mapped = converted if converted in header_set else None
+                cache[input_header] = mapped
+            if mapped is not None:
+                mappings[input_header] = mapped
         return mappings
 
     @staticmethod
-    def _format_date_column(date_series: pd.Series) -> list:
-        """Format a date series into a list of standardized date strings.
-        
+    def _format_date_column(date_series: pd.Series, format_cache: Dict[str, Optional[str]] = None) -> pd.Series:
+        """Format a date series into standardized date strings, without a per-element Python loop.
+
         Args:
             date_series: Pandas Series containing date values
-            
+            format_cache: Optional mapping of column name to inferred date format
+
         Returns:
-            List of formatted date strings, empty strings for invalid/missing dates
+            Series of formatted date strings, empty strings for invalid/missing dates
+        """
+        dates = MergeService._parse_dates(date_series, format_cache)
+
+        # Format each distinct day once; exports repeat a small set of days across many rows
+        days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+        codes, unique_days = pd.factorize(days)
+        labels = np.append(np.datetime_as_string(np.asarray(unique_days, dtype='datetime64[D]')), '')
+        return pd.Series(labels[codes], index=date_series.index, dtype=object)
+
+    @staticmethod
+    def _parse_dates(date_series: pd.Series, format_cache: Dict[str, Optional[str]] = None) -> pd.Series:
+        """Parse a date series into naive datetimes, NaT for invalid/missing dates.
+
+        Values are parsed by kind: numbers as Excel serial dates, date objects as
+        they are, and strings as pd.to_datetime would parse the whole column. When
+        the column's first value is a string with a recognizable format, strings
+        must follow that format (or be serial numbers); otherwise each is parsed on
+        its own. The format is kept in format_cache, keyed by series name, so later
+        batches of the column skip the inference and parse the same way.
+        """
+        if pd.api.types.is_datetime64_any_dtype(date_series):
+            return MergeService._naive(date_series)
+        if pd.api.types.is_numeric_dtype(date_series):
+            return MergeService._from_excel_serial(date_series)
+
+        cache = format_cache if format_cache is not None else {}
+        if date_series.name not in cache:
+            present = date_series[date_series.notna() & (date_series != '')]
+            first = present.iloc[0] if len(present) else None
+            if first is None:
+                return pd.Series(pd.NaT, index=date_series.index, dtype='datetime64[ns]')
+            cache[date_series.name] = guess_datetime_format(first) if isinstance(first, str) else None
+
+        dates = pd.Series(pd.NaT, index=date_series.index, dtype='datetime64[ns]')
+        kinds = date_series.map(type)
+        strings = kinds == str
+        numbers = kinds.isin(_NUMBER_TYPES)
+        others = ~(strings | numbers) & date_series.notna()
+
+        if numbers.any():
+            dates[numbers] = MergeService._from_excel_serial(date_series[numbers])
+        if strings.any():
+            dates[strings] = MergeService._parse_date_strings(date_series[strings], cache[date_series.name])
+        if others.any():
+            dates[others] = MergeService._to_datetime(date_series[others])
+        return dates
+
+    @staticmethod
+    def _from_excel_serial(values: pd.Series) -> pd.Series:
+        """Excel serial day numbers (1900 date system) to dates; numbers out of range become NaT."""
+        numbers = pd.to_numeric(values, errors='coerce')
+        numbers = numbers.where(numbers.between(EXCEL_SERIAL_MIN, EXCEL_SERIAL_MAX))
+        return pd.to_datetime(numbers, unit='D', origin=EXCEL_EPOCH)
+
+    @staticmethod
+    def _parse_date_strings(values: pd.Series, date_format: Optional[str]) -> pd.Series:
+        """Strings in date_format, or serial numbers; each string on its own when there is no format."""
+        parsed = MergeService._to_datetime(values, format=date_format or 'mixed')
+
+        # Strings that do not follow the format may still be serial numbers
+        unparsed = parsed.isna() & (values != '')
+        if unparsed.any():
+            parsed = parsed.mask(unparsed, MergeService._from_excel_serial(values[unparsed]))
+        return parsed
+
+    @staticmethod
+    def _to_datetime(values: pd.Series, **kwargs) -> pd.Series:
+        """pd.to_datetime with invalid values as NaT and without time zones.
+
+        Dates keep their wall time, except that a mix of UTC offsets, which pandas
+        cannot hold in one column, is converted to UTC. A value that makes the
+        vectorized parse raise is parsed on its own, so only it is lost.
         """
         try:
-            dates = pd.to_datetime(date_series, errors='coerce')
-            return [d.strftime('%Y-%m-%d') if pd.notna(d) else '' for d in dates]
-        except Exception as e:
-            print(f"Error formatting dates: {str(e)}")
-            return date_series.fillna('').astype(str).tolist()
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                dates = pd.to_datetime(values, errors='coerce', **kwargs)
+            if dates.dtype == object:
+                dates = pd.to_datetime(values, errors='coerce', utc=True, **kwargs)
+        except (TypeError, ValueError, OverflowError):
+            if len(values) == 1:
+                return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+            return pd.concat([MergeService._to_datetime(values.iloc[[i]], **kwargs) for i in range(len(values))])
+        return MergeService._naive(dates)
+
+    @staticmethod
+    def _naive(dates: pd.Series) -> pd.Series:
+        if getattr(dates.dt, 'tz', None) is not None:
+            return dates.dt.tz_localize(None)
+        return dates
 
     @staticmethod
-    def merge_files(guideline_path: str, input_path: str, custom_mappings: Dict[str, str] = None) -> str:
+    def merge_files(
+        guideline_path: str,
+        input_path: str,
+        custom_mappings: Dict[str, str] = None,
+        engine: str = MERGE_ENGINE,
+        sheet_index: int = 0
+    ) -> str:
         """Merge files while preserving data types from guideline."""
-        try:
-            # Load files with type inference
-            guideline_df = pd.read_csv(guideline_path, dtype=str)
-            
-            # Define date columns
-            date_columns = ['First Detected Date', 'Last Detected Date']
-            
-            # Read Excel with date parsing
-            input_df = pd.read_excel(
-                input_path, 
-                engine=OPENPYXL_ENGINE
+        return ''.join(MergeService.iter_merge(
+            guideline_path, input_path, custom_mappings, engine, sheet_index=sheet_index
+        ))
+
+    @staticmethod
+    def iter_merge(
+        guideline_path: str,
+        input_path: str,
+        custom_mappings: Dict[str, str] = None,
+        engine: str = MERGE_ENGINE,
+        on_rows: Optional[Callable[[int], None]] = None,
+        sheet_index: int = 0
+    ) -> Iterator[str]:
+        """Merge files as a stream of CSV chunks, one per batch of input rows.
+
+        Headers and mappings are resolved before returning, so unreadable files
+        raise here rather than midway through the stream. engine selects the
+        pandas merge or the Arrow one (MERGE_ENGINE_PANDAS / MERGE_ENGINE_ARROW).
+        on_rows, if given, is called with the row count of each batch once it is written.
+        Only the sheet at sheet_index is read.
+        """
+        if engine == MERGE_ENGINE_ARROW:
+            return MergeService._iter_arrow_csv(
+                *MergeService._plan(guideline_path, input_path, custom_mappings, sheet_index),
+                sheet_index=sheet_index, on_rows=on_rows
             )
+        if engine != MERGE_ENGINE_PANDAS:
+            raise ValueError(MSG_INVALID_ENGINE)
+        headers, batches = MergeService.plan_merge(guideline_path, input_path, custom_mappings, sheet_index)
+        return MergeService._iter_csv(headers, MergeService._counted(batches, on_rows))
+
+    @staticmethod
+    def iter_output(
+        guideline_path: str,
+        input_path: str,
+        output_format: str = OUTPUT_FORMAT_CSV,
+        custom_mappings: Dict[str, str] = None,
+        engine: str = MERGE_ENGINE,
+        on_rows: Optional[Callable[[int], None]] = None,
+        sheet_index: int = 0
+    ) -> Iterator[str | bytes]:
+        """Merge a file as a stream in one of the output formats (OUTPUT_FORMAT_*).
 
-            # Get automatic mappings
-            auto_mappings = MergeService._get_automatic_mappings(
-                list(input_df.columns),
-                list(guideline_df.columns)
+        CSV is iter_merge's stream, gzip-compressed for OUTPUT_FORMAT_CSV_GZ. XLSX
+        and Parquet are encoded from the same merged batches (engine does not apply
+        to them). As with iter_merge, unreadable files raise before returning.
+        """
+        if output_format in (OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_CSV_GZ):
+            chunks: Iterator[str] = MergeService.iter_merge(
+                guideline_path, input_path, custom_mappings, engine, on_rows, sheet_index
             )
+            return chunks if output_format == OUTPUT_FORMAT_CSV else MetricsService.timed('gzip', iter_gzip(chunks))
+
+        encoders: Dict[str, Callable[[List[str], Iterator[DataFrame]], Iterator[bytes]]] = {
+            OUTPUT_FORMAT_XLSX: iter_xlsx,
+            OUTPUT_FORMAT_PARQUET: iter_parquet,
+        }
+        if output_format not in encoders:
+            raise ValueError(MSG_INVALID_FORMAT)
+        headers, batches = MergeService.plan_merge(guideline_path, input_path, custom_mappings, sheet_index)
+        return MetricsService.timed(
+            output_format, encoders[output_format](headers, MergeService._metered(batches, on_rows))
+        )
+
+    @staticmethod
+    def plan_merge(
+        guideline_path: str,
+        input_path: str,
+        custom_mappings: Dict[str, str] = None,
+        sheet_index: int = 0
+    ) -> Tuple[List[str], Iterator[DataFrame]]:
+        """Resolve the output columns and mappings now; return them with a lazy iterator of merged batches."""
+        input_path, input_headers, plan = MergeService._plan(guideline_path, input_path, custom_mappings, sheet_index)
+
+        return plan.headers, MergeService._iter_merged_batches(
+            plan, MergeService._iter_input_batches(input_path, input_headers, sheet_index)
+        )
+
+    @staticmethod
+    def _plan(
+        guideline_path: str,
+        input_path: str,
+        custom_mappings: Dict[str, str] = None,
+        sheet_index: int = 0
+    ) -> Tuple[str, List[str], MergePlan]:
+        try:
+            guideline: Guideline = GuidelineService.load(guideline_path)
+            input_headers: List[str] = FileService.read_input_headers(input_path, sheet_index)
+            with MetricsService.stage('mapping'):
+                plan: MergePlan = MergeService.merge_plan(guideline, input_headers, custom_mappings)
+        except Exception as e:
+            print(f"Error in merge_files: {str(e)}")
+            raise
+
+        return input_path, input_headers, plan
+
+    @staticmethod
+    def merge_plan(
+        guideline: Guideline,
+        input_headers: List[str],
+        custom_mappings: Dict[str, str] = None,
+        removed: Collection[str] = ()
+    ) -> MergePlan:
+        """The merge plan of an input header layout, compiled the first time the layout is seen.
+
+        Custom mappings are saved into the plan on top of those saved before (a
+        new mapping of the same input column replaces the saved one), so later
+        merges of the same layout apply them without being given them again.
+        Saved mappings of the input columns in removed are dropped. Plans are
+        shared by every session, so saved mappings are listed on the results page
+        with a way to remove them.
+        """
+        input_hash: str = PlanService.header_hash(input_headers)
+        plan: Optional[MergePlan] = PlanService.get(guideline.content_hash, input_hash)
+        saved: Dict[str, str] = plan.custom_mappings if plan is not None else {}
+        removed = set(removed)
+        combined: Dict[str, str] = {
+            input_col: guideline_col for input_col, guideline_col in {**saved, **(custom_mappings or {})}.items()
+            if input_col not in removed
+        }
+        reusable: bool = plan is not None and plan.rules == MergeService.plan_rules and combined == saved
+        MetricsService.cache_lookup('plan', reusable)
+        if reusable:
+            return plan
+
+        plan = MergeService._compile_plan(guideline, input_headers, combined)
+        PlanService.put(guideline.content_hash, input_hash, plan)
+        return plan
+
+    @staticmethod
+    def _compile_plan(guideline: Guideline, input_headers: List[str], custom_mappings: Dict[str, str]) -> MergePlan:
+        mappings: Dict[str, str] = MergeService._resolve_mappings(input_headers, guideline, custom_mappings)
+        # Date columns: named in DATE_COLUMNS on either side, or dates in the guideline
+        converters: Dict[str, str] = {
+            input_col: COLUMN_TYPE_DATE if input_col in DATE_COLUMNS or guideline_col in guideline.date_columns
+            else COLUMN_TYPE_TEXT
+            for input_col, guideline_col in mappings.items()
+        }
+        # Only the custom mappings that take effect in this layout are saved
+        saved: Dict[str, str] = {
+            input_col: guideline_col for input_col, guideline_col in (custom_mappings or {}).items()
+            if mappings.get(input_col) == guideline_col
+        }
+        return MergePlan(list(guideline.headers), mappings, converters, saved, MergeService.plan_rules)
+
+    @staticmethod
+    def warm() -> None:
+        """Merge a tiny in-memory batch with both engines' writers, so the first real merge starts warm."""
+        plan: MergePlan = MergePlan(
+            ['Name', 'Date'], {'name': 'Name', 'date': 'Date'}, {'name': COLUMN_TYPE_TEXT, 'date': COLUMN_TYPE_DATE}
+        )
+        batch: DataFrame = pd.DataFrame({'name': ['warm', None], 'date': ['2024-01-31', 45000]})
+        for merged in MergeService._iter_merged_batches(plan, iter([batch])):
+            merged.to_csv(index=False)
+            MergeService._write_arrow_csv(CacheService.to_record_batch(merged))
+
+    @staticmethod
+    def iter_merge_all(
+        guideline_path: str,
+        inputs: List[Tuple[str, str, Optional[Dict[str, str]], int]],
+        concatenate: bool = False,
+        workers: int = MERGE_ALL_WORKERS,
+        engine: str = MERGE_ENGINE,
+        on_rows: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[str | bytes]:
+        """Merge several input files concurrently into one stream.
+
+        inputs holds (name, input path, custom mappings, sheet index) per file or
+        sheet. The result is a ZIP of per-file CSVs, or with concatenate a single CSV
+        whose first column names the source. Sources are planned up front, so an
+        unreadable file raises before anything is streamed. on_rows, if given, is
+        called with the file's position in inputs and the row count of each batch.
+        """
+        file_callbacks: List[Optional[Callable[[int], None]]] = [
+            partial(on_rows, index) if on_rows else None for index in range(len(inputs))
+        ]
+
+        if concatenate:
+            plans: List[Tuple[str, List[str], Iterator[DataFrame]]] = [
+                (name, *MergeService.plan_merge(guideline_path, input_path, custom_mappings, sheet_index))
+                for name, input_path, custom_mappings, sheet_index in inputs
+            ]
+            headers: List[str] = [SOURCE_FILE_COLUMN] + (plans[0][1] if plans else [])
+            sources: List[Iterator[str]] = [
+                MergeService._iter_csv_rows(MergeService._counted(MergeService._with_source(name, batches), callback))
+                for (name, _, batches), callback in zip(plans, file_callbacks)
+            ]
+            return MergeService._iter_concatenated(headers, sources, workers)
 
-            # Combine with custom mappings if provided
-            all_mappings = {**auto_mappings}
-            if custom_mappings:
-                all_mappings.update(custom_mappings)
-
-            # Create a new DataFrame with the guideline columns
-            result_df = pd.DataFrame(columns=guideline_df.columns, index=range(len(input_df)))
-
-            # Fill all columns with empty strings initially
-            for col in result_df.columns:
-                result_df[col] = ''
-
-            # Copy mapped columns from input_df to result_df
-            for input_col, guideline_col in all_mappings.items():
-                if input_col in input_df.columns and guideline_col in result_df.columns:
-                    result_df[guideline_col] = (
-                        MergeService._format_date_column(input_df[input_col])
-                        if input_col in date_columns
-                        else input_df[input_col].fillna('').astype(str)
+        sources = [
+            MergeService.iter_merge(guideline_path, input_path, custom_mappings, engine, callback, sheet_index)
+            for (_, input_path, custom_mappings, sheet_index), callback in zip(inputs, file_callbacks)
+        ]
+        return iter_zip(zip(
+            MergeService.unique_names([
+                f'{os.path.splitext(os.path.basename(name))[0]}.csv' for name, _, _, _ in inputs
+            ]),
+            iter_prefetched(sources, workers, MERGE_ALL_QUEUE_CHUNKS)
+        ))
+
+    @staticmethod
+    def _iter_concatenated(headers: List[str], sources: List[Iterator[str]], workers: int) -> Iterator[str]:
+        yield pd.DataFrame(columns=headers).to_csv(index=False)
+        for chunks in iter_prefetched(sources, workers, MERGE_ALL_QUEUE_CHUNKS):
+            yield from chunks
+
+    @staticmethod
+    def _with_source(name: str, batches: Iterator[DataFrame]) -> Iterator[DataFrame]:
+        for batch in batches:
+            batch.insert(0, SOURCE_FILE_COLUMN, name, allow_duplicates=True)
+            yield batch
+
+    @staticmethod
+    def _counted(batches: Iterator[DataFrame], on_rows: Optional[Callable[[int], None]]) -> Iterator[DataFrame]:
+        if on_rows is None:
+            yield from batches
+            return
+        for batch in batches:
+            yield batch
+            on_rows(len(batch))
+
+    @staticmethod
+    def _metered(batches: Iterator[DataFrame], on_rows: Optional[Callable[[int], None]]) -> Iterator[DataFrame]:
+        for batch in MergeService._counted(batches, on_rows):
+            MetricsService.inc('rows_total', len(batch), stage='merge')
+            yield batch
+
+    @staticmethod
+    def unique_names(names: List[str]) -> List[str]:
+        seen: Dict[str, int] = {}
+        unique: List[str] = []
+        for name in names:
+            count = seen.get(name, 0)
+            seen[name] = count + 1
+            if count:
+                stem, extension = os.path.splitext(name)
+                name = f'{stem} ({count + 1}){extension}'
+            unique.append(name)
+        return unique
+
+    @staticmethod
+    def _iter_input_batches(input_path: str, input_headers: List[str], sheet_index: int = 0) -> Iterator[DataFrame]:
+        """Read the workbook sheet from its columnar cache, parsing (and caching) it on first use."""
+        cached = CacheService.read_batches(input_path, sheet_index)
+        MetricsService.cache_lookup('workbook', cached is not None)
+        if cached is not None:
+            return cached
+        return MergeService._parse_input_batches(input_path, input_headers, sheet_index)
+
+    @staticmethod
+    def _parse_input_batches(input_path: str, input_headers: List[str], sheet_index: int = 0) -> Iterator[DataFrame]:
+        batches: Iterator[DataFrame] = FileService.iter_input_batches(input_path, sheet_index=sheet_index)
+        return CacheService.write_through(
+            input_path, input_headers, MetricsService.timed('parse', batches), sheet_index
+        )
+
+    @staticmethod
+    def _resolve_mappings(
+        input_headers: List[str],
+        guideline: Guideline,
+        custom_mappings: Dict[str, str] = None
+    ) -> Dict[str, str]:
+        """Automatic mappings combined with custom ones, restricted to columns present on both sides."""
+        all_mappings = MergeService._get_automatic_mappings(input_headers, guideline)
+        if custom_mappings:
+            all_mappings.update(custom_mappings)
+
+        input_set = set(input_headers)
+        return {
+            input_col: guideline_col for input_col, guideline_col in all_mappings.items()
+            if input_col in input_set and guideline_col in guideline.header_set
+        }
+
+    @staticmethod
+    def _iter_merged_batches(plan: MergePlan, input_batches: Iterator[DataFrame]) -> Iterator[DataFrame]:
+        """Remap each batch of input rows onto the guideline columns, as strings."""
+        date_formats: Dict[str, Optional[str]] = {}
+
+        for input_batch in input_batches:
+            with MetricsService.stage('mapping'):
+                result_df = pd.DataFrame('', columns=plan.headers, index=input_batch.index)
+
+                for input_col, guideline_col in plan.mappings.items():
+                    values = input_batch[input_col]
+                    if input_col in plan.date_columns:
+                        with MetricsService.stage('dates'):
+                            result_df[guideline_col] = MergeService._format_date_column(values, date_formats)
+                    else:
+                        result_df[guideline_col] = values.where(values.notna(), '').astype(str)
+
+            yield result_df
+
+    @staticmethod
+    def _iter_input_record_batches(
+        input_path: str,
+        input_headers: List[str],
+        sheet_index: int = 0
+    ) -> Iterator[pa.RecordBatch]:
+        """Arrow counterpart of _iter_input_batches: cached batches are zero-copy views of the memory map."""
+        cached = CacheService.read_record_batches(input_path, sheet_index)
+        MetricsService.cache_lookup('workbook', cached is not None)
+        if cached is not None:
+            return cached
+        return (
+            CacheService.to_record_batch(batch)
+            for batch in MergeService._parse_input_batches(input_path, input_headers, sheet_index)
+        )
+
+    @staticmethod
+    def _iter_arrow_csv(
+        input_path: str,
+        input_headers: List[str],
+        plan: MergePlan,
+        sheet_index: int = 0,
+        on_rows: Optional[Callable[[int], None]] = None
+    ) -> Iterator[str]:
+        """Arrow merge engine: output batches are assembled from the input column arrays without
+        copying them, unmapped columns are all-null arrays, and rows are written by Arrow's CSV writer.
+        """
+        yield pd.DataFrame(columns=plan.headers).to_csv(index=False)
+
+        # Guideline column -> input column feeding it (the last mapping wins, as in the pandas engine)
+        sources: Dict[str, str] = {guideline_col: input_col for input_col, guideline_col in plan.mappings.items()}
+        date_formats: Dict[str, Optional[str]] = {}
+
+        try:
+            for record_batch in MergeService._iter_input_record_batches(input_path, input_headers, sheet_index):
+                with MetricsService.stage('mapping'):
+                    columns = dict(zip(record_batch.schema.names, record_batch.columns))
+                    empty = pa.nulls(record_batch.num_rows, pa.string())
+                    arrays: List[pa.Array] = []
+                    for header in plan.headers:
+                        input_col = sources.get(header)
+                        if input_col is None:
+                            arrays.append(empty)
+                        elif input_col in plan.date_columns:
+                            with MetricsService.stage('dates'):
+                                dates = MergeService._format_date_column(
+                                    columns[input_col].to_pandas().rename(input_col), date_formats
+                                )
+                                arrays.append(pa.array(dates.where(dates != '', None), type=pa.string()))
+                        else:
+                            arrays.append(columns[input_col])
+
+                with MetricsService.stage('csv'):
+                    chunk: str = MergeService._write_arrow_csv(
+                        pa.RecordBatch.from_arrays(arrays, names=plan.headers)
                     )
+                MetricsService.inc('rows_total', record_batch.num_rows, stage='merge')
+                yield chunk
+                if on_rows:
+                    on_rows(record_batch.num_rows)
+        except Exception as e:
+            print(f"Error in merge_files: {str(e)}")
+            raise
+
+    @staticmethod
+    def _write_arrow_csv(record_batch: pa.RecordBatch) -> str:
+        """CSV rows of a batch of strings, every non-null value quoted.
+
+        Arrow's writer can quote every string or none of them, and checking each
+        batch for commas, quotes and newlines costs more than writing it.
+        """
+        import pyarrow.csv as pa_csv
 
-            # Convert to CSV with specific encoding and date format
-            output = StringIO()
-            result_df.to_csv(output, index=False, date_format='%Y-%m-%d')
-            output.seek(0)
-            return output.getvalue()
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(record_batch, sink, pa_csv.WriteOptions(include_header=False, quoting_style='needed'))
+        return sink.getvalue().to_pybytes().decode('utf-8')
 
+    @staticmethod
+    def _iter_csv(headers: List[str], batches: Iterator[DataFrame]) -> Iterator[str]:
+        """Serialize batches as CSV, starting with the header line before any rows are read."""
+        yield pd.DataFrame(columns=headers).to_csv(index=False)
+        yield from MergeService._iter_csv_rows(batches)
+
+    @staticmethod
+    def _iter_csv_rows(batches: Iterator[DataFrame]) -> Iterator[str]:
+        try:
+            for batch in batches:
+                with MetricsService.stage('csv'):
+                    chunk: str = batch.to_csv(index=False, header=False)
+                MetricsService.inc('rows_total', len(batch), stage='merge')
+                yield chunk
         except Exception as e:
             print(f"Error in merge_files: {str(e)}")
             raise
 
     @staticmethod
-    def compare_headers(guideline_df: DataFrame, input_df: DataFrame) -> Dict[str, List[str]]:
-        """Compare headers between guideline and input dataframes."""
-        guideline_headers = set(guideline_df.columns)
-        input_headers = list(input_df.columns)
+    def _header_list(source: DataFrame | Guideline | Sequence[str]) -> List[str]:
+        if isinstance(source, DataFrame):
+            return list(source.columns)
+        if isinstance(source, Guideline):
+            return source.headers
+        return list(source)
+
+    @staticmethod
+    def compare_headers(
+        guideline: DataFrame | Guideline | Sequence[str],
+        input_data: DataFrame | Sequence[str],
+        custom_mappings: Dict[str, str] = None
+    ) -> Dict[str, List[str]]:
+        """Compare headers between guideline and input (dataframes, a registered guideline or header lists).
+
+        Input headers with a custom mapping onto a guideline header count as matched.
+        """
+        with MetricsService.stage('compare'):
+            return MergeService._compare_headers(guideline, input_data, custom_mappings)
+
+    @staticmethod
+    def check_values(
+        guideline: Guideline,
+        input_path: str,
+        custom_mappings: Dict[str, str] = None,
+        sheet_index: int = 0
+    ) -> Dict:
+        """Count the values of each mapped column that break its guideline type or allowed values.
+
+        The sheet is checked batch by batch with column-wise (vectorized) checks,
+        parsing it into the workbook cache if needed, so a later merge reuses the
+        parse. Nothing is read when the guideline declares no checks. Returns
+        rows_checked and, for each column with invalid values, its invalid count
+        and the first VALUE_CHECK_SAMPLE_ROWS row numbers and values (rows
+        numbered as in the sheet, the header being row 1).
+        """
+        input_headers: List[str] = FileService.read_input_headers(input_path, sheet_index)
+        plan: MergePlan = MergeService.merge_plan(guideline, input_headers, custom_mappings)
+        checks: Dict[str, str] = {
+            input_col: guideline_col for input_col, guideline_col in plan.mappings.items()
+            if guideline_col in guideline.checked_columns
+        }
+        counts: Dict[str, int] = dict.fromkeys(checks, 0)
+        samples: Dict[str, List[Tuple[int, str]]] = {input_col: [] for input_col in checks}
+        date_formats: Dict[str, Optional[str]] = {}
+        rows: int = 0
+
+        if checks:
+            for batch in MergeService._iter_input_batches(input_path, input_headers, sheet_index):
+                with MetricsService.stage('check'):
+                    for input_col, guideline_col in checks.items():
+                        invalid: np.ndarray = MergeService._invalid_values(
+                            batch[input_col], guideline, guideline_col, date_formats
+                        )
+                        count: int = int(invalid.sum())
+                        if not count:
+                            continue
+                        counts[input_col] += count
+                        wanted: int = VALUE_CHECK_SAMPLE_ROWS - len(samples[input_col])
+                        positions: np.ndarray = np.flatnonzero(invalid)[:max(wanted, 0)]
+                        samples[input_col].extend(zip(
+                            (rows + positions + 2).tolist(), batch[input_col].iloc[positions].astype(str).tolist()
+                        ))
+                rows += len(batch)
+                MetricsService.inc('rows_total', len(batch), stage='check')
+
+        return {
+            'rows_checked': rows,
+            'columns': [
+                {
+                    'column': guideline_col,
+                    'input_column': input_col,
+                    'type': guideline.column_types.get(guideline_col),
+                    'allowed': sorted(guideline.allowed_values.get(guideline_col, ())),
+                    'invalid': counts[input_col],
+                    'rows': [row for row, _ in samples[input_col]],
+                    'values': [value for _, value in samples[input_col]]
+                }
+                for input_col, guideline_col in checks.items() if counts[input_col]
+            ]
+        }
+
+    @staticmethod
+    def _invalid_values(
+        values: pd.Series,
+        guideline: Guideline,
+        guideline_col: str,
+        date_formats: Dict[str, Optional[str]]
+    ) -> np.ndarray:
+        """Mask of the non-blank values that do not fit the column's declared type and allowed values."""
+        present: pd.Series = values.notna() & (values != '')
+        invalid: pd.Series = pd.Series(False, index=values.index)
+
+        column_type: Optional[str] = guideline.column_types.get(guideline_col)
+        if column_type in (COLUMN_TYPE_INTEGER, COLUMN_TYPE_NUMBER):
+            # Numbers and numeric text (surrounding spaces allowed) parse in one pass
+            numbers: pd.Series = pd.to_numeric(values.where(present), errors='coerce')
+            invalid |= numbers.isna()
+            if column_type == COLUMN_TYPE_INTEGER:
+                invalid |= numbers % 1 != 0
+        elif column_type == COLUMN_TYPE_DATE:
+            invalid |= MergeService._parse_dates(values.where(present), date_formats).isna()
+
+        allowed: Optional[frozenset] = guideline.allowed_values.get(guideline_col)
+        if allowed:
+            invalid |= ~values.astype(str).str.strip().isin(allowed)
+
+        invalid &= present
+        if invalid.any():
+            # Whitespace-only cells are blank too; only the few flagged values need a look
+            flagged: pd.Series = values[invalid]
+            invalid.loc[flagged.index[flagged.astype(str).str.strip() == '']] = False
+        return invalid.to_numpy()
+
+    @staticmethod
+    def _compare_headers(
+        guideline: DataFrame | Guideline | Sequence[str],
+        input_data: DataFrame | Sequence[str],
+        custom_mappings: Dict[str, str] = None
+    ) -> Dict[str, List[str]]:
+        guideline_headers = set(MergeService._header_list(guideline))
+        input_headers = MergeService._header_list(input_data)
 
         # Get automatic mappings
-        auto_mappings = MergeService._get_automatic_mappings(input_headers, list(guideline_headers))
+        auto_mappings = MergeService._get_automatic_mappings(
+            input_headers,
+            guideline if isinstance(guideline, Guideline) else guideline_headers
+        )
+        if custom_mappings:
+            auto_mappings = {**auto_mappings, **custom_mappings}
 
         # Find matched headers (both direct matches and through conversion)
         converted_headers = {auto_mappings.get(h, h) for h in input_headers}
@@ -0,0 +1,184 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from app.utils.constants import METRICS_PREFIX, METRICS_BUCKETS
+
+T = TypeVar('T')
+
+# name -> (type, help)
+_METRICS: Dict[str, Tuple[str, str]] = {
+    'request_seconds': ('histogram', 'Request latency, including streaming the response body'),
+    'stage_seconds': ('histogram', 'Time spent in each processing stage'),
+    'rows_total': ('counter', 'Rows processed, by stage'),
+    'bytes_total': ('counter', 'Bytes received as uploads and sent as merged output'),
+    'cache_requests_total': ('counter', 'Cache lookups, by cache and result'),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_local: threading.local = threading.local()
+
+# Stage timings of the current request (None outside requests)
+_request_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    'request_stages', default=None
+)
+
+
+class MetricsService:
+    """In-process metrics in the Prometheus text format, and per-request stage timings.
+
+    Stages nest, and a stage's time excludes the stages run inside it (the parse
+    done while a merge pulls its next batch counts as parse, not as mapping).
+    Stages are timed where they run: a stage that runs while a response body
+    streams (date formatting and CSV serialization of a merge) is counted in the
+    histograms, but is too late for that response's Server-Timing header. Stages
+    run in the validation worker processes are only seen as the parent's
+    validate stage. Metrics are per process.
+    """
+    _histograms: Dict[Tuple[str, Labels], List[float]] = {}
+    _counters: Dict[Tuple[str, Labels], float] = {}
+    _lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def observe(name: str, value: float, **labels: str) -> None:
+        """Add an observation to a histogram: per-bucket counts, then the sum and the count."""
+        key = (name, tuple(sorted(labels.items())))
+        with MetricsService._lock:
+            values: Optional[List[float]] = MetricsService._histograms.get(key)
+            if values is None:
+                values = MetricsService._histograms[key] = [0.0] * (len(METRICS_BUCKETS) + 2)
+            values[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    @staticmethod
+    def inc(name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with MetricsService._lock:
+            MetricsService._counters[key] = MetricsService._counters.get(key, 0) + amount
+
+    @staticmethod
+    def cache_lookup(cache: str, hit: bool) -> None:
+        MetricsService.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+    @staticmethod
+    @contextmanager
+    def stage(name: str) -> Iterator[None]:
+        """Time a block as a processing stage."""
+        MetricsService._stack().append(0.0)
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            MetricsService._record_stage(name, MetricsService._pop(time.perf_counter() - start))
+
+    @staticmethod
+    def timed(name: str, items: Iterable[T]) -> Iterator[T]:
+        """Pass items through, timing the work done producing them as one stage."""
+        iterator: Iterator[T] = iter(items)
+        elapsed: float = 0.0
+        try:
+            while True:
+                MetricsService._stack().append(0.0)
+                start: float = time.perf_counter()
+                try:
+                    item: T = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += MetricsService._pop(time.perf_counter() - start)
+                yield item
+        finally:
+            MetricsService._record_stage(name, elapsed)
+
+    @staticmethod
+    def _stack() -> List[float]:
+        # Time spent in stages nested in each open stage of this thread
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        return _local.stack
+
+    @staticmethod
+    def _pop(total: float) -> float:
+        """Close the innermost stage; returns its own time, excluding the stages nested in it."""
+        stack: List[float] = MetricsService._stack()
+        nested: float = stack.pop()
+        if stack:
+            stack[-1] += total
+        return total - nested
+
+    @staticmethod
+    def _record_stage(name: str, seconds: float) -> None:
+        MetricsService.observe('stage_seconds', seconds, stage=name)
+        stages: Optional[Dict[str, float]] = _request_stages.get()
+        if stages is not None:
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    @staticmethod
+    def begin_request() -> None:
+        _request_stages.set({})
+
+    @staticmethod
+    def request_stages() -> Dict[str, float]:
+        """Seconds per stage so far in the current request."""
+        return dict(_request_stages.get() or {})
+
+    @staticmethod
+    def server_timing(stages: Dict[str, float], total: Optional[float] = None) -> str:
+        """A Server-Timing header value (durations in milliseconds)."""
+        entries: List[str] = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(entries)
+
+    @staticmethod
+    def render() -> str:
+        """Every metric in the Prometheus text exposition format."""
+        with MetricsService._lock:
+            histograms = {key: list(values) for key, values in MetricsService._histograms.items()}
+            counters = dict(MetricsService._counters)
+
+        lines: List[str] = []
+        for name, (kind, help_text) in _METRICS.items():
+            full_name: str = f"{METRICS_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), values in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative: float = 0
+                    for bound, count in zip(METRICS_BUCKETS + [float('inf')], values):
+                        cumulative += count
+                        le: str = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f"{full_name}_bucket{_labels(labels + (('le', le),))} {_number(cumulative)}")
+                    lines.append(f"{full_name}_sum{_labels(labels)} {_number(values[-2])}")
+                    lines.append(f"{full_name}_count{_labels(labels)} {_number(values[-1])}")
+            else:
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{full_name}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def reset() -> None:
+        with MetricsService._lock:
+            MetricsService._histograms.clear()
+            MetricsService._counters.clear()
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        (key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
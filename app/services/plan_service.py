@@ -0,0 +1,119 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Collection, Dict, List, Optional
+
+from app.utils.constants import MERGE_PLANS_DB_PATH, MERGE_PLAN_REFRESH_SECONDS, COLUMN_TYPE_DATE
+from app.utils.database import Database
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS merge_plans (
+    guideline_hash TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (guideline_hash, input_hash)
+);
+"""
+
+
+class MergePlan:
+    """How one input header layout merges onto one guideline, compiled once and reused.
+
+    headers is the output column order, mappings the input column feeding each
+    mapped guideline column and converters the conversion applied to each mapped
+    input column (COLUMN_TYPE_DATE or COLUMN_TYPE_TEXT). custom_mappings are the
+    mappings made by hand that went into it; rules identifies the header
+    conversions and date columns it was compiled with.
+    """
+
+    def __init__(
+        self,
+        headers: List[str],
+        mappings: Dict[str, str],
+        converters: Dict[str, str],
+        custom_mappings: Optional[Dict[str, str]] = None,
+        rules: str = ''
+    ) -> None:
+        self.headers: List[str] = headers
+        self.mappings: Dict[str, str] = mappings
+        self.converters: Dict[str, str] = converters
+        self.custom_mappings: Dict[str, str] = custom_mappings or {}
+        self.rules: str = rules
+        self.date_columns: frozenset = frozenset(
+            input_col for input_col, converter in converters.items() if converter == COLUMN_TYPE_DATE
+        )
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'headers': self.headers,
+            'mappings': self.mappings,
+            'converters': self.converters,
+            'custom_mappings': self.custom_mappings,
+            'rules': self.rules
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> 'MergePlan':
+        return cls(**json.loads(data))
+
+
+class PlanService:
+    """Merge plans kept in SQLite, keyed by the guideline's content hash and a hash of the input headers.
+
+    Files exported with the same layout share one plan, so after the first they
+    merge without resolving mappings again, with the custom mappings saved in it.
+    Plans are read from the database on each lookup, so every worker process
+    sees mappings saved by the others. A plan read is marked as used at most
+    every MERGE_PLAN_REFRESH_SECONDS; plans unused for longer than the janitor's
+    plan TTL are purged by purge.
+    """
+    _database: Database = Database(MERGE_PLANS_DB_PATH, _SCHEMA)
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        return PlanService._database.connect()
+
+    @staticmethod
+    def header_hash(headers: List[str]) -> str:
+        """SHA-256 of a header row, order included."""
+        return hashlib.sha256(json.dumps(headers).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def rules_hash(conversions_signature: str, date_columns: Collection[str]) -> str:
+        """Identifies the rules plans are compiled with; plans compiled under other rules are recompiled."""
+        return hashlib.sha256(json.dumps([conversions_signature, sorted(date_columns)]).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get(guideline_hash: str, input_hash: str) -> Optional[MergePlan]:
+        connection: sqlite3.Connection = PlanService._connect()
+        row: Optional[sqlite3.Row] = connection.execute(
+            "SELECT plan, updated FROM merge_plans WHERE guideline_hash = ? AND input_hash = ?",
+            (guideline_hash, input_hash)
+        ).fetchone()
+        if row is None:
+            return None
+        now: float = time.time()
+        if now - row['updated'] > MERGE_PLAN_REFRESH_SECONDS:
+            with connection:
+                connection.execute(
+                    "UPDATE merge_plans SET updated = ? WHERE guideline_hash = ? AND input_hash = ?",
+                    (now, guideline_hash, input_hash)
+                )
+        return MergePlan.from_json(row['plan'])
+
+    @staticmethod
+    def put(guideline_hash: str, input_hash: str, plan: MergePlan) -> None:
+        with PlanService._connect() as connection:
+            connection.execute(
+                "INSERT INTO merge_plans (guideline_hash, input_hash, plan, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (guideline_hash, input_hash) DO UPDATE SET plan = excluded.plan, updated = excluded.updated",
+                (guideline_hash, input_hash, plan.to_json(), time.time())
+            )
+
+    @staticmethod
+    def purge(before: float) -> None:
+        """Forget plans, and the mappings saved in them, last used before the given time."""
+        with PlanService._connect() as connection:
+            connection.execute("DELETE FROM merge_plans WHERE updated < ?", (before,))
@@ -0,0 +1,100 @@
+import cProfile
+import hmac
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Iterable, Iterator, List, Optional
+
+from app.utils.constants import (
+    PROFILING_ENABLED, PROFILING_TOKEN, PROFILES_FOLDER, PROFILING_TRACEMALLOC_FRAMES, PROFILING_TOP_ALLOCATIONS
+)
+
+
+class ProfileCapture:
+    """cProfile and tracemalloc capture of one request, written to PROFILES_FOLDER when finished.
+
+    <id>.prof is a pstats dump (python -m pstats, snakeviz), <id>.alloc.txt the
+    top allocations by line. cProfile only sees the thread that started the
+    capture; tracemalloc sees the whole process.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.profile_id: str = f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{uuid.uuid4().hex[:8]}"
+        self._profile: cProfile.Profile = cProfile.Profile()
+        self._started_tracing: bool = False
+        self._finished: bool = False
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILING_TRACEMALLOC_FRAMES)
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._profile.enable()
+
+    def wrap(self, chunks: Iterable) -> Iterator:
+        """Pass a streamed body through, finishing the capture once it has been sent."""
+        try:
+            yield from chunks
+        finally:
+            self.finish()
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            self._profile.disable()
+            snapshot: tracemalloc.Snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            _, peak = tracemalloc.get_traced_memory()
+            if self._started_tracing:
+                tracemalloc.stop()
+
+            os.makedirs(PROFILES_FOLDER, exist_ok=True)
+            base_path: str = os.path.join(PROFILES_FOLDER, self.profile_id)
+            self._profile.dump_stats(f"{base_path}.prof")
+
+            lines: List[str] = [f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB", '']
+            for index, stat in enumerate(snapshot.statistics('lineno')[:PROFILING_TOP_ALLOCATIONS], 1):
+                frame = stat.traceback[0]
+                lines.append(
+                    f"#{index}: {frame.filename}:{frame.lineno}: {stat.size / 1024:.1f} KiB in {stat.count} blocks"
+                )
+            with open(f"{base_path}.alloc.txt", 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            print(f"Profile written to {base_path}.prof")
+        except Exception as e:
+            print(f"Error writing profile {self.profile_id}: {str(e)}")
+        finally:
+            ProfilingService._busy.release()
+
+
+class ProfilingService:
+    """Opt-in profiling of single requests, for finding out why one workbook is slow.
+
+    Profiling needs PROFILING_ENABLED and a request carrying PROFILING_TOKEN. One
+    request is profiled at a time; others asking meanwhile run unprofiled.
+    """
+    _busy: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def begin(name: str, token: Optional[str]) -> Optional[ProfileCapture]:
+        """Start a capture if profiling is enabled and the token is the admin token, else None."""
+        if not (PROFILING_ENABLED and PROFILING_TOKEN and token):
+            return None
+        if not hmac.compare_digest(token.encode('utf-8'), PROFILING_TOKEN.encode('utf-8')):
+            return None
+        if not ProfilingService._busy.acquire(blocking=False):
+            return None
+
+        capture: ProfileCapture = ProfileCapture(name)
+        try:
+            capture.start()
+        except Exception:
+            ProfilingService._busy.release()
+            raise
+        return capture
@@ -0,0 +1,189 @@
+import json
+import secrets
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from flask import Flask, Request, Response
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+from app.utils.constants import SESSIONS_DB_PATH, SESSION_REFRESH_SECONDS, SESSION_GUIDELINE_PATH
+from app.utils.database import Database
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_files (
+    session_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (session_id, file_id)
+);
+CREATE INDEX IF NOT EXISTS session_files_order ON session_files (session_id, position);
+"""
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data kept in SQLite; the cookie only carries its id."""
+
+    def __init__(self, sid: str, initial: Optional[Dict[str, Any]] = None, updated: Optional[float] = None) -> None:
+        def on_update(self) -> None:
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid: str = sid
+        # When the stored session was last written (None for a new one)
+        self.updated: Optional[float] = updated
+        self.modified: bool = False
+        self.accessed: bool = False
+
+    def __getitem__(self, key: str) -> Any:
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class SessionService(SessionInterface):
+    """Server-side sessions in SQLite, with each session's saved files indexed by file id.
+
+    Requests carry only a random session id, however many files a session holds.
+    File records live in their own table rather than in the session data, so a
+    merge looks up its file by primary key without loading the others. Sessions
+    unused for longer than the janitor's TTL are purged by purge.
+    """
+    _database: Database = Database(SESSIONS_DB_PATH, _SCHEMA)
+
+    def __init__(self) -> None:
+        # Create the schema when the app is created rather than on its first request
+        SessionService._connect()
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        return SessionService._database.connect()
+
+    @staticmethod
+    def _write(statements: List[tuple]) -> None:
+        with SessionService._connect() as connection:
+            for sql, params in statements:
+                connection.execute(sql, params)
+
+    def open_session(self, app: Flask, request: Request) -> ServerSession:
+        sid: Optional[str] = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row: Optional[sqlite3.Row] = SessionService._connect().execute(
+                "SELECT data, updated FROM sessions WHERE id = ?", (sid,)
+            ).fetchone()
+            if row is not None:
+                return ServerSession(sid, session_json_serializer.loads(row['data']), row['updated'])
+        return ServerSession(secrets.token_urlsafe(32))
+
+    def save_session(self, app: Flask, session: ServerSession, response: Response) -> None:
+        name: str = self.get_cookie_name(app)
+        domain: Optional[str] = self.get_cookie_domain(app)
+        path: str = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified:
+                SessionService.clear(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now: float = time.time()
+        if session.modified:
+            SessionService._write([(
+                "INSERT INTO sessions (id, data, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+                (session.sid, session_json_serializer.dumps(dict(session)), now)
+            )])
+        elif session.updated is not None and now - session.updated > SESSION_REFRESH_SECONDS:
+            # Keep a session that is only being read from expiring
+            SessionService._write([("UPDATE sessions SET updated = ? WHERE id = ?", (now, session.sid))])
+        else:
+            return
+
+        if session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+    @staticmethod
+    def set_files(session_id: str, records: List[Dict[str, Any]]) -> None:
+        """Replace a session's saved files (records with an 'id'), keeping their order."""
+        SessionService._write(
+            # The session row may only be written at the end of the request; files must not outlive it
+            [("INSERT OR IGNORE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+              (session_id, session_json_serializer.dumps({}), time.time())),
+             ("DELETE FROM session_files WHERE session_id = ?", (session_id,))]
+            + [("INSERT INTO session_files (session_id, file_id, position, record) VALUES (?, ?, ?, ?)",
+                (session_id, record['id'], position, json.dumps(record)))
+               for position, record in enumerate(records)]
+        )
+
+    @staticmethod
+    def get_file(session_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        """One saved file of a session by id, or None."""
+        row: Optional[sqlite3.Row] = SessionService._connect().execute(
+            "SELECT record FROM session_files WHERE session_id = ? AND file_id = ?", (session_id, file_id)
+        ).fetchone()
+        return json.loads(row['record']) if row is not None else None
+
+    @staticmethod
+    def list_files(session_id: str) -> List[Dict[str, Any]]:
+        """A session's saved files, in upload order."""
+        rows: List[sqlite3.Row] = SessionService._connect().execute(
+            "SELECT record FROM session_files WHERE session_id = ? ORDER BY position", (session_id,)
+        ).fetchall()
+        return [json.loads(row['record']) for row in rows]
+
+    @staticmethod
+    def file_paths() -> Set[str]:
+        """Paths of every file held by a stored session: saved files and guidelines."""
+        connection: sqlite3.Connection = SessionService._connect()
+        paths: Set[str] = {
+            json.loads(row['record']).get('path')
+            for row in connection.execute("SELECT record FROM session_files")
+        }
+        paths.update(
+            session_json_serializer.loads(row['data']).get(SESSION_GUIDELINE_PATH)
+            for row in connection.execute("SELECT data FROM sessions")
+        )
+        paths.discard(None)
+        return paths
+
+    @staticmethod
+    def clear(session_id: str) -> None:
+        SessionService._write([
+            ("DELETE FROM session_files WHERE session_id = ?", (session_id,)),
+            ("DELETE FROM sessions WHERE id = ?", (session_id,)),
+        ])
+
+    @staticmethod
+    def purge(before: float) -> None:
+        """Forget sessions last used before the given time."""
+        SessionService._write([
+            ("DELETE FROM session_files WHERE session_id IN (SELECT id FROM sessions WHERE updated < ?)", (before,)),
+            ("DELETE FROM sessions WHERE updated < ?", (before,)),
+        ])
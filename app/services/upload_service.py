@@ -0,0 +1,212 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from werkzeug.utils import secure_filename
+
+from app.services.blob_service import BlobService
+from app.services.file_service import FileService
+from app.utils.constants import (
+    UPLOAD_FOLDER, UPLOAD_STATE_EXTENSION, UPLOAD_CHUNK_BYTES, RESUMABLE_UPLOAD_MAX_BYTES, UPLOAD_HASHES_MAX,
+    MSG_UPLOAD_NOT_FOUND, MSG_UPLOAD_INCOMPLETE, MSG_UPLOAD_TOO_LARGE, MSG_CHECKSUM_MISMATCH,
+    MSG_INVALID_INPUT_FILE
+)
+
+
+class OffsetMismatch(ValueError):
+    """A chunk was sent for an offset other than the current end of the upload."""
+
+    def __init__(self, offset: int) -> None:
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset: int = offset
+
+
+class UploadService:
+    """Resumable uploads: chunks are appended straight to the input file's final path.
+
+    Each upload has a small JSON state file next to it. The current offset is
+    the file's size on disk, so a client that loses its connection asks for the
+    offset and resends from there. The SHA-256 is computed as chunks arrive; a
+    process that did not see the earlier chunks (a restart, another worker)
+    catches up by hashing only the bytes it has not seen.
+
+    Chunks of one upload may reach different worker processes, so the offset
+    check and the write happen under an exclusive flock on the upload file.
+    Running hashes are kept for the UPLOAD_HASHES_MAX most recently used
+    uploads; an abandoned upload's falls out, and is rebuilt from disk if it
+    resumes.
+    """
+    # upload id -> (running hash, number of bytes it covers), least recently used first
+    _hashes: "OrderedDict[str, Tuple[hashlib._Hash, int]]" = OrderedDict()
+    _lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def create(filename: str, size: Optional[int] = None) -> Dict:
+        """Start an upload of an input file; size, if given, is checked on completion."""
+        if not filename or not FileService.allowed_input_file(filename):
+            raise ValueError(MSG_INVALID_INPUT_FILE)
+        if size is not None and (size < 0 or size > RESUMABLE_UPLOAD_MAX_BYTES):
+            raise ValueError(MSG_UPLOAD_TOO_LARGE)
+
+        upload_id: str = str(uuid.uuid4())
+        state: Dict = {'filename': filename, 'size': size, 'complete': False, 'sha256': None}
+        open(UploadService._data_path(upload_id, filename), 'wb').close()
+        UploadService._write_state(upload_id, state)
+        return UploadService.status(upload_id)
+
+    @staticmethod
+    def status(upload_id: str) -> Dict:
+        state: Dict = UploadService._read_state(upload_id)
+        return {
+            'upload_id': upload_id,
+            'filename': state['filename'],
+            'offset': os.path.getsize(UploadService._data_path(upload_id, state['filename'])),
+            'size': state['size'],
+            'complete': state['complete'],
+            'sha256': state['sha256']
+        }
+
+    @staticmethod
+    def append(upload_id: str, offset: int, stream: BinaryIO) -> int:
+        """Append the stream at offset, which must be the current end of the upload; returns the new offset.
+
+        Whatever part of the chunk arrives is kept, so after a dropped connection
+        the client resumes from the offset reported by status.
+        """
+        state: Dict = UploadService._read_state(upload_id)
+        if state['complete']:
+            raise ValueError(MSG_UPLOAD_NOT_FOUND)
+        path: str = UploadService._data_path(upload_id, state['filename'])
+
+        with UploadService._locked(path) as f:
+            # Checked under the lock: another process may have appended since the request started
+            current: int = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+
+            sha256 = UploadService._catch_up(upload_id, path, current)
+            written: int = 0
+            try:
+                while chunk := stream.read(UPLOAD_CHUNK_BYTES):
+                    if current + written + len(chunk) > RESUMABLE_UPLOAD_MAX_BYTES:
+                        raise ValueError(MSG_UPLOAD_TOO_LARGE)
+                    f.write(chunk)
+                    sha256.update(chunk)
+                    written += len(chunk)
+            finally:
+                f.flush()
+                UploadService._remember(upload_id, sha256, current + written)
+
+        return current + written
+
+    @staticmethod
+    def complete(upload_id: str, expected_sha256: Optional[str] = None) -> Dict:
+        """Finish an upload, checking the declared size and, if given, the client's SHA-256."""
+        state: Dict = UploadService._read_state(upload_id)
+        path: str = UploadService._data_path(upload_id, state['filename'])
+
+        with UploadService._locked(path) as f:
+            size: int = os.fstat(f.fileno()).st_size
+            if state['size'] is not None and size != state['size']:
+                raise ValueError(MSG_UPLOAD_INCOMPLETE)
+
+            digest: str = UploadService._catch_up(upload_id, path, size).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                raise ValueError(MSG_CHECKSUM_MISMATCH)
+
+            state.update(complete=True, sha256=digest, size=size)
+            UploadService._write_state(upload_id, state)
+        UploadService._forget(upload_id)
+
+        return UploadService.status(upload_id)
+
+    @staticmethod
+    def claim(upload_id: str) -> Tuple[str, str]:
+        """Take over a completed upload as an input file: returns its original name and path."""
+        state: Dict = UploadService._read_state(upload_id)
+        if not state['complete']:
+            raise ValueError(MSG_UPLOAD_INCOMPLETE)
+        os.remove(UploadService._state_path(upload_id))
+
+        # The checksum is already known, so the file joins the content-addressed store without rehashing
+        path: str = UploadService._data_path(upload_id, state['filename'])
+        BlobService.adopt(path, state['sha256'], path)
+        return state['filename'], path
+
+    @staticmethod
+    def _catch_up(upload_id: str, path: str, size: int) -> "hashlib._Hash":
+        with UploadService._lock:
+            sha256, hashed = UploadService._hashes.pop(upload_id, (None, 0))
+        if sha256 is None or hashed > size:
+            sha256, hashed = hashlib.sha256(), 0
+        if hashed < size:
+            with open(path, 'rb') as f:
+                f.seek(hashed)
+                while hashed < size and (chunk := f.read(min(UPLOAD_CHUNK_BYTES, size - hashed))):
+                    sha256.update(chunk)
+                    hashed += len(chunk)
+        UploadService._remember(upload_id, sha256, hashed)
+        return sha256
+
+    @staticmethod
+    def _remember(upload_id: str, sha256: "hashlib._Hash", hashed: int) -> None:
+        with UploadService._lock:
+            UploadService._hashes[upload_id] = (sha256, hashed)
+            UploadService._hashes.move_to_end(upload_id)
+            while len(UploadService._hashes) > UPLOAD_HASHES_MAX:
+                UploadService._hashes.popitem(last=False)
+
+    @staticmethod
+    def _forget(upload_id: str) -> None:
+        with UploadService._lock:
+            UploadService._hashes.pop(upload_id, None)
+
+    @staticmethod
+    @contextmanager
+    def _locked(path: str) -> Iterator[BinaryIO]:
+        """The upload file, positioned at its end, under an exclusive lock held across threads and processes."""
+        # Not opened with 'ab': that would recreate an upload file removed in the meantime
+        with open(path, 'r+b') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                yield f
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _state_path(upload_id: str) -> str:
+        try:
+            canonical: bool = str(uuid.UUID(upload_id)) == upload_id
+        except (TypeError, ValueError, AttributeError):
+            canonical = False
+        if not canonical:
+            raise ValueError(MSG_UPLOAD_NOT_FOUND)
+        return os.path.join(UPLOAD_FOLDER, f"{upload_id}{UPLOAD_STATE_EXTENSION}")
+
+    @staticmethod
+    def _data_path(upload_id: str, filename: str) -> str:
+        # Same layout as FileService.save_input_file, so the upload id doubles as the file id
+        return os.path.join(UPLOAD_FOLDER, f"{upload_id}_{secure_filename(filename)}")
+
+    @staticmethod
+    def _read_state(upload_id: str) -> Dict:
+        try:
+            with open(UploadService._state_path(upload_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            raise ValueError(MSG_UPLOAD_NOT_FOUND)
+
+    @staticmethod
+    def _write_state(upload_id: str, state: Dict) -> None:
+        path: str = UploadService._state_path(upload_id)
+        temp_path: str = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, path)
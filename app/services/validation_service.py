@@ -0,0 +1,176 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+from app.services.cache_service import CacheService
+from app.services.file_service import FileService
+from app.services.guideline_service import Guideline, GuidelineService
+from app.services.merge_service import MergeService
+from app.utils.constants import UPLOAD_WORKERS, UPLOAD_WORKER_START_METHOD, MSG_WORKER_CRASHED, MSG_ERROR, VALUE_CHECKS
+
+
+def validate_file(guideline_path: str, filepath: str) -> Dict:
+    """Compare each sheet's headers with the guideline (runs in a worker process).
+
+    Returns the comparison of the sheet picked by default (the one matching the
+    most guideline headers, the first on ties) with its index as 'sheet', and every
+    sheet's name, index and comparison as 'sheets'. Each sheet's merge plan is
+    compiled here if its layout is new; mappings saved in it count as matches and
+    are listed as 'saved_mappings'. Only header rows are read,
+    unless the guideline declares column types or allowed values: the picked
+    sheet's values are then checked too (VALUE_CHECKS, see MergeService.check_values).
+    """
+    guideline: Guideline = GuidelineService.load(guideline_path)
+    sheets: List[Dict] = []
+    for index, name in enumerate(FileService.list_sheets(filepath)):
+        input_headers: List[str] = FileService.read_input_headers(filepath, index)
+        saved: Dict[str, str] = MergeService.merge_plan(guideline, input_headers).custom_mappings
+        sheets.append({
+            'name': name,
+            'index': index,
+            **MergeService.compare_headers(guideline, input_headers, saved),
+            'saved_mappings': saved
+        })
+    if not sheets:
+        raise ValueError(MSG_ERROR)
+
+    chosen: Dict = max(sheets, key=lambda sheet: (len(sheet['matched_headers']), -sheet['index']))
+    result: Dict = {
+        'matched_headers': chosen['matched_headers'],
+        'missing_headers': chosen['missing_headers'],
+        'extra_headers': chosen['extra_headers'],
+        'saved_mappings': chosen['saved_mappings'],
+        'sheet': chosen['index'],
+        'sheets': sheets
+    }
+    if guideline.checked_columns:
+        result[VALUE_CHECKS] = MergeService.check_values(guideline, filepath, sheet_index=chosen['index'])
+    return result
+
+
+class ValidationService:
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_workers: int = 0
+    _lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def _get_executor(workers: int) -> ProcessPoolExecutor:
+        with ValidationService._lock:
+            if ValidationService._executor is None or ValidationService._executor_workers != workers:
+                ValidationService._shutdown_locked()
+                ValidationService._executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context(UPLOAD_WORKER_START_METHOD)
+                )
+                ValidationService._executor_workers = workers
+            return ValidationService._executor
+
+    @staticmethod
+    def _discard_executor(executor: ProcessPoolExecutor) -> None:
+        with ValidationService._lock:
+            if ValidationService._executor is executor:
+                ValidationService._shutdown_locked()
+
+    @staticmethod
+    def _shutdown_locked() -> None:
+        if ValidationService._executor is not None:
+            ValidationService._executor.shutdown(wait=False, cancel_futures=True)
+        ValidationService._executor = None
+        ValidationService._executor_workers = 0
+
+    @staticmethod
+    def shutdown() -> None:
+        with ValidationService._lock:
+            ValidationService._shutdown_locked()
+
+    @staticmethod
+    def validate_files(
+        guideline_path: str,
+        filepaths: List[str],
+        workers: int = UPLOAD_WORKERS,
+        on_result: Optional[Callable[[int, Dict[str, List[str]] | Exception], None]] = None
+    ) -> List[Dict[str, List[str]] | Exception]:
+        """
+        Validate input files against the guideline, in parallel when there is more than one.
+
+        Returns one entry per file, in input order: the header comparison, or the
+        exception raised while processing that file. on_result, if given, is called
+        with each file's index and entry as soon as that file is done.
+        """
+        report: Callable[[int, Dict[str, List[str]] | Exception], None] = on_result or (lambda index, result: None)
+        results: List[Dict[str, List[str]] | Exception] = [None] * len(filepaths)
+
+        # Files whose headers were read from an earlier upload of the same content need no worker
+        pooled: List[int] = [
+            index for index, filepath in enumerate(filepaths) if CacheService.read_headers(filepath) is None
+        ]
+        if workers <= 1 or len(pooled) <= 1:
+            pooled = []
+        pooled_set = set(pooled)
+        for index, filepath in enumerate(filepaths):
+            if index not in pooled_set:
+                results[index] = ValidationService._validate_inline(guideline_path, filepath)
+                report(index, results[index])
+        if not pooled:
+            return results
+
+        executor: ProcessPoolExecutor = ValidationService._get_executor(workers)
+        try:
+            futures: List[Future] = [executor.submit(validate_file, guideline_path, filepaths[index]) for index in pooled]
+        except BrokenProcessPool:
+            ValidationService._discard_executor(executor)
+            retried = ValidationService._validate_isolated(guideline_path, [filepaths[index] for index in pooled], workers)
+            for index, result in zip(pooled, retried):
+                results[index] = result
+                report(index, result)
+            return results
+
+        crashed: List[int] = []
+        for index, future in zip(pooled, futures):
+            try:
+                results[index] = future.result()
+            except BrokenProcessPool:
+                crashed.append(index)
+                continue
+            except Exception as e:
+                results[index] = e
+            report(index, results[index])
+
+        if crashed:
+            # A worker died and took the pool's pending files with it: retry those one
+            # at a time so only the file that actually crashes is reported
+            ValidationService._discard_executor(executor)
+            retried = ValidationService._validate_isolated(
+                guideline_path, [filepaths[index] for index in crashed], workers
+            )
+            for index, result in zip(crashed, retried):
+                results[index] = result
+                report(index, result)
+
+        return results
+
+    @staticmethod
+    def _validate_inline(guideline_path: str, filepath: str) -> Dict[str, List[str]] | Exception:
+        try:
+            return validate_file(guideline_path, filepath)
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _validate_isolated(
+        guideline_path: str,
+        filepaths: List[str],
+        workers: int
+    ) -> List[Dict[str, List[str]] | Exception]:
+        results: List[Dict[str, List[str]] | Exception] = []
+        for filepath in filepaths:
+            executor: ProcessPoolExecutor = ValidationService._get_executor(workers)
+            try:
+                results.append(executor.submit(validate_file, guideline_path, filepath).result())
+            except BrokenProcessPool:
+                ValidationService._discard_executor(executor)
+                results.append(RuntimeError(MSG_WORKER_CRASHED))
+            except Exception as e:
+                results.append(e)
+        return results
@@ -6,6 +6,30 @@ const currentMappings = new Map();
 let draggedHeader = null;
 let dragSource = null;
 
+// The panel of the sheet currently selected for a file
+function activePanel(resultSection) {
+  return resultSection.querySelector('.sheet-panel:not(.d-none)') || resultSection;
+}
+
+// Mappings are kept per file and sheet
+function mappingKey(resultSection) {
+  return `${resultSection.dataset.fileId}:${activePanel(resultSection).dataset.sheet || ''}`;
+}
+
+function handleSheetChange(select) {
+  const resultSection = select.closest('.result-section');
+  resultSection.querySelectorAll('.sheet-panel').forEach(panel => {
+    panel.classList.toggle('d-none', panel.dataset.sheet !== select.value);
+  });
+
+  // The undo button follows the mapping history of the selected sheet
+  const history = mappingHistory.get(mappingKey(resultSection));
+  const undoButton = resultSection.querySelector('.undo-btn');
+  if (undoButton) {
+    undoButton.classList.toggle('d-none', !history || history.length === 0);
+  }
+}
+
 // Helper function to allow drops
 function allowDrop(event) {
   event.preventDefault();
@@ -33,16 +57,17 @@ function handleDrop(event, targetSource) {
   
   const draggedHeader = event.dataTransfer.getData('text/plain');
   const draggedSource = event.dataTransfer.getData('source');
-  const fileId = event.target.closest('.result-section').dataset.fileId;
+  const resultSection = event.target.closest('.result-section');
+  const fileId = mappingKey(resultSection);
   
   // Don't allow dropping on the same list
   if (draggedSource === targetSource) return;
   
-  // Find the lists
-  const resultSection = event.target.closest('.result-section');
-  const sourceList = resultSection.querySelector(`.${draggedSource}-headers-list`);
-  const targetList = resultSection.querySelector(`.${targetSource}-headers-list`);
-  const matchedList = resultSection.querySelector('.matched-headers-list');
+  // Find the lists of the sheet shown
+  const panel = activePanel(resultSection);
+  const sourceList = panel.querySelector(`.${draggedSource}-headers-list`);
+  const targetList = panel.querySelector(`.${targetSource}-headers-list`);
+  const matchedList = panel.querySelector('.matched-headers-list');
   
   // Remove the dragged item from source list
   const draggedItem = sourceList.querySelector(`[data-header="${draggedHeader}"]`);
@@ -129,17 +154,19 @@ function handleDragEnd(event) {
 
 function handleUndo(fileId) {
   const fileSection = document.querySelector(`.result-section[data-file-id="${fileId}"]`);
-  const history = mappingHistory.get(fileId);
+  const key = mappingKey(fileSection);
+  const history = mappingHistory.get(key);
 
   if (!history || history.length === 0) return;
 
   // Get the previous state
   const previousState = history.pop();
 
-  // Restore the lists
-  const missingList = fileSection.querySelector('.missing-headers-list');
-  const extraList = fileSection.querySelector('.extra-headers-list');
-  const matchedList = fileSection.querySelector('.matched-headers-list');
+  // Restore the lists of the sheet shown
+  const panel = activePanel(fileSection);
+  const missingList = panel.querySelector('.missing-headers-list');
+  const extraList = panel.querySelector('.extra-headers-list');
+  const matchedList = panel.querySelector('.matched-headers-list');
 
   // Clear current lists
   missingList.innerHTML = '';
@@ -187,7 +214,7 @@ function handleUndo(fileId) {
   });
 
   // Remove the last mapping from currentMappings
-  const mappings = currentMappings.get(fileId);
+  const mappings = currentMappings.get(key);
   if (mappings && mappings.size > 0) {
     const lastKey = Array.from(mappings.keys()).pop();
     mappings.delete(lastKey);
@@ -199,22 +226,11 @@ function handleUndo(fileId) {
   }
 }
 
-function handleDownload(fileId, filename) {
-  const button = document.querySelector(`button[data-file-id="${fileId}"]`);
-  if (!button) return;
-
-  const spinner = button.querySelector('.spinner-border');
-
-  // Disable button and show spinner
-  button.disabled = true;
-  if (spinner) spinner.classList.remove('d-none');
-
-  // Get current mappings from the UI state
+function collectMappings(resultSection) {
   const mappings = {};
-  const resultSection = button.closest('.result-section');
-  const matchedHeadersList = resultSection.querySelector('.matched-headers-list');
+  const matchedHeadersList = activePanel(resultSection).querySelector('.matched-headers-list');
   const matchedHeaders = matchedHeadersList.querySelectorAll('li:not(.text-muted)');
-  
+
   matchedHeaders.forEach(header => {
       // Extract the source (extra) and target (missing) headers from the data attributes
       const sourceHeader = header.getAttribute('data-source-header');
@@ -225,12 +241,109 @@ function handleDownload(fileId, filename) {
       }
   });
 
+  return mappings;
+}
+
+// A draggable header of the missing or extra list, as rendered by the results page
+function headerItem(header, source) {
+  const li = document.createElement('li');
+  li.className = 'py-1 px-2 mb-2 bg-white rounded border header-item';
+  li.draggable = true;
+  li.dataset.header = header;
+  li.innerHTML = '<i class="bi bi-arrows-move me-2 text-muted"></i>';
+  li.appendChild(document.createTextNode(header));
+  li.addEventListener('dragstart', (e) => handleDragStart(e, source));
+  li.addEventListener('dragend', handleDragEnd);
+  return li;
+}
+
+function fillHeaderList(list, items, emptyText) {
+  list.innerHTML = '';
+  if (!items.length) {
+    list.innerHTML = `<li class="text-muted">${emptyText}</li>`;
+    return;
+  }
+  items.forEach(item => list.appendChild(item));
+}
+
+// Saved mappings apply to every upload with the same layout, so removing one is done on the server
+function handleRemoveSavedMapping(button) {
+  const badge = button.closest('.saved-mapping');
+  const resultSection = button.closest('.result-section');
+  const panel = button.closest('.sheet-panel') || resultSection;
+  const sheet = panel.dataset.sheet;
+  const body = { remove: [badge.dataset.inputHeader] };
+  if (sheet) body.sheet = sheet;
+
+  button.disabled = true;
+  fetch(`/saved_mappings/${resultSection.dataset.fileId}`, {
+      method: 'POST',
+      headers: {
+          'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body)
+  })
+      .then(response => response.json().then(data => {
+          if (!response.ok) throw new Error(data.error || 'Could not remove the saved mapping.');
+          return data;
+      }))
+      .then(data => {
+          // Mappings made on this page stay; the lists follow the server's comparison
+          const custom = collectMappings(resultSection);
+          const mapped = new Set(Object.values(custom));
+          const mappedInputs = new Set(Object.keys(custom));
+          const matchedList = panel.querySelector('.matched-headers-list');
+          const newItems = Array.from(matchedList.querySelectorAll('li[data-source-header]'));
+          const matchedItems = data.matched_headers.map(header => {
+            const li = document.createElement('li');
+            li.className = 'py-1 px-2 mb-2 bg-white rounded border';
+            li.innerHTML = '<i class="bi bi-check-circle text-success me-2"></i>';
+            li.appendChild(document.createTextNode(header));
+            return li;
+          });
+          fillHeaderList(matchedList, matchedItems.concat(newItems), 'No matched headers');
+          fillHeaderList(
+            panel.querySelector('.missing-headers-list'),
+            data.missing_headers.filter(header => !mapped.has(header)).map(header => headerItem(header, 'missing')),
+            'No missing headers'
+          );
+          fillHeaderList(
+            panel.querySelector('.extra-headers-list'),
+            data.extra_headers.filter(header => !mappedInputs.has(header)).map(header => headerItem(header, 'extra')),
+            'No extra headers'
+          );
+
+          const savedLine = badge.closest('.saved-mappings');
+          badge.remove();
+          if (!savedLine.querySelector('.saved-mapping')) savedLine.remove();
+      })
+      .catch(error => {
+          button.disabled = false;
+          alert(error.message);
+      });
+}
+
+function handleDownload(fileId, filename) {
+  const button = document.querySelector(`button[data-file-id="${fileId}"]`);
+  if (!button) return;
+
+  const spinner = button.querySelector('.spinner-border');
+
+  // Disable button and show spinner
+  button.disabled = true;
+  if (spinner) spinner.classList.remove('d-none');
+
+  // Get current mappings and the selected sheet from the UI state
+  const resultSection = button.closest('.result-section');
+  const mappings = collectMappings(resultSection);
+  const sheet = activePanel(resultSection).dataset.sheet;
+
   fetch(`/merge_and_download/${fileId}`, {
       method: 'POST',
       headers: {
           'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ mappings: mappings })
+      body: JSON.stringify(sheet ? { mappings: mappings, sheet: sheet } : { mappings: mappings })
   })
       .then(response => {
           if (!response.ok) {
@@ -259,6 +372,57 @@ function handleDownload(fileId, filename) {
       });
 }
 
+function handleDownloadAll(format) {
+  const button = document.querySelector(`button[data-download-all="${format}"]`);
+  if (!button) return;
+
+  const spinner = button.querySelector('.spinner-border');
+  button.disabled = true;
+  if (spinner) spinner.classList.remove('d-none');
+
+  // Custom mappings and selected sheet per file
+  const mappings = {};
+  const sheets = {};
+  document.querySelectorAll('.result-section').forEach(resultSection => {
+      mappings[resultSection.dataset.fileId] = collectMappings(resultSection);
+      const sheet = activePanel(resultSection).dataset.sheet;
+      if (sheet) sheets[resultSection.dataset.fileId] = sheet;
+  });
+
+  fetch('/merge_all', {
+      method: 'POST',
+      headers: {
+          'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ format: format, mappings: mappings, sheets: sheets })
+  })
+      .then(response => {
+          if (!response.ok) {
+              return response.text().then(text => {
+                  throw new Error(text || 'Download failed. Please try again.');
+              });
+          }
+          return response.blob();
+      })
+      .then(blob => {
+          const url = window.URL.createObjectURL(blob);
+          const a = document.createElement('a');
+          a.href = url;
+          a.download = `merged_files.${format}`;
+          document.body.appendChild(a);
+          a.click();
+          document.body.removeChild(a);
+          window.URL.revokeObjectURL(url);
+      })
+      .catch(error => {
+          alert(error.message);
+      })
+      .finally(() => {
+          button.disabled = false;
+          if (spinner) spinner.classList.add('d-none');
+      });
+}
+
 // Initialize drag and drop event listeners
 document.addEventListener('DOMContentLoaded', () => {
   document.querySelectorAll('.header-item').forEach(item => {
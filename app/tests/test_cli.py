@@ -0,0 +1,49 @@
+import json
+import os
+from typing import Dict
+
+import pandas as pd
+import pytest
+from app import cli
+from app.services.directory_service import DirectoryService
+from app.utils.constants import UPLOAD_FOLDER, TEMP_FOLDER, GUIDELINE_FILENAME, OPENPYXL_ENGINE, CLI_MANIFEST_FILENAME
+
+
+@pytest.fixture(autouse=True)
+def setup_and_cleanup():
+    DirectoryService.ensure_upload_dirs()
+    yield
+    DirectoryService.cleanup_temp_files()
+    for directory in [UPLOAD_FOLDER, TEMP_FOLDER]:
+        if os.path.exists(directory):
+            os.rmdir(directory)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch_merge_writes_outputs_and_manifest(tmp_path, workers: int) -> None:
+    guideline_path = tmp_path / GUIDELINE_FILENAME
+    guideline_path.write_text('Source Application,Num Flows\n')
+    for folder, app in [('a', 'app1'), ('b', 'app2')]:
+        (tmp_path / folder).mkdir()
+        with pd.ExcelWriter(tmp_path / folder / 'export.xlsx', engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'Source App Label': [app, app], 'Total Connection Count': [1, 2]}).to_excel(writer, index=False)
+    (tmp_path / 'a' / 'broken.xlsx').write_bytes(b'not a workbook')
+    output_dir = tmp_path / 'out'
+
+    status: int = cli.main([
+        str(guideline_path), str(tmp_path / 'a'), str(tmp_path / '*' / '*.xlsx'),
+        '--output-dir', str(output_dir), '--workers', str(workers)
+    ])
+
+    assert status == 1
+    manifest: Dict = json.loads((output_dir / CLI_MANIFEST_FILENAME).read_text())
+    assert [os.path.basename(entry['output'] or '-') for entry in manifest['files']] == ['-', 'export.csv', 'export (2).csv']
+    assert manifest['summary']['rows'] == 4 and manifest['summary']['failed'] == 1
+    assert manifest['files'][1]['matched_headers'] == ['Num Flows', 'Source Application']
+    assert pd.read_csv(output_dir / 'export (2).csv')['Source Application'].tolist() == ['app2', 'app2']
+    # Manifest entries follow the inputs, in whatever order the workers finished
+    assert [os.path.relpath(entry['file'], tmp_path) for entry in manifest['files']] == [
+        os.path.join('a', 'broken.xlsx'), os.path.join('a', 'export.xlsx'), os.path.join('b', 'export.xlsx')
+    ]
+    # Inputs are staged in the upload store only while they are processed
+    assert [name for name in os.listdir(UPLOAD_FOLDER) if not name.startswith('.')] == []
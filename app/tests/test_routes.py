@@ -1,6 +1,13 @@
 from typing import Dict
+import gzip
+import hashlib
 import pytest
 import os
+import pstats
+import subprocess
+import sys
+import time
+import zipfile
 import pandas as pd
 from flask import Response
 from pandas import DataFrame
@@ -12,9 +19,11 @@ from app.utils.constants import (
     CSV_CONTENT_TYPE, OPENPYXL_ENGINE, BASE_TEST_DATA_LOCATION,
     TEST_FORMAT_XLSX, GUIDELINE_FILE, INPUT_FILE,
     TEST_FORMAT_TXT, FORM_DATA_TYPE, SESSION_GUIDELINE_PATH,
-    SESSION_SAVED_PATH
+    ZIP_CONTENT_TYPE, SOURCE_FILE_COLUMN
 )
 from app.services.directory_service import DirectoryService
+from app.services.metrics_service import MetricsService
+from app.services.session_service import SessionService
 
 
 @pytest.fixture(autouse=True)
@@ -146,6 +155,272 @@ class TestRoutes:
             check_dtype=False  # Skip dtype checking
         )
 
+    def upload_two_files(self, client) -> None:
+        guideline_buffer: BytesIO = BytesIO(b'Source Application,Num Flows\n')
+        data: Dict = {
+            GUIDELINE_FILE: (guideline_buffer, GUIDELINE_FILENAME),
+            INPUT_FILE: [
+                (create_test_excel({'Source App Label': ['app1'], 'Total Connection Count': [1]}), 'first.xlsx'),
+                (create_test_excel({'Source App Label': ['app2', 'app3'], 'Other': ['x', 'y']}), 'second.xlsx')
+            ]
+        }
+        response: Response = client.post('/', data=data, content_type=FORM_DATA_TYPE)
+        assert response.status_code == 200
+
+    def test_merge_all_zip(self, client) -> None:
+        self.upload_two_files(client)
+
+        response: Response = client.post('/merge_all', json={'format': 'zip', 'mappings': {}})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == ZIP_CONTENT_TYPE
+        with zipfile.ZipFile(BytesIO(response.data)) as archive:
+            assert archive.namelist() == ['first.csv', 'second.csv']
+            second: DataFrame = pd.read_csv(archive.open('second.csv'), dtype=str)
+        assert second['Source Application'].tolist() == ['app2', 'app3']
+
+    def test_merge_all_single_csv(self, client) -> None:
+        self.upload_two_files(client)
+
+        response: Response = client.get('/merge_all?format=csv')
+
+        assert response.status_code == 200
+        result_df: DataFrame = pd.read_csv(StringIO(response.get_data(as_text=True)), dtype=str)
+        assert list(result_df.columns) == [SOURCE_FILE_COLUMN, 'Source Application', 'Num Flows']
+        assert result_df[SOURCE_FILE_COLUMN].tolist() == ['first.xlsx', 'second.xlsx', 'second.xlsx']
+        assert result_df['Num Flows'].tolist()[0] == '1'
+
+    def test_merge_output_formats(self, client) -> None:
+        self.upload_two_files(client)
+        with client.session_transaction() as sess:
+            file_id: str = SessionService.list_files(sess.sid)[1]['id']
+
+        plain: Response = client.get(f'/merge_and_download/{file_id}')
+        negotiated: Response = client.get(f'/merge_and_download/{file_id}', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in plain.headers
+        assert negotiated.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(negotiated.data) == plain.data
+
+        compressed: Response = client.get(f'/merge_and_download/{file_id}?format=csv.gz')
+        assert 'second.csv.gz' in compressed.headers['Content-Disposition']
+        assert gzip.decompress(compressed.data) == plain.data
+
+        parquet: Response = client.post(f'/merge_and_download/{file_id}', json={'mappings': {}, 'format': 'parquet'})
+        assert pd.read_parquet(BytesIO(parquet.data))['Source Application'].tolist() == ['app2', 'app3']
+        assert client.get(f'/merge_and_download/{file_id}?format=pdf').status_code == 400
+
+    def test_merge_chosen_sheets(self, client) -> None:
+        input_buffer: BytesIO = BytesIO()
+        with pd.ExcelWriter(input_buffer, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'Source App Label': ['old']}).to_excel(writer, sheet_name='Archive', index=False)
+            pd.DataFrame({'Source App Label': ['app1'], 'Num Flows': [2]}).to_excel(
+                writer, sheet_name='Flows', index=False
+            )
+        input_buffer.seek(0)
+        response: Response = client.post('/', data={
+            GUIDELINE_FILE: (BytesIO(b'Source Application,Num Flows\n'), GUIDELINE_FILENAME),
+            INPUT_FILE: (input_buffer, TEST_FORMAT_XLSX)
+        }, content_type=FORM_DATA_TYPE)
+        soup = BeautifulSoup(response.data, 'html.parser')
+        file_id: str = soup.find('button', {'class': 'download-btn'}).get('data-file-id')
+        assert soup.find('select', {'class': 'sheet-select'}).find('option', selected=True)['value'] == 'Flows'
+
+        # The sheet matching the most guideline headers by default, another by name, or several at once
+        default: DataFrame = pd.read_csv(StringIO(client.get(f'/merge_and_download/{file_id}').get_data(as_text=True)))
+        assert default['Source Application'].tolist() == ['app1']
+        archive: Response = client.post(f'/merge_and_download/{file_id}', json={'mappings': {}, 'sheet': 'Archive'})
+        assert pd.read_csv(StringIO(archive.get_data(as_text=True)))['Source Application'].tolist() == ['old']
+        both: DataFrame = pd.read_csv(StringIO(
+            client.get(f'/merge_and_download/{file_id}?sheets=Archive&sheets=Flows').get_data(as_text=True)
+        ))
+        assert both[SOURCE_FILE_COLUMN].tolist() == [f'{TEST_FORMAT_XLSX}/Archive', f'{TEST_FORMAT_XLSX}/Flows']
+        assert client.get(f'/merge_and_download/{file_id}?sheet=Missing').status_code == 400
+
+    def test_upload_reports_invalid_values(self, client) -> None:
+        response: Response = client.post('/', data={
+            GUIDELINE_FILE: (BytesIO(b'Source Application,Num Flows\n,type: integer\n'), GUIDELINE_FILENAME),
+            INPUT_FILE: (create_test_excel({'Source App Label': ['a', 'b'], 'Num Flows': ['x', 3]}), TEST_FORMAT_XLSX)
+        }, content_type=FORM_DATA_TYPE)
+
+        soup = BeautifulSoup(response.data, 'html.parser')
+        assert [cell.text.strip() for cell in soup.select('.value-checks .invalid-count')] == ['1']
+        assert 'row 2' in soup.select_one('.value-checks tbody').text
+
+    def test_custom_mappings_apply_to_the_next_upload(self, client) -> None:
+        def upload(app: str) -> Response:
+            return client.post('/', data={
+                GUIDELINE_FILE: (BytesIO(b'Source Application,Num Flows\n'), GUIDELINE_FILENAME),
+                INPUT_FILE: (create_test_excel({'Consumer': [app], 'Num Flows': [1]}), TEST_FORMAT_XLSX)
+            }, content_type=FORM_DATA_TYPE)
+
+        upload('app1')
+        with client.session_transaction() as sess:
+            file_id: str = SessionService.list_files(sess.sid)[0]['id']
+        client.post(f'/merge_and_download/{file_id}', json={'mappings': {'Consumer': 'Source Application'}})
+
+        soup = BeautifulSoup(upload('app2').data, 'html.parser')
+        assert 'Consumer' in soup.select_one('.saved-mappings').text
+        assert not soup.select('.missing-headers-list .header-item')
+        with client.session_transaction() as sess:
+            file_id = SessionService.list_files(sess.sid)[0]['id']
+        merged: DataFrame = pd.read_csv(StringIO(client.get(f'/merge_and_download/{file_id}').get_data(as_text=True)))
+        assert merged['Source Application'].tolist() == ['app2']
+
+        # Saved mappings are shown as removable, and once removed no longer apply
+        assert soup.select_one('.saved-mapping')['data-input-header'] == 'Consumer'
+        response: Response = client.post(f'/saved_mappings/{file_id}', json={'remove': ['Consumer']})
+        assert response.status_code == 200
+        assert response.get_json()['saved_mappings'] == {}
+        assert response.get_json()['missing_headers'] == ['Source Application']
+        merged = pd.read_csv(StringIO(client.get(f'/merge_and_download/{file_id}').get_data(as_text=True)))
+        assert merged['Source Application'].isna().all()
+        assert client.post('/saved_mappings/unknown', json={'remove': ['Consumer']}).status_code == 400
+
+    def test_merge_all_invalid_format(self, client) -> None:
+        self.upload_two_files(client)
+
+        response: Response = client.get('/merge_all?format=pdf')
+
+        assert response.status_code == 400
+
+    def wait_for_job(self, client, job_id: str) -> Dict:
+        for _ in range(200):
+            job: Dict = client.get(f'/jobs/{job_id}').get_json()
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.05)
+        raise AssertionError(f'Job {job_id} did not finish')
+
+    def test_upload_and_merge_jobs(self, app, client) -> None:
+        data: Dict = {
+            GUIDELINE_FILE: (BytesIO(b'Source Application,Num Flows\n'), GUIDELINE_FILENAME),
+            INPUT_FILE: [
+                (create_test_excel({'Source App Label': ['app1'], 'Total Connection Count': [1]}), 'first.xlsx'),
+                (BytesIO(b'not a workbook'), 'broken.xlsx')
+            ]
+        }
+        response: Response = client.post('/jobs/upload', data=data, content_type=FORM_DATA_TYPE)
+        assert response.status_code == 202
+        upload_job: Dict = self.wait_for_job(client, response.get_json()['job_id'])
+
+        assert upload_job['status'] == 'done'
+        assert [file['status'] for file in upload_job['files']] == ['done', 'failed']
+        # Jobs are only visible to the session that submitted them
+        assert app.test_client().get(response.get_json()['status_url']).status_code == 404
+        assert app.test_client().get(response.get_json()['result_url']).status_code == 404
+        response = client.get(response.get_json()['result_url'])
+        assert response.status_code == 200
+        file_id: str = BeautifulSoup(response.data, 'html.parser').find('button', {'class': 'download-btn'})['data-file-id']
+
+        response = client.post('/jobs/merge', json={'file_id': file_id, 'mappings': {}})
+        assert response.status_code == 202
+        merge_job: Dict = self.wait_for_job(client, response.get_json()['job_id'])
+
+        assert merge_job['status'] == 'done'
+        assert merge_job['files'] == [{'name': 'first.xlsx', 'status': 'done', 'rows': 1, 'error': None}]
+        response = client.get(response.get_json()['result_url'])
+        assert response.status_code == 200
+        result_df: DataFrame = pd.read_csv(StringIO(response.get_data(as_text=True)), dtype=str)
+        assert result_df.to_dict('list') == {'Source Application': ['app1'], 'Num Flows': ['1']}
+
+    def test_chunked_upload_resumes_and_validates(self, client) -> None:
+        workbook: bytes = create_test_excel({'Source App Label': ['app1']}).getvalue()
+        response: Response = client.post('/uploads', json={'filename': 'big.xlsx', 'size': len(workbook)})
+        assert response.status_code == 201
+        upload_url: str = response.get_json()['url']
+
+        half: int = len(workbook) // 2
+        assert client.patch(upload_url, data=workbook[:half], headers={'Upload-Offset': '0'}).status_code == 200
+        # A retried chunk for an offset already written is refused with the offset to resume from
+        response = client.patch(upload_url, data=workbook[:half], headers={'Upload-Offset': '0'})
+        assert response.status_code == 409
+        assert response.get_json()['offset'] == half
+        client.patch(upload_url, data=workbook[half:], headers={'Upload-Offset': str(half)})
+
+        response = client.post(f'{upload_url}/complete', json={'sha256': hashlib.sha256(workbook).hexdigest()})
+        assert response.status_code == 200
+
+        data: Dict = {
+            GUIDELINE_FILE: (BytesIO(b'Source Application\n'), GUIDELINE_FILENAME),
+            'upload_ids': response.get_json()['upload_id']
+        }
+        response = client.post('/', data=data, content_type=FORM_DATA_TYPE)
+        soup = BeautifulSoup(response.data, 'html.parser')
+        assert soup.find('button', {'class': 'download-btn'}) is not None
+
+    def test_server_timing_and_metrics(self, client) -> None:
+        MetricsService.reset()
+        data: Dict = {
+            GUIDELINE_FILE: (BytesIO(b'Source Application,First Detected\n'), GUIDELINE_FILENAME),
+            INPUT_FILE: (create_test_excel({'Source App Label': ['app1'], 'First Detected': ['2024-01-02']}), 'first.xlsx')
+        }
+        response: Response = client.post('/', data=data, content_type=FORM_DATA_TYPE)
+        assert response.status_code == 200
+        stages: Dict[str, str] = dict(entry.split(';dur=') for entry in response.headers['Server-Timing'].split(', '))
+        assert {'save', 'validate', 'total'} <= set(stages)
+        file_id: str = BeautifulSoup(response.data, 'html.parser').find('button', {'class': 'download-btn'})['data-file-id']
+
+        response = client.get(f'/merge_and_download/{file_id}')
+        assert 'mapping;dur=' in response.headers['Server-Timing']
+        response.get_data()
+        response.close()
+
+        metrics: str = client.get('/metrics').get_data(as_text=True)
+        assert 'excel_validator_request_seconds_count{endpoint="main.merge_and_download"} 1' in metrics
+        for stage in ('save', 'parse', 'mapping', 'dates', 'csv'):
+            assert f'excel_validator_stage_seconds_count{{stage="{stage}"}}' in metrics
+        assert 'excel_validator_rows_total{stage="merge"}' in metrics
+        assert 'excel_validator_bytes_total{direction="out"}' in metrics
+        assert 'excel_validator_cache_requests_total{cache="workbook",result="miss"}' in metrics
+
+    def test_profiled_merge_with_admin_token(self, client, monkeypatch, tmp_path) -> None:
+        monkeypatch.setattr('app.services.profiling_service.PROFILING_ENABLED', True)
+        monkeypatch.setattr('app.services.profiling_service.PROFILING_TOKEN', 'admin-token')
+        monkeypatch.setattr('app.services.profiling_service.PROFILES_FOLDER', str(tmp_path))
+        data: Dict = {
+            GUIDELINE_FILE: (BytesIO(b'Source Application\n'), GUIDELINE_FILENAME),
+            INPUT_FILE: (create_test_excel({'Source App Label': ['app1']}), 'first.xlsx')
+        }
+        response: Response = client.post('/', data=data, content_type=FORM_DATA_TYPE,
+                                          headers={'X-Profile-Token': 'wrong-token'})
+        assert 'X-Profile-Id' not in response.headers
+        file_id: str = BeautifulSoup(response.data, 'html.parser').find('button', {'class': 'download-btn'})['data-file-id']
+
+        response = client.get(f'/merge_and_download/{file_id}', headers={'X-Profile-Token': 'admin-token'})
+        assert response.get_data(as_text=True).splitlines() == ['Source Application', 'app1']
+        response.close()
+
+        profile_id: str = response.headers['X-Profile-Id']
+        stats = pstats.Stats(str(tmp_path / f'{profile_id}.prof'))
+        assert any(function == 'iter_merge' for _, _, function in stats.stats)
+        assert (tmp_path / f'{profile_id}.alloc.txt').read_text().startswith('Peak traced memory')
+
+    def test_unknown_job(self, client) -> None:
+        assert client.get('/jobs/unknown').status_code == 404
+        assert client.get('/jobs/unknown/result').status_code == 404
+
+    def test_session_cookie_carries_only_the_id(self, client) -> None:
+        self.upload_two_files(client)
+        cookie = client.get_cookie('session')
+        with client.session_transaction() as sess:
+            assert cookie.value == sess.sid
+            saved: list = SessionService.list_files(sess.sid)
+        assert [f['original_name'] for f in saved] == ['first.xlsx', 'second.xlsx']
+
+        response: Response = client.get(f"/merge_and_download/{saved[0]['id']}")
+        assert response.status_code == 200
+        assert client.get_cookie('session').value == cookie.value
+
+    def test_output_dependencies_load_on_first_use_or_when_warmed(self) -> None:
+        code: str = (
+            "import sys; from app import create_app, warm; "
+            "lazy = 'openpyxl' in sys.modules or 'pyarrow.parquet' in sys.modules; "
+            "warm(create_app(start_janitor=False)); "
+            "print(lazy, 'openpyxl' in sys.modules and 'pyarrow.parquet' in sys.modules)"
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ['False', 'True']
+
     def test_merge_invalid_session(self, client) -> None:
         with client.session_transaction() as session:
             session.clear()
@@ -159,7 +434,6 @@ class TestRoutes:
     def test_merge_invalid_file_id(self, client) -> None:
         with client.session_transaction() as session:
             session[SESSION_GUIDELINE_PATH] = 'some_path'
-            session[SESSION_SAVED_PATH] = []
 
         # Changed to POST request
         response: Response = client.post('/merge_and_download/invalid-id',
@@ -1,5 +1,16 @@
 from typing import List, Dict, Tuple
 
+import gzip
+import hashlib
+import json
+import multiprocessing
+import re
+import fcntl
+import struct
+import subprocess
+import sys
+import threading
+import time
 import pytest
 import os
 import pandas as pd
@@ -10,14 +21,49 @@ from werkzeug.datastructures import FileStorage
 from app.services.file_service import FileService
 from app.services.merge_service import MergeService
 from app.services.directory_service import DirectoryService
+from app.services.blob_service import BlobService
+from app.services.cache_service import CacheService
+from app.services.guideline_service import Guideline, GuidelineService
+from app.services.validation_service import ValidationService, validate_file
+from app.services.janitor_service import JanitorService
+from app.services.job_service import JobService
+from app.services.metrics_service import MetricsService
+from app.services.plan_service import MergePlan, PlanService
+from app.services.session_service import SessionService
+from app.services.upload_service import OffsetMismatch, UploadService
+from app.utils.header_matcher import HeaderMatcher
+from app.utils.containers import container_extension, sniff_container
+from app.utils.readers import ReaderEngine, available_engines, engine_for, get_engine
+from app.utils.streaming import iter_xlsx
 from app.utils.constants import (
     UPLOAD_FOLDER, TEMP_FOLDER, EXCEL_CONTENT_TYPE, TEST_FORMAT_XLSX,
     TEST_FORMAT_XLS, TEST_FORMAT_CSV, TEST_FORMAT_TXT, GUIDELINE_FILENAME,
-    CSV_CONTENT_TYPE, OPENPYXL_ENGINE,
+    CSV_CONTENT_TYPE, OPENPYXL_ENGINE, CALAMINE_ENGINE, PANDAS_ENGINE, MSG_ERROR, MSG_ENCRYPTED_FILE,
+    CONTAINER_OOXML, CONTAINER_OLE2, CONTAINER_ENCRYPTED, CONTAINER_UNKNOWN,
     HEADERS_EXTRA, HEADERS_MISSING, HEADERS_MATCHED, FULL_HEADER_CONVERSIONS, TEST_EXCEL_INPUT,
+    OUTPUT_FORMAT_CSV, OUTPUT_FORMAT_CSV_GZ, OUTPUT_FORMAT_XLSX, OUTPUT_FORMAT_PARQUET, JANITOR_LOCK_PATH,
+    SESSION_GUIDELINE_PATH,
 )
 
 
+def _compound_file(*stream_names: str) -> bytes:
+    """A minimal OLE2 compound file (512-byte sectors: FAT, then directory) listing the given streams."""
+    end_of_chain, free = 0xFFFFFFFE, 0xFFFFFFFF
+    header = bytearray(512)
+    header[0:8] = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    struct.pack_into('<HHHHH', header, 0x18, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into('<II', header, 0x2C, 1, 1)  # one FAT sector; directory starts at sector 1
+    struct.pack_into('<II', header, 0x44, end_of_chain, 0)
+    struct.pack_into('<109I', header, 0x4C, 0, *[free] * 108)
+    fat = struct.pack('<128I', 0xFFFFFFFD, end_of_chain, *[free] * 126)
+    directory = bytearray(512)
+    for index, name in enumerate(('Root Entry',) + stream_names):
+        encoded: bytes = (name + '\0').encode('utf-16-le')
+        directory[index * 128:index * 128 + len(encoded)] = encoded
+        struct.pack_into('<H', directory, index * 128 + 0x40, len(encoded))
+    return bytes(header) + fat + bytes(directory)
+
+
 @pytest.fixture(autouse=True)
 def setup_and_cleanup():
     # Setup
@@ -77,6 +123,121 @@ class TestFileService:
         assert file_id in filepath
         assert filepath.endswith(f'_{TEST_FORMAT_XLSX}')
 
+    def test_read_input_headers_matches_pandas(self, tmp_path) -> None:
+        df: DataFrame = pd.DataFrame([[1, 2, 3, 4]], columns=['Name', 'Unnamed: 1', 'Name', 2024])
+        input_path = tmp_path / TEST_EXCEL_INPUT
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            df.to_excel(writer, index=False)
+
+        headers: List[str] = FileService.read_input_headers(str(input_path))
+
+        assert headers == [str(column) for column in pd.read_excel(input_path).columns]
+        assert headers == ['Name', 'Unnamed: 1', 'Name.1', '2024']
+
+    def test_iter_input_batches(self, tmp_path) -> None:
+        df: DataFrame = pd.DataFrame({'col1': [1, 2, None, 4, 5], 'col2': ['a', 'N/A', None, 'd', 'e']})
+        input_path = tmp_path / TEST_EXCEL_INPUT
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            df.to_excel(writer, index=False)
+
+        batches: List[DataFrame] = list(FileService.iter_input_batches(str(input_path), batch_rows=2))
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        merged: DataFrame = pd.concat(batches)
+        assert list(merged.columns) == ['col1', 'col2']
+        assert merged['col1'].tolist()[:2] == [1, 2]
+        assert merged['col2'].isna().tolist() == [False, True, True, False, False]
+
+    @pytest.mark.parametrize('start_column', [0, 2])
+    def test_reader_engines_read_the_same_values(self, tmp_path, start_column: int) -> None:
+        df: DataFrame = pd.DataFrame({
+            'count': [3.0, 1.5, 7],
+            'seen': [pd.Timestamp('2024-01-02'), None, pd.Timestamp('2024-01-02 03:04:05')],
+            'name': ['a', None, 'N/A']
+        })
+        input_path = str(tmp_path / TEST_EXCEL_INPUT)
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            df.to_excel(writer, index=False, startcol=start_column)
+
+        expected: List = list(get_engine(OPENPYXL_ENGINE).iter_rows(input_path))
+        for name in available_engines():
+            assert list(get_engine(name).iter_rows(input_path)) == expected, name
+
+    def test_chartsheets_keep_their_place_in_sheet_numbering(self, tmp_path) -> None:
+        from openpyxl import Workbook
+        from openpyxl.chart import BarChart, Reference
+
+        workbook = Workbook()
+        data = workbook.active
+        data.title = 'Data'
+        data.append(['Name', 'Count'])
+        data.append(['a', 1])
+        chart = BarChart()
+        chart.add_data(Reference(data, min_col=2, min_row=1, max_row=2))
+        workbook.create_chartsheet('Chart', 0).add_chart(chart)
+        input_path = str(tmp_path / TEST_EXCEL_INPUT)
+        workbook.save(input_path)
+
+        assert FileService.list_sheets(input_path) == ['Chart', 'Data']
+        for name in set(available_engines()) & {OPENPYXL_ENGINE, CALAMINE_ENGINE}:
+            engine = get_engine(name)
+            assert engine.sheet_names(input_path) == ['Chart', 'Data'], name
+            assert list(engine.iter_rows(input_path, 0)) == [], name
+            assert list(engine.iter_rows(input_path, 1)) == [('Name', 'Count'), ('a', 1)], name
+
+    def test_engine_for_uses_first_available_preference(self, tmp_path) -> None:
+        preferences: Dict[str, List[str]] = {'xlsx': ['missing-engine', OPENPYXL_ENGINE]}
+        input_path = str(tmp_path / 'export.xlsx')
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'col1': [1]}).to_excel(writer, index=False)
+        legacy_path = tmp_path / 'export.xls'
+        legacy_path.write_bytes(_compound_file('Workbook'))
+
+        assert engine_for(input_path, preferences).name == OPENPYXL_ENGINE
+        assert engine_for(str(legacy_path), preferences).name == 'pandas'
+        # Large files go to an engine that streams rows, when one is configured
+        preferences = {'xlsx': [PANDAS_ENGINE, OPENPYXL_ENGINE]}
+        assert engine_for(input_path, preferences).name == PANDAS_ENGINE
+        assert engine_for(input_path, preferences, streaming=True).name == OPENPYXL_ENGINE
+        with pytest.raises(TypeError):
+            ReaderEngine()
+
+    def test_sniff_container(self, tmp_path) -> None:
+        # An .xlsx saved under the legacy extension is still read as OOXML
+        renamed_path = str(tmp_path / 'export.xls')
+        with pd.ExcelWriter(renamed_path, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'col1': [1]}).to_excel(writer, index=False)
+        legacy_path = tmp_path / 'legacy.xls'
+        legacy_path.write_bytes(_compound_file('Workbook'))
+        text_path = tmp_path / 'notes.xlsx'
+        text_path.write_text('col1,col2\n1,2\n')
+
+        assert sniff_container(renamed_path) == CONTAINER_OOXML
+        assert container_extension(CONTAINER_OOXML, 'xls') == 'xlsx'
+        assert sniff_container(str(legacy_path)) == CONTAINER_OLE2
+        assert sniff_container(str(text_path)) == CONTAINER_UNKNOWN
+        with pytest.raises(ValueError, match=re.escape(MSG_ERROR)):
+            FileService.read_input_headers(str(text_path))
+
+    def test_encrypted_workbook_is_rejected_before_reading(self, tmp_path) -> None:
+        input_path = tmp_path / TEST_EXCEL_INPUT
+        input_path.write_bytes(_compound_file('EncryptionInfo', 'EncryptedPackage'))
+
+        assert sniff_container(str(input_path)) == CONTAINER_ENCRYPTED
+        with pytest.raises(ValueError, match=re.escape(MSG_ENCRYPTED_FILE)):
+            FileService.read_input_headers(str(input_path))
+        with pytest.raises(ValueError, match=re.escape(MSG_ENCRYPTED_FILE)):
+            next(FileService.iter_input_batches(str(input_path)))
+
+    def test_read_guideline_headers(self, tmp_path) -> None:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        guideline_path.write_text('\ufeffheader1,,header1\nvalue1,value2,value3\n', encoding='utf-8')
+
+        headers: List[str] = FileService.read_guideline_headers(str(guideline_path))
+
+        assert headers == list(pd.read_csv(guideline_path).columns)
+        assert headers == ['header1', 'Unnamed: 1', 'header1.1']
+
 
 class TestMergeService:
     @pytest.fixture
@@ -125,6 +286,77 @@ class TestMergeService:
         assert str(result_df["Source Application"].iloc[0]) == "app1"
         assert str(result_df["Destination Port"].iloc[0]) == "8080"
 
+    def test_iter_merge_streams_header_first(self, tmp_path, sample_data):
+        """The CSV header is produced before any input rows are read"""
+        guideline_data, input_data = sample_data
+        guideline_path = tmp_path / "guideline.csv"
+        input_path = tmp_path / "input.xlsx"
+        pd.DataFrame(guideline_data).to_csv(guideline_path, index=False)
+        with pd.ExcelWriter(input_path, engine='openpyxl') as writer:
+            pd.DataFrame(input_data).to_excel(writer, index=False)
+
+        chunks = MergeService.iter_merge(guideline_path, input_path, {"Consumer App": "Source Application"})
+
+        assert next(chunks).splitlines() == ["Source Application,Destination Port,Environment"]
+        assert ''.join(chunks).splitlines() == ["app1,,"]
+
+    def test_output_formats_hold_the_same_rows(self, tmp_path, sample_data):
+        guideline_data, input_data = sample_data
+        guideline_path = tmp_path / "guideline.csv"
+        input_path = tmp_path / "input.xlsx"
+        pd.DataFrame(guideline_data).to_csv(guideline_path, index=False)
+        with pd.ExcelWriter(input_path, engine='openpyxl') as writer:
+            pd.DataFrame(input_data | {"Environment": ["prod"]}).to_excel(writer, index=False)
+        mappings: Dict[str, str] = {"Consumer App": "Source Application"}
+
+        def output(output_format: str) -> bytes:
+            return b''.join(
+                chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                for chunk in MergeService.iter_output(guideline_path, input_path, output_format, mappings)
+            )
+
+        expected: List[List] = [["app1", None, "prod"]]
+        csv_bytes: bytes = output(OUTPUT_FORMAT_CSV)
+        assert gzip.decompress(output(OUTPUT_FORMAT_CSV_GZ)) == csv_bytes
+        parquet: DataFrame = pd.read_parquet(BytesIO(output(OUTPUT_FORMAT_PARQUET)))
+        assert parquet.values.tolist() == expected
+        xlsx: DataFrame = pd.read_excel(BytesIO(output(OUTPUT_FORMAT_XLSX)), dtype=object)
+        assert list(xlsx.columns) == list(guideline_data) and xlsx.where(xlsx.notna(), None).values.tolist() == expected
+        # Formula-like text stays text
+        formula: bytes = b''.join(iter_xlsx(['Value'], [pd.DataFrame({'Value': ['=1+1']})]))
+        assert pd.read_excel(BytesIO(formula))['Value'].tolist() == ['=1+1']
+        with pytest.raises(ValueError):
+            MergeService.iter_output(guideline_path, input_path, 'pdf')
+
+    def test_check_values_against_guideline_rules(self, tmp_path):
+        guideline_path = tmp_path / "guideline.csv"
+        guideline_path.write_text(
+            'Source Application,Num Flows,Source Enforcement Mode,First Detected\n'
+            ',type: integer,allowed: full|selective,type: date\n'
+            'app1,1,full,2024-01-01\n'
+        )
+        input_path = tmp_path / "input.xlsx"
+        with pd.ExcelWriter(input_path, engine='openpyxl') as writer:
+            pd.DataFrame({
+                'Source App Label': ['app1', 'app2', 'app3', 'app4'],
+                'Total Connection Count': [10, 'many', 2.5, None],
+                'Source Enforcement': ['full', 'idle', '  ', 'selective'],
+                'First Detected': ['2024-01-02', 'soon', None, '2024-01-05'],
+            }).to_excel(writer, index=False)
+        guideline = GuidelineService.load(str(guideline_path))
+
+        result: Dict = MergeService.check_values(guideline, str(input_path))
+
+        assert guideline.column_types == {'Num Flows': 'integer', 'First Detected': 'date'}
+        assert 'First Detected' in guideline.date_columns
+        assert result['rows_checked'] == 4
+        assert [(check['column'], check['invalid'], check['rows'], check['values']) for check in result['columns']] == [
+            ('Num Flows', 2, [3, 4], ['many', '2.5']),
+            ('Source Enforcement Mode', 1, [3], ['idle']),
+            ('First Detected', 1, [3], ['soon']),
+        ]
+        CacheService.remove(str(input_path))
+
     def test_merge_preserves_data_types(self, tmp_path):
         """Test that merged files preserve data types from guideline."""
         guideline_data = {
@@ -154,6 +386,143 @@ class TestMergeService:
         # Verify data types and values
         assert result_df['ID'].iloc[0] == 1
 
+    def test_format_date_column(self):
+        """Dates, date strings and Excel serial numbers all normalize to YYYY-MM-DD"""
+        dates = pd.Series(
+            [pd.Timestamp('2024-01-02 05:00'), '2024-03-04', 45000, '45000', '03/05/2024', 'garbage', None],
+            dtype=object,
+            name='First Detected Date'
+        )
+        format_cache: Dict = {}
+
+        result = MergeService._format_date_column(dates, format_cache)
+
+        assert result.tolist() == ['2024-01-02', '2024-03-04', '2023-03-15', '2023-03-15', '2024-03-05', '', '']
+        # The column does not start with a string, so each string is parsed on its own
+        assert format_cache == {'First Detected Date': None}
+
+    def test_format_date_column_follows_the_first_string_format(self):
+        """As pd.to_datetime does, strings must follow the first one's format; mixed offsets do not fail the batch"""
+        format_cache: Dict = {}
+        dates = pd.Series(['2024-02-03', '03/04/2024', '2024-02-03T10:00:00Z'], name='First Detected Date')
+
+        assert MergeService._format_date_column(dates, format_cache).tolist() == ['2024-02-03', '', '']
+        assert format_cache == {'First Detected Date': '%Y-%m-%d'}
+        offsets = pd.Series(['2024-02-03T10:00:00+01:00', '2024-02-03T23:30:00-02:00', '45000', 'x'], name='Seen')
+        assert MergeService._format_date_column(offsets).tolist() == ['2024-02-03', '2024-02-04', '2023-03-15', '']
+
+    def test_invalid_dates_are_those_the_merge_blanks(self):
+        guideline = Guideline('hash', ['First Detected'], {'First Detected': 'date'})
+        values = pd.Series(['2024-02-03', '03/04/2024', '2024-02-03T10:00:00Z', 'garbage', '2024-02-05', None])
+
+        invalid = MergeService._invalid_values(values, guideline, 'First Detected', {})
+
+        assert invalid.tolist() == [False, True, True, True, False, False]
+
+    def test_merge_formats_guideline_date_columns(self, tmp_path):
+        """Columns mapped onto a configured date column are normalized whatever their input name"""
+        guideline_path = tmp_path / "guideline.csv"
+        input_path = tmp_path / "input.xlsx"
+        pd.DataFrame({"First Detected": [], "Num Flows": []}).to_csv(guideline_path, index=False)
+        with pd.ExcelWriter(input_path, engine='openpyxl') as writer:
+            pd.DataFrame({"Seen": [45000, 45001], "Num Flows": [45000, 45001]}).to_excel(writer, index=False)
+
+        merged_content = MergeService.merge_files(guideline_path, input_path, {"Seen": "First Detected"})
+        result_df = pd.read_csv(StringIO(merged_content), dtype=str)
+
+        assert result_df["First Detected"].tolist() == ["2023-03-15", "2023-03-16"]
+        assert result_df["Num Flows"].tolist() == ["45000", "45001"]
+
+    def test_arrow_engine_matches_pandas_engine(self, tmp_path):
+        """Both merge engines produce the same rows, blanks and dates; Arrow quotes every value"""
+        guideline_path = tmp_path / "guideline.csv"
+        input_path = tmp_path / "input.xlsx"
+        pd.DataFrame({"First Detected": [], "Name": [], "Environment": []}).to_csv(guideline_path, index=False)
+        with pd.ExcelWriter(input_path, engine='openpyxl') as writer:
+            pd.DataFrame({
+                "Seen": [45000, None, 45002],
+                "Name": ['plain', 'with, comma', None]
+            }).to_excel(writer, index=False)
+        mappings = {"Seen": "First Detected"}
+
+        pandas_csv = MergeService.merge_files(guideline_path, input_path, mappings, engine='pandas')
+        arrow_csv = MergeService.merge_files(guideline_path, input_path, mappings, engine='arrow')
+
+        def rows(csv: str) -> List[List[str]]:
+            return pd.read_csv(StringIO(csv), dtype=str, keep_default_na=False).values.tolist()
+
+        assert rows(arrow_csv) == rows(pandas_csv)
+        assert arrow_csv.splitlines() == [
+            'First Detected,Name,Environment',
+            '"2023-03-15","plain",', ',"with, comma",', '"2023-03-17",,',
+        ]
+        with pytest.raises(ValueError):
+            MergeService.merge_files(guideline_path, input_path, mappings, engine='unknown')
+
+    def test_merge_renders_values_as_read(self, tmp_path, monkeypatch):
+        """Values are written as read, not through a whole-column dtype: 12 not 12.0, True not 1.0"""
+        guideline_path = tmp_path / "guideline.csv"
+        input_path = tmp_path / "input.xlsx"
+        guideline_path.write_text("Source Application,Num Flows,Ratio,Enabled\n")
+        from openpyxl import Workbook
+        workbook = Workbook()
+        for row in (['Source Application', 'Num Flows', 'Ratio', 'Enabled'],
+                    ['app1', 12, 1.5, True], ['app2', None, 2.0, False], ['app3', 3, 0.25, None]):
+            workbook.active.append(row)
+        workbook.save(input_path)
+        monkeypatch.setattr('app.services.file_service.engine_for', lambda *args, **kwargs: get_engine(OPENPYXL_ENGINE))
+
+        assert MergeService.merge_files(guideline_path, input_path, engine='pandas').splitlines() == [
+            "Source Application,Num Flows,Ratio,Enabled",
+            "app1,12,1.5,True",
+            "app2,,2,False",
+            "app3,3,0.25,",
+        ]
+        CacheService.remove(str(input_path))
+        assert MergeService.merge_files(guideline_path, input_path, engine='arrow').splitlines() == [
+            "Source Application,Num Flows,Ratio,Enabled",
+            '"app1","12","1.5","True"',
+            '"app2",,"2","False"',
+            '"app3","3","0.25",',
+        ]
+        CacheService.remove(str(input_path))
+
+    @pytest.mark.skipif(CALAMINE_ENGINE not in available_engines(), reason='python-calamine is not installed')
+    def test_calamine_and_openpyxl_merge_the_same_values(self, tmp_path, monkeypatch):
+        """The readers differ only on whitespace-only text not marked xml:space="preserve\""""
+        import zipfile
+        from openpyxl import Workbook
+        guideline_path = tmp_path / "guideline.csv"
+        guideline_path.write_text("Source Application,Num Flows,Ratio,Enabled,Note\n")
+        workbook = Workbook()
+        for row in (['Source Application', 'Num Flows', 'Ratio', 'Enabled', 'Note'],
+                    ['app1', 12, 1.5, True, '   '], ['app2', None, 2.0, False, 'x'], ['app3', 3, 0.25, None, ' y ']):
+            workbook.active.append(row)
+        input_path = str(tmp_path / "input.xlsx")
+        workbook.save(input_path)
+        # Excel marks such text as preserved; openpyxl does not
+        preserved_path = str(tmp_path / "preserved.xlsx")
+        with zipfile.ZipFile(input_path) as source, zipfile.ZipFile(preserved_path, 'w') as target:
+            for item in source.infolist():
+                data: bytes = source.read(item.filename)
+                if item.filename == 'xl/worksheets/sheet1.xml':
+                    data = data.replace(b'<t>   </t>', b'<t xml:space="preserve">   </t>')
+                target.writestr(item, data)
+
+        def merged(path: str, reader: str) -> List[str]:
+            monkeypatch.setattr('app.services.file_service.engine_for', lambda *args, **kwargs: get_engine(reader))
+            CacheService.remove(path)
+            return MergeService.merge_files(guideline_path, path).splitlines()
+
+        expected: List[str] = ["Source Application,Num Flows,Ratio,Enabled,Note",
+                               "app1,12,1.5,True,   ", "app2,,2,False,x", "app3,3,0.25,, y "]
+        assert merged(input_path, OPENPYXL_ENGINE) == expected
+        assert merged(preserved_path, OPENPYXL_ENGINE) == expected
+        assert merged(preserved_path, CALAMINE_ENGINE) == expected
+        assert merged(input_path, CALAMINE_ENGINE) == [expected[0], "app1,12,1.5,True,"] + expected[2:]
+        CacheService.remove(input_path)
+        CacheService.remove(preserved_path)
+
     def test_compare_headers(self):
         """Test header comparison functionality"""
         guideline_df: DataFrame = pd.DataFrame({
@@ -173,6 +542,497 @@ class TestMergeService:
         assert set(result[HEADERS_MISSING]) == {"Header2"}
         assert set(result[HEADERS_EXTRA]) == {"Header4"}
 
+    def test_compare_headers_with_header_lists(self):
+        """Header lists give the same comparison as dataframes"""
+        result: Dict[str, List[str]] = MergeService.compare_headers(
+            ["Source Application", "Num Flows"],
+            ["Source App Label", "Total Connection Count", "Extra Field"]
+        )
+
+        assert result[HEADERS_MATCHED] == ["Num Flows", "Source Application"]
+        assert result[HEADERS_MISSING] == []
+        assert result[HEADERS_EXTRA] == ["Extra Field"]
+
+    def test_merge_plan_saves_custom_mappings_for_the_layout(self, tmp_path, monkeypatch) -> None:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        guideline_path.write_text('Source Application,Destination Port\n')
+        paths: List[str] = []
+        for index, app in enumerate(['app1', 'app2']):
+            input_path = tmp_path / f'export{index}.xlsx'
+            with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+                pd.DataFrame({'Consumer App': [app], 'Target Port': ['8080']}).to_excel(writer, index=False)
+            paths.append(str(input_path))
+
+        MergeService.merge_files(str(guideline_path), paths[0], {'Consumer App': 'Source Application'})
+        resolved: List[List[str]] = []
+        original = MergeService._resolve_mappings
+        monkeypatch.setattr(
+            MergeService, '_resolve_mappings', lambda headers, *args: resolved.append(headers) or original(headers, *args)
+        )
+
+        merged: DataFrame = pd.read_csv(StringIO(MergeService.merge_files(str(guideline_path), paths[1])), dtype=str)
+
+        assert merged['Source Application'].tolist() == ['app2']
+        assert resolved == []
+
+        # Plans compiled under other conversion rules are recompiled, keeping the saved mappings
+        monkeypatch.setattr(MergeService, 'plan_rules', 'changed')
+        plan = MergeService.merge_plan(GuidelineService.load(str(guideline_path)), ['Consumer App', 'Target Port'])
+        assert resolved == [['Consumer App', 'Target Port']]
+        assert plan.custom_mappings == {'Consumer App': 'Source Application'}
+
+    def test_added_mappings_keep_the_saved_ones_until_removed(self, tmp_path) -> None:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        guideline_path.write_text('Source Application,Destination Port\n')
+        input_path = tmp_path / TEST_EXCEL_INPUT
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'Consumer App': ['app1'], 'Target Port': ['8080']}).to_excel(writer, index=False)
+        guideline = GuidelineService.load(str(guideline_path))
+        headers: List[str] = ['Consumer App', 'Target Port']
+
+        MergeService.merge_plan(guideline, headers, {'Consumer App': 'Source Application'})
+        merged: DataFrame = pd.read_csv(StringIO(MergeService.merge_files(
+            str(guideline_path), str(input_path), {'Target Port': 'Destination Port'}
+        )), dtype=str)
+
+        assert merged.to_dict('list') == {'Source Application': ['app1'], 'Destination Port': ['8080']}
+        plan = MergeService.merge_plan(guideline, headers, removed=['Consumer App'])
+        assert plan.custom_mappings == {'Target Port': 'Destination Port'}
+        assert MergeService.merge_plan(guideline, headers).mappings == {'Target Port': 'Destination Port'}
+
+
+class TestCacheService:
+    def test_merge_writes_and_reuses_cache(self, tmp_path) -> None:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        input_path = tmp_path / TEST_EXCEL_INPUT
+        pd.DataFrame({'Source Application': [], 'Num Flows': []}).to_csv(guideline_path, index=False)
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'Source App Label': ['app1', None], 'Total Connection Count': [1, 2]}).to_excel(
+                writer, index=False
+            )
+
+        first: str = MergeService.merge_files(str(guideline_path), str(input_path))
+
+        assert os.path.exists(CacheService.cache_path(str(input_path)))
+        cached_batches = CacheService.read_batches(str(input_path))
+        assert pd.concat(cached_batches).values.tolist() == [['app1', '1'], [None, '2']]
+        assert MergeService.merge_files(str(guideline_path), str(input_path)) == first
+
+    def test_evict_least_recently_used(self) -> None:
+        paths: List[str] = [CacheService.cache_path(os.path.join(UPLOAD_FOLDER, f'{i}_input.xlsx')) for i in range(3)]
+        for age, path in enumerate(paths):
+            with open(path, 'wb') as f:
+                f.write(b'0' * 100)
+            os.utime(path, (1000 - age, 1000 - age))
+
+        CacheService.evict(max_bytes=150)
+
+        assert [os.path.exists(path) for path in paths] == [True, False, False]
+
+
+class TestBlobService:
+    def test_identical_uploads_share_blob_and_parse(self, monkeypatch) -> None:
+        workbook: BytesIO = BytesIO()
+        with pd.ExcelWriter(workbook, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'Name': ['a']}).to_excel(writer, index=False)
+        first, _ = FileService.save_input_file(FileStorage(BytesIO(workbook.getvalue()), TEST_FORMAT_XLSX))
+        second, _ = FileService.save_input_file(FileStorage(BytesIO(workbook.getvalue()), TEST_FORMAT_XLSX))
+
+        blob_path: str = BlobService.resolve(first)
+        assert blob_path == BlobService.resolve(second) != first
+        assert os.stat(blob_path).st_nlink == 3
+
+        assert FileService.read_input_headers(first) == ['Name']
+        monkeypatch.setattr('app.services.file_service.read_header_row', None)
+        assert FileService.read_input_headers(second) == ['Name']
+
+        FileService.cleanup_file(first)
+        assert os.path.exists(blob_path) and os.path.exists(CacheService.headers_path(second))
+        FileService.cleanup_file(second)
+        assert os.listdir(UPLOAD_FOLDER) == []
+
+    @pytest.mark.parametrize('existing', [False, True])
+    def test_adopt_in_place_leaves_no_temporary_link(self, existing: bool) -> None:
+        digest: str = hashlib.sha256(b'export').hexdigest()
+        if existing:
+            other: str = os.path.join(UPLOAD_FOLDER, f'other_{TEST_FORMAT_XLSX}')
+            BlobService.save(BytesIO(b'export'), other)
+        path: str = os.path.join(UPLOAD_FOLDER, f'upload_{TEST_FORMAT_XLSX}')
+        with open(path, 'wb') as f:
+            f.write(b'export')
+
+        BlobService.adopt(path, digest, path)
+
+        blob_path: str = BlobService.resolve(path)
+        assert blob_path == BlobService.blob_path(digest, '.xlsx')
+        assert os.stat(blob_path).st_nlink == (3 if existing else 2)
+        assert not [name for name in os.listdir(UPLOAD_FOLDER) if name.endswith('.tmp')]
+
+
+class TestGuidelineService:
+    def test_same_content_is_parsed_once(self, tmp_path, monkeypatch) -> None:
+        GuidelineService.clear()
+        parsed: List[str] = []
+        read_headers = FileService.read_guideline_headers
+        monkeypatch.setattr(FileService, 'read_guideline_headers', lambda path: parsed.append(path) or read_headers(path))
+
+        first_path, second_path = tmp_path / 'first.csv', tmp_path / 'second.csv'
+        for path in (first_path, second_path):
+            path.write_text('Source Application,Num Flows\napp1,1\n')
+
+        first = GuidelineService.load(str(first_path))
+        second = GuidelineService.load(str(second_path))
+
+        assert first is second
+        assert first.headers == ['Source Application', 'Num Flows']
+        assert parsed == [str(first_path)]
+
+    def test_mappings_are_memoized_on_guideline(self, tmp_path) -> None:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        guideline_path.write_text('Source Application,Num Flows\n')
+        guideline = GuidelineService.load(str(guideline_path))
+
+        result: Dict[str, List[str]] = MergeService.compare_headers(guideline, ['Source App Label', 'Other'])
+
+        assert result[HEADERS_MATCHED] == ['Source Application']
+        assert guideline.mapping_cache == {'Source App Label': 'Source Application', 'Other': None}
+        assert guideline.trim_mapping_cache(2) == {'Source App Label': 'Source Application', 'Other': None}
+        assert guideline.trim_mapping_cache(1) == {}
+
+
+class TestHeaderMatcher:
+    def test_matches_like_linear_scan(self) -> None:
+        matcher: HeaderMatcher = HeaderMatcher({
+            "Source Env": "Source Environment",
+            "env": "Environment",
+            "Count": "Num Flows",
+            "Total Connection Count": "Total",
+        })
+
+        assert matcher.convert("Source Env") == "Source Environment"
+        assert matcher.convert("SOURCE ENV") == "Source Environment"
+        # Substring hits resolve to the earliest pattern in table order
+        assert matcher.convert("Destination Env Name") == "Environment"
+        assert matcher.convert("total connection count (sum)") == "Num Flows"
+        assert matcher.convert("Unrelated") == "Unrelated"
+
+    def test_load_extends_table_from_file(self, tmp_path) -> None:
+        conversions_path = tmp_path / "conversions.csv"
+        conversions_path.write_text("pattern,replacement\nConsumer App,Source Application\n")
+
+        matcher: HeaderMatcher = HeaderMatcher.load(FULL_HEADER_CONVERSIONS, str(conversions_path))
+
+        assert len(matcher) == len(FULL_HEADER_CONVERSIONS) + 1
+        assert matcher.convert("consumer app") == "Source Application"
+        assert matcher.convert("Source App Label") == "Source Application"
+
+
+class TestValidationService:
+    @pytest.fixture
+    def upload_set(self, tmp_path) -> Tuple[str, List[str]]:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        guideline_path.write_text('Source Application,Num Flows\n')
+
+        filepaths: List[str] = []
+        for index, columns in enumerate([['Source App Label'], ['Num Flows', 'Extra'], ['Other']]):
+            input_path = tmp_path / f'{index}_{TEST_EXCEL_INPUT}'
+            with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+                pd.DataFrame({column: [1] for column in columns}).to_excel(writer, index=False)
+            filepaths.append(str(input_path))
+
+        corrupt_path = tmp_path / TEST_FORMAT_XLS
+        corrupt_path.write_bytes(b'not an excel file')
+        filepaths.insert(1, str(corrupt_path))
+        return str(guideline_path), filepaths
+
+    def test_parallel_results_keep_order_and_errors(self, upload_set) -> None:
+        guideline_path, filepaths = upload_set
+
+        results = ValidationService.validate_files(guideline_path, filepaths, workers=2)
+
+        assert results[0][HEADERS_MATCHED] == ['Source Application']
+        assert isinstance(results[1], Exception)
+        assert results[2][HEADERS_EXTRA] == ['Extra']
+        assert results[3][HEADERS_MISSING] == ['Num Flows', 'Source Application']
+        assert ValidationService.validate_files(guideline_path, filepaths, workers=1)[2] == results[2]
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='patch must reach forked workers')
+    def test_worker_crash_only_fails_its_file(self, upload_set, monkeypatch) -> None:
+        guideline_path, filepaths = upload_set
+        ValidationService.shutdown()
+        # Forked, not started from the fork server, so the patch below reaches the workers
+        monkeypatch.setattr('app.services.validation_service.UPLOAD_WORKER_START_METHOD', 'fork')
+        read_headers = FileService.read_input_headers
+
+        def crash_on_first(filepath: str, sheet_index: int = 0) -> List[str]:
+            if filepath == filepaths[0]:
+                os._exit(1)
+            return read_headers(filepath, sheet_index)
+
+        monkeypatch.setattr(FileService, 'read_input_headers', crash_on_first)
+        try:
+            results = ValidationService.validate_files(guideline_path, filepaths, workers=2)
+        finally:
+            ValidationService.shutdown()
+
+        assert isinstance(results[0], RuntimeError)
+        assert isinstance(results[1], Exception)
+        assert results[2][HEADERS_EXTRA] == ['Extra']
+        assert results[3][HEADERS_MISSING] == ['Num Flows', 'Source Application']
+
+    def test_each_sheet_validated_and_best_one_merged(self, tmp_path) -> None:
+        guideline_path = tmp_path / GUIDELINE_FILENAME
+        guideline_path.write_text('Source Application,Num Flows\n')
+        input_path = tmp_path / TEST_EXCEL_INPUT
+        with pd.ExcelWriter(input_path, engine=OPENPYXL_ENGINE) as writer:
+            pd.DataFrame({'Exported': ['today']}).to_excel(writer, sheet_name='Summary', index=False)
+            pd.DataFrame({'Source App Label': ['app1'], 'Num Flows': [3]}).to_excel(
+                writer, sheet_name='Flows', index=False
+            )
+
+        assert FileService.list_sheets(str(input_path)) == ['Summary', 'Flows']
+        result: Dict = validate_file(str(guideline_path), str(input_path))
+
+        assert result['sheet'] == 1
+        assert sorted(result[HEADERS_MATCHED]) == ['Num Flows', 'Source Application']
+        assert [(sheet['name'], sheet[HEADERS_EXTRA]) for sheet in result['sheets']] == [
+            ('Summary', ['Exported']), ('Flows', [])
+        ]
+        merged: DataFrame = pd.read_csv(
+            StringIO(MergeService.merge_files(str(guideline_path), str(input_path), sheet_index=1)), dtype=str
+        )
+        assert merged.values.tolist() == [['app1', '3']]
+        # Each sheet has its own cache; the unpicked sheet was never parsed
+        assert os.path.exists(CacheService.cache_path(str(input_path), 1))
+        assert not os.path.exists(CacheService.cache_path(str(input_path), 0))
+        CacheService.remove(str(input_path))
+
+
+class TestUploadService:
+    def test_checksum_survives_lost_hash_state(self) -> None:
+        """A process that missed earlier chunks hashes only what it has not seen"""
+        upload: Dict = UploadService.create('export.xlsx')
+        UploadService.append(upload['upload_id'], 0, BytesIO(b'first chunk,'))
+        UploadService._hashes.clear()
+        offset: int = UploadService.append(upload['upload_id'], 12, BytesIO(b'second chunk'))
+
+        completed: Dict = UploadService.complete(upload['upload_id'])
+
+        assert offset == 24
+        assert completed['sha256'] == hashlib.sha256(b'first chunk,second chunk').hexdigest()
+        with pytest.raises(ValueError):
+            UploadService.complete(upload['upload_id'], expected_sha256='0' * 64)
+
+    def test_offset_checked_under_a_lock_shared_with_other_processes(self) -> None:
+        upload: Dict = UploadService.create('export.xlsx')
+        path: str = os.path.join(UPLOAD_FOLDER, f"{upload['upload_id']}_export.xlsx")
+        outcome: List = []
+
+        def append() -> None:
+            try:
+                outcome.append(UploadService.append(upload['upload_id'], 0, BytesIO(b'late chunk')))
+            except OffsetMismatch as e:
+                outcome.append(e.offset)
+
+        # Another process (an fd of its own, as flock sees it) appends a chunk while holding the lock
+        with open(path, 'ab') as other:
+            fcntl.flock(other.fileno(), fcntl.LOCK_EX)
+            thread = threading.Thread(target=append)
+            thread.start()
+            thread.join(0.2)
+            assert thread.is_alive()
+            other.write(b'first chunk')
+            other.flush()
+            fcntl.flock(other.fileno(), fcntl.LOCK_UN)
+        thread.join()
+
+        assert outcome == [11]
+        assert UploadService.status(upload['upload_id'])['offset'] == 11
+
+    def test_hashes_of_abandoned_uploads_are_evicted(self, monkeypatch) -> None:
+        monkeypatch.setattr('app.services.upload_service.UPLOAD_HASHES_MAX', 2)
+        uploads: List[str] = [UploadService.create('export.xlsx')['upload_id'] for _ in range(3)]
+        for upload_id in uploads:
+            UploadService.append(upload_id, 0, BytesIO(b'chunk'))
+
+        assert list(UploadService._hashes) == uploads[1:]
+        assert UploadService.complete(uploads[0])['sha256'] == hashlib.sha256(b'chunk').hexdigest()
+        assert uploads[0] not in UploadService._hashes
+
+
+class TestJanitorService:
+    def save_upload(self, content: bytes, age: float) -> str:
+        filepath, _ = FileService.save_input_file(FileStorage(BytesIO(content), TEST_FORMAT_XLSX))
+        os.utime(filepath, (time.time() - age, time.time() - age))
+        return filepath
+
+    def test_sweep_expires_unused_files_and_keeps_live_ones(self) -> None:
+        expired: str = self.save_upload(b'old export', age=7200)
+        live: str = self.save_upload(b'new export', age=0)
+        CacheService.write_headers(expired, ['Name'])
+
+        stats: Dict = JanitorService.sweep(ttl=3600)
+
+        assert stats['removed'] == 1
+        assert not os.path.exists(expired)
+        assert os.path.exists(live)
+        assert sorted(os.listdir(UPLOAD_FOLDER)) == sorted([os.path.basename(live), os.path.basename(BlobService.resolve(live))])
+
+    def test_quota_evicts_least_recently_used_outside_live_window(self) -> None:
+        oldest: str = self.save_upload(b'a' * 1000, age=300)
+        older: str = self.save_upload(b'b' * 1000, age=200)
+        live: str = self.save_upload(b'c' * 1000, age=0)
+
+        stats: Dict = JanitorService.sweep(ttl=3600, max_bytes=1500, live_seconds=60)
+
+        assert not os.path.exists(oldest) and not os.path.exists(older)
+        assert os.path.exists(live)
+        assert stats['evicted'] == 2
+
+    def test_quota_keeps_files_of_idle_sessions_that_have_not_expired(self) -> None:
+        abandoned: str = self.save_upload(b'a' * 1000, age=300)
+        saved: str = self.save_upload(b'b' * 1000, age=300)
+        guideline: str = self.save_upload(b'c' * 1000, age=300)
+        SessionService.set_files('idle-session', [{'id': 'file-0', 'path': saved}])
+        with SessionService._connect() as connection:
+            connection.execute(
+                "UPDATE sessions SET data = ? WHERE id = 'idle-session'",
+                (json.dumps({SESSION_GUIDELINE_PATH: guideline}),)
+            )
+
+        stats: Dict = JanitorService.sweep(ttl=3600, max_bytes=1500, live_seconds=60)
+
+        assert not os.path.exists(abandoned)
+        assert os.path.exists(saved) and os.path.exists(guideline)
+        assert stats['evicted'] == 1
+
+    def test_one_process_sweeps_at_a_time(self) -> None:
+        try:
+            assert JanitorService._acquire_lease()
+            # Another process opens the lock file on its own and cannot take the lock
+            with open(JANITOR_LOCK_PATH, 'a') as other:
+                with pytest.raises(BlockingIOError):
+                    fcntl.flock(other.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            old: float = time.time() - 7200
+            os.utime(JANITOR_LOCK_PATH, (old, old))
+            JanitorService.sweep(ttl=3600)
+            assert os.path.exists(JANITOR_LOCK_PATH)
+        finally:
+            JanitorService._release_lease()
+
+        with open(JANITOR_LOCK_PATH, 'a') as other:
+            fcntl.flock(other.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            assert not JanitorService._acquire_lease()
+
+    def test_sweep_forgets_merge_plans_unused_for_their_ttl(self, monkeypatch) -> None:
+        monkeypatch.setattr('app.services.plan_service.MERGE_PLAN_REFRESH_SECONDS', 60)
+        plan = MergePlan(['Source Application'], {}, {}, {'Consumer App': 'Source Application'})
+        for input_hash in ('read', 'unread'):
+            PlanService.put('guideline', input_hash, plan)
+        with PlanService._connect() as connection:
+            connection.execute("UPDATE merge_plans SET updated = ?", (time.time() - 7200,))
+
+        # Reading a plan marks it as used
+        assert PlanService.get('guideline', 'read').custom_mappings == plan.custom_mappings
+        JanitorService.sweep(ttl=3600, plan_ttl=3600)
+
+        assert PlanService.get('guideline', 'read') is not None
+        assert PlanService.get('guideline', 'unread') is None
+
+
+class TestSessionService:
+    def test_files_looked_up_by_id_and_purged_with_their_session(self) -> None:
+        records: List[Dict] = [{'id': f'file-{index}', 'path': f'/tmp/{index}.xlsx'} for index in range(50)]
+        SessionService.set_files('session-a', records)
+        SessionService.set_files('session-b', records[:1])
+
+        assert SessionService.get_file('session-a', 'file-42') == records[42]
+        assert SessionService.get_file('session-b', 'file-42') is None
+        assert SessionService.list_files('session-a') == records
+
+        SessionService.set_files('session-a', records[:2])
+        assert SessionService.list_files('session-a') == records[:2]
+
+        SessionService.purge(time.time() + 1)
+        assert SessionService.list_files('session-a') == []
+        assert SessionService.get_file('session-b', 'file-0') is None
+
+    def test_requests_of_a_thread_share_one_connection(self) -> None:
+        connection = SessionService._connect()
+        SessionService.set_files('session-a', [{'id': 'file-0'}])
+
+        assert SessionService.get_file('session-a', 'file-0') == {'id': 'file-0'}
+        assert SessionService._connect() is connection
+
+
+class TestJobService:
+    def test_recovery_only_fails_jobs_whose_process_is_gone(self) -> None:
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        JobService.shutdown()
+        owners: Dict[str, Tuple[int, str]] = {
+            'live': (os.getppid(), 'other-process'),
+            'exited': (exited.pid, 'other-process'),
+            'reused-pid': (os.getpid(), 'earlier-process')
+        }
+        JobService._write([
+            ("INSERT INTO jobs (id, kind, status, created, updated, session_id, owner_pid, owner) "
+             "VALUES (?, 'merge', 'running', 0, 0, 'session-a', ?, ?)", (job_id, pid, owner))
+            for job_id, (pid, owner) in owners.items()
+        ])
+
+        try:
+            JobService.submit('merge', [], lambda job_id: {}, 'session-a')
+        finally:
+            JobService.shutdown()
+
+        assert JobService.get('live', 'session-a')['status'] == 'running'
+        assert JobService.get('exited', 'session-a')['status'] == 'failed'
+        assert JobService.get('reused-pid', 'session-a')['status'] == 'failed'
+        assert JobService.get('live', 'session-b') is None
+
+    def test_progress_rows_are_written_in_steps(self, monkeypatch) -> None:
+        monkeypatch.setattr('app.services.job_service.JOB_PROGRESS_ROWS', 100)
+        monkeypatch.setattr('app.services.job_service.JOB_PROGRESS_SECONDS', 3600)
+        JobService._write([
+            ("INSERT INTO jobs (id, kind, status, created, updated, session_id) "
+             "VALUES ('job', 'merge', 'running', 0, 0, 'session-a')", ()),
+            ("INSERT INTO job_files (job_id, position, name, status) VALUES ('job', 0, 'a.xlsx', 'running')", ()),
+        ])
+
+        def rows() -> int:
+            return JobService.get('job', 'session-a')['files'][0]['rows']
+
+        JobService.update_file('job', 0, add_rows=10)
+        assert rows() == 10
+        for _ in range(9):
+            JobService.update_file('job', 0, add_rows=10)
+        assert rows() == 10
+        JobService.update_file('job', 0, add_rows=10)
+        assert rows() == 110
+        JobService.update_file('job', 0, add_rows=5)
+        JobService._set_status('job', 'done', from_status='running')
+        assert rows() == 115 and JobService._progress == {}
+
+    def test_database_keeps_a_connection_per_thread(self, tmp_path) -> None:
+        from app.utils.database import Database
+        setups: List[int] = []
+        database = Database(str(tmp_path / 'db' / 'test.sqlite3'), 'CREATE TABLE IF NOT EXISTS t (x);',
+                            lambda connection: setups.append(1))
+
+        connection = database.connect()
+        assert database.connect() is connection and setups == [1]
+        other: List = []
+        thread = threading.Thread(target=lambda: other.append(database.connect()))
+        thread.start()
+        thread.join()
+        assert other[0] is not connection and setups == [1]
+        # A removed file is created again, with its schema
+        os.remove(database.path)
+        with database.connect() as connection:
+            connection.execute('INSERT INTO t VALUES (1)')
+        assert setups == [1, 1]
+
 
 class TestDirectoryService:
     def test_ensure_upload_dirs(self) -> None:
@@ -201,5 +1061,38 @@ class TestDirectoryService:
         assert all(not os.path.exists(file) for file in test_files)
 
 
+class TestMetricsService:
+    def test_nested_stages_are_exclusive(self) -> None:
+        MetricsService.reset()
+        MetricsService.begin_request()
+
+        def slow_batches():
+            for _ in range(2):
+                with MetricsService.stage('parse'):
+                    time.sleep(0.02)
+                yield 1
+
+        with MetricsService.stage('csv'):
+            assert sum(MetricsService.timed('mapping', slow_batches())) == 2
+
+        stages: Dict[str, float] = MetricsService.request_stages()
+        assert stages['parse'] >= 0.04
+        assert stages['mapping'] < 0.02 and stages['csv'] < 0.02
+        assert 'parse;dur=' in MetricsService.server_timing(stages, 0.05)
+
+    def test_render_prometheus_text(self) -> None:
+        MetricsService.reset()
+        MetricsService.observe('request_seconds', 0.3, endpoint='main.upload_file')
+        MetricsService.inc('bytes_total', 2_500_000, direction='in')
+
+        text: str = MetricsService.render()
+
+        assert '# TYPE excel_validator_request_seconds histogram' in text
+        assert 'excel_validator_request_seconds_bucket{endpoint="main.upload_file",le="0.25"} 0' in text
+        assert 'excel_validator_request_seconds_bucket{endpoint="main.upload_file",le="0.5"} 1' in text
+        assert 'excel_validator_request_seconds_bucket{endpoint="main.upload_file",le="+Inf"} 1' in text
+        assert 'excel_validator_bytes_total{direction="in"} 2500000' in text
+
+
 if __name__ == '__main__':
-    pytest.main()
\ No newline at end of file
+    pytest.main()
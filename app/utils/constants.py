@@ -1,5 +1,5 @@
 import os
-from typing import Dict
+from typing import Dict, List
 
 # File size limits
 MAX_FILE_SIZE_MB: int = 100
@@ -8,6 +8,158 @@ MAX_FILE_SIZE_BYTES: int = MAX_FILE_SIZE_MB * 1024 * 1024
 # Read engines
 OPENPYXL_ENGINE: str = 'openpyxl'
 XLRD_ENGINE: str = 'xlrd'
+CALAMINE_ENGINE: str = 'calamine'
+PANDAS_ENGINE: str = 'pandas'
+# Workbook containers, told apart by their first bytes
+CONTAINER_OOXML: str = 'ooxml'
+CONTAINER_OLE2: str = 'ole2'
+CONTAINER_ENCRYPTED: str = 'encrypted'
+CONTAINER_UNKNOWN: str = 'unknown'
+# Reader engines per file extension, first available wins. Override with READER_ENGINES,
+# e.g. "xlsx=openpyxl;xls=xlrd,calamine"
+READER_ENGINES: Dict[str, List[str]] = {
+    'xlsx': [CALAMINE_ENGINE, OPENPYXL_ENGINE],
+    'xlsm': [CALAMINE_ENGINE, OPENPYXL_ENGINE],
+    'xls': [CALAMINE_ENGINE, XLRD_ENGINE],
+}
+READER_ENGINES.update({
+    extension.strip().lower(): [name.strip() for name in names.split(',') if name.strip()]
+    for extension, _, names in (
+        item.partition('=') for item in os.environ.get('READER_ENGINES', '').split(';') if '=' in item
+    )
+})
+# Whole sheets of files from this size on are read by the first configured engine that streams rows
+# (openpyxl): calamine loads a sheet before returning its first row, about 13 MB of memory per MB of
+# .xlsx, while openpyxl's memory stays flat, at a tenth of the speed
+STREAMING_READ_MIN_BYTES: int = int(os.environ.get('STREAMING_READ_MIN_BYTES', 16 * 1024 * 1024))
+
+# Guideline CSV encoding (tolerates the BOM Excel writes)
+GUIDELINE_ENCODING: str = 'utf-8-sig'
+
+# Streaming merge: rows per batch read from the workbook and written as CSV
+MERGE_BATCH_ROWS: int = 10_000
+
+# Cell strings pd.read_excel parses as missing, kept so streamed merges match it
+NA_VALUES: set[str] = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+
+# Merge engines: the pandas dataframe merge, or the Arrow columnar merge with Arrow's CSV writer
+MERGE_ENGINE_PANDAS: str = 'pandas'
+MERGE_ENGINE_ARROW: str = 'arrow'
+MERGE_ENGINE: str = os.environ.get('MERGE_ENGINE', MERGE_ENGINE_PANDAS)
+
+# Merge all: files merged concurrently, and CSV chunks buffered per file while waiting to be sent
+MERGE_ALL_WORKERS: int = 4
+MERGE_ALL_QUEUE_CHUNKS: int = 4
+MERGE_ALL_FORMAT_ZIP: str = 'zip'
+MERGE_ALL_FORMAT_CSV: str = 'csv'
+MERGE_ALL_FILENAME: str = 'merged_files'
+SOURCE_FILE_COLUMN: str = 'Source File'
+
+# Output formats of a single merged file, all encoded from the same stream of merged batches
+OUTPUT_FORMAT_CSV: str = 'csv'
+OUTPUT_FORMAT_CSV_GZ: str = 'csv.gz'
+OUTPUT_FORMAT_XLSX: str = 'xlsx'
+OUTPUT_FORMAT_PARQUET: str = 'parquet'
+GZIP_LEVEL: int = int(os.environ.get('GZIP_LEVEL', 6))
+PARQUET_COMPRESSION: str = os.environ.get('PARQUET_COMPRESSION', 'snappy')
+XLSX_SHEET_TITLE: str = 'Merged'
+# Encoded output handed over in chunks of about this size, at most OUTPUT_QUEUE_CHUNKS of them buffered
+OUTPUT_CHUNK_BYTES: int = 64 * 1024
+OUTPUT_QUEUE_CHUNKS: int = 4
+
+# Parsed-workbook cache (Arrow IPC files next to the uploads, evicted least recently used first)
+WORKBOOK_CACHE_EXTENSION: str = '.arrow'
+WORKBOOK_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+HEADERS_CACHE_EXTENSION: str = '.headers.json'
+# Caches of sheets after the first are named <blob>.sheet<index><extension>
+SHEET_CACHE_INFIX: str = '.sheet'
+
+# Content-addressed upload store: blob_<sha256><ext>, hard-linked from each upload's path
+BLOB_PREFIX: str = 'blob_'
+
+# Guideline registry: parsed guidelines kept in memory, keyed by content hash
+GUIDELINE_REGISTRY_SIZE: int = 64
+GUIDELINE_MAPPING_CACHE_SIZE: int = 10_000
+HASH_CHUNK_BYTES: int = 1024 * 1024
+
+# Upload validation: worker processes used to validate several input files in parallel
+UPLOAD_WORKERS: int = int(os.environ.get('UPLOAD_WORKERS', min(os.cpu_count() or 1, 8)))
+# Workers are started from a fork server rather than forked from the (multithreaded) web process,
+# whose locks another thread may hold at the moment of the fork
+UPLOAD_WORKER_START_METHOD: str = os.environ.get('UPLOAD_WORKER_START_METHOD', 'forkserver')
+
+# Imported on first use by the outputs and engines needing them; imported up front by app.warm for preloading.
+# pandas, numpy and pyarrow are not deferred: every upload and merge uses them
+PRELOAD_MODULES: List[str] = [
+    'openpyxl', 'openpyxl.cell.cell', 'openpyxl.writer.excel', 'pyarrow.csv', 'pyarrow.parquet'
+]
+
+# Batch command line (python -m app.cli): default output directory and the manifest written there
+CLI_OUTPUT_DIR: str = 'merged'
+CLI_MANIFEST_FILENAME: str = 'manifest.json'
+
+# Resumable uploads: chunks are appended to the input file in place (one request per chunk is
+# still bound by MAX_CONTENT_LENGTH, the whole upload by RESUMABLE_UPLOAD_MAX_BYTES)
+UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+RESUMABLE_UPLOAD_MAX_BYTES: int = int(os.environ.get('RESUMABLE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+# Uploads whose running SHA-256 is kept in memory per process; others are rehashed from disk when resumed
+UPLOAD_HASHES_MAX: int = int(os.environ.get('UPLOAD_HASHES_MAX', 256))
+UPLOAD_STATE_EXTENSION: str = '.upload.json'
+UPLOAD_OFFSET_HEADER: str = 'Upload-Offset'
+
+# Background jobs: worker threads, and the SQLite file holding job state and per-file progress
+JOB_WORKERS: int = int(os.environ.get('JOB_WORKERS', 2))
+# Per-file row counts are written once this many rows or seconds have passed since the last write
+JOB_PROGRESS_ROWS: int = int(os.environ.get('JOB_PROGRESS_ROWS', 50_000))
+JOB_PROGRESS_SECONDS: float = float(os.environ.get('JOB_PROGRESS_SECONDS', 1.0))
+JOB_STATUS_QUEUED: str = 'queued'
+JOB_STATUS_RUNNING: str = 'running'
+JOB_STATUS_DONE: str = 'done'
+JOB_STATUS_FAILED: str = 'failed'
+JOB_KIND_UPLOAD: str = 'upload'
+JOB_KIND_MERGE: str = 'merge'
+JOB_READ_CHUNK_BYTES: int = 64 * 1024
+
+# Janitor: files unused for the TTL are removed; over the quota, least recently used files are
+# evicted, except files of unexpired sessions and files used within the live window (not yet in a session)
+JANITOR_ENABLED: bool = os.environ.get('JANITOR_ENABLED', '1') not in ('0', 'false', 'False')
+JANITOR_TTL_SECONDS: int = int(os.environ.get('JANITOR_TTL_SECONDS', 24 * 60 * 60))
+JANITOR_LIVE_SECONDS: int = int(os.environ.get('JANITOR_LIVE_SECONDS', 2 * 60 * 60))
+JANITOR_MAX_BYTES: int = int(os.environ.get('JANITOR_MAX_BYTES', 20 * 1024 * 1024 * 1024))
+JANITOR_INTERVAL_SECONDS: int = int(os.environ.get('JANITOR_INTERVAL_SECONDS', 10 * 60))
+
+# Metrics: Prometheus text served at /metrics, and per-request stage timings in Server-Timing headers
+METRICS_PREFIX: str = 'excel_validator'
+METRICS_BUCKETS: List[float] = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+METRICS_CONTENT_TYPE: str = 'text/plain; version=0.0.4; charset=utf-8'
+SERVER_TIMING_HEADER: str = 'Server-Timing'
+
+# Date normalization on merge. A column is treated as a date when its input or guideline
+# header is listed here (extend with a comma-separated DATE_COLUMNS environment variable)
+DATE_COLUMNS: frozenset[str] = frozenset(
+    {'First Detected Date', 'Last Detected Date', 'First Detected', 'Last Detected'}
+    | {column.strip() for column in os.environ.get('DATE_COLUMNS', '').split(',') if column.strip()}
+)
+# Value checks. Rows under the guideline header may hold directives for their column:
+# "type: integer" (or number, date, text) and "allowed: a|b|c". Blank cells are never invalid
+COLUMN_TYPE_TEXT: str = 'text'
+COLUMN_TYPE_INTEGER: str = 'integer'
+COLUMN_TYPE_NUMBER: str = 'number'
+COLUMN_TYPE_DATE: str = 'date'
+COLUMN_TYPES: frozenset[str] = frozenset({COLUMN_TYPE_TEXT, COLUMN_TYPE_INTEGER, COLUMN_TYPE_NUMBER, COLUMN_TYPE_DATE})
+GUIDELINE_TYPE_DIRECTIVE: str = 'type:'
+GUIDELINE_ALLOWED_DIRECTIVE: str = 'allowed:'
+ALLOWED_VALUES_SEPARATOR: str = '|'
+# Row numbers of invalid values reported per column
+VALUE_CHECK_SAMPLE_ROWS: int = 5
+
+# Numbers in a date column within this range are Excel serial dates (~1927 to 9999-12-31)
+EXCEL_EPOCH: str = '1899-12-30'
+EXCEL_SERIAL_MIN: int = 10_000
+EXCEL_SERIAL_MAX: int = 2_958_465
 
 # File extensions
 ALLOWED_INPUT_EXTENSIONS: set[str] = {'xlsx', 'xls'}
@@ -21,18 +173,50 @@ RESULTS_TEMPLATE = 'results.html'
 HEADERS_MISSING: str = 'missing_headers'
 HEADERS_EXTRA: str = 'extra_headers'
 HEADERS_MATCHED: str = 'matched_headers'
+VALUE_CHECKS: str = 'value_checks'
 
 # Content types
 CSV_CONTENT_TYPE: str = 'text/csv'
+ZIP_CONTENT_TYPE: str = 'application/zip'
 FORM_DATA_TYPE: str = 'multipart/form-data'
 EXCEL_CONTENT_TYPE: str = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+GZIP_CONTENT_TYPE: str = 'application/gzip'
+PARQUET_CONTENT_TYPE: str = 'application/vnd.apache.parquet'
+OUTPUT_CONTENT_TYPES: Dict[str, str] = {
+    OUTPUT_FORMAT_CSV: CSV_CONTENT_TYPE,
+    OUTPUT_FORMAT_CSV_GZ: GZIP_CONTENT_TYPE,
+    OUTPUT_FORMAT_XLSX: EXCEL_CONTENT_TYPE,
+    OUTPUT_FORMAT_PARQUET: PARQUET_CONTENT_TYPE,
+}
 
 # Directory paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 UPLOAD_FOLDER: str = os.path.join(BASE_DIR, 'uploads')
 TEMP_FOLDER: str = os.path.join(BASE_DIR, 'temp')
 SESSION_GUIDELINE_PATH: str = 'guideline_path'
-SESSION_SAVED_PATH: str = 'saved_files'
+# When a session was started, set by requests that need it kept before anything else is stored in it
+SESSION_CREATED: str = 'created'
+JOBS_DB_PATH: str = os.environ.get('JOBS_DB_PATH', os.path.join(TEMP_FOLDER, 'jobs.sqlite3'))
+# Held (flock) by the one process whose janitor sweeps; the other processes' janitors wait to take over
+JANITOR_LOCK_PATH: str = os.environ.get('JANITOR_LOCK_PATH', os.path.join(TEMP_FOLDER, 'janitor.lock'))
+# Server-side sessions: the cookie holds an id, session data and saved file records live in SQLite
+SESSIONS_DB_PATH: str = os.environ.get('SESSIONS_DB_PATH', os.path.join(TEMP_FOLDER, 'sessions.sqlite3'))
+# A session that is only read is marked as used (and its files touched) at most this often
+SESSION_REFRESH_SECONDS: int = int(os.environ.get('SESSION_REFRESH_SECONDS', 60))
+# Merge plans (resolved mappings, column order, converters and saved custom mappings) per guideline and input layout
+MERGE_PLANS_DB_PATH: str = os.environ.get('MERGE_PLANS_DB_PATH', os.path.join(TEMP_FOLDER, 'merge_plans.sqlite3'))
+# Plans unused for this long are forgotten by the janitor; a plan read is marked as used at most this often
+MERGE_PLAN_TTL_SECONDS: int = int(os.environ.get('MERGE_PLAN_TTL_SECONDS', 90 * 24 * 60 * 60))
+MERGE_PLAN_REFRESH_SECONDS: int = int(os.environ.get('MERGE_PLAN_REFRESH_SECONDS', 24 * 60 * 60))
+PROFILES_FOLDER: str = os.environ.get('PROFILES_FOLDER', os.path.join(BASE_DIR, 'profiles'))
+
+# Request profiling: off unless enabled, and then only for requests carrying the admin token
+PROFILING_ENABLED: bool = os.environ.get('PROFILING_ENABLED', '0') not in ('0', 'false', 'False')
+PROFILING_TOKEN: str = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_TOKEN_HEADER: str = 'X-Profile-Token'
+PROFILE_ID_HEADER: str = 'X-Profile-Id'
+PROFILING_TRACEMALLOC_FRAMES: int = 10
+PROFILING_TOP_ALLOCATIONS: int = 30
 
 # Flask configurations
 SECRET_KEY: str = 'dev'
@@ -48,6 +232,17 @@ MSG_INVALID_GUIDELINE: str = 'Invalid guideline format'
 MSG_FILE_TOO_LARGE: str = f'File size exceeds {MAX_FILE_SIZE_MB}MB limit'
 MSG_SESSION_EXPIRED: str = 'Session expired'
 MSG_FILE_NOT_FOUND: str = 'File not found'
+MSG_SHEET_NOT_FOUND: str = 'Sheet not found'
+MSG_INVALID_FORMAT: str = 'Unsupported download format'
+MSG_INVALID_ENGINE: str = 'Unsupported merge engine'
+MSG_INVALID_INPUT_FILE: str = 'Unsupported input file type'
+MSG_UPLOAD_NOT_FOUND: str = 'Upload not found'
+MSG_UPLOAD_INCOMPLETE: str = 'Upload is incomplete'
+MSG_UPLOAD_TOO_LARGE: str = 'Upload exceeds the maximum size'
+MSG_CHECKSUM_MISMATCH: str = 'Uploaded data does not match the checksum'
+MSG_JOB_NOT_FOUND: str = 'Job not found'
+MSG_JOB_NOT_FINISHED: str = 'Job has not finished yet'
+MSG_JOB_INTERRUPTED: str = 'The job was interrupted by a server restart'
 MSG_ENCRYPTED_FILE: str = (
     "This Excel file appears to be protected. Please follow these steps to create an unprotected copy:\n"
     "1. Open the original Excel file\n"
@@ -59,6 +254,7 @@ MSG_ENCRYPTED_FILE: str = (
     "6. Save the new file\n"
     "7. Upload the new file"
 )
+MSG_WORKER_CRASHED: str = 'The file could not be processed (the validation worker stopped unexpectedly)'
 MSG_ERROR: str = "Unable to read the Excel file. Please ensure it's a valid Excel file (.xlsx or .xls) and try again."
 
 # Files
@@ -70,6 +266,7 @@ TEST_EXCEL_INPUT: str = "input.xlsx"
 GUIDELINE_FILENAME: str = "guideline.csv"
 GUIDELINE_FILE: str = 'guideline_file'
 INPUT_FILE: str = 'input_files'
+UPLOAD_IDS: str = 'upload_ids'
 
 # Data
 BASE_TEST_DATA_LOCATION: Dict = {
@@ -79,6 +276,9 @@ BASE_TEST_DATA_LOCATION: Dict = {
 }
 
 ## Mapping
+# Optional JSON/CSV file of extra vendor aliases, appended to FULL_HEADER_CONVERSIONS
+HEADER_CONVERSIONS_PATH: str = os.environ.get('HEADER_CONVERSIONS_PATH', '')
+
 FULL_HEADER_CONVERSIONS: Dict[str, str] = {
     # Source
     "Source App Label": "Source Application",
@@ -0,0 +1,93 @@
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set
+
+from app.utils.constants import (
+    CONTAINER_OOXML, CONTAINER_OLE2, CONTAINER_ENCRYPTED, CONTAINER_UNKNOWN
+)
+
+_ZIP_SIGNATURES: tuple = (b'PK\x03\x04', b'PK\x05\x06')
+_OLE2_SIGNATURE: bytes = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+# Streams an encrypted OOXML package is wrapped in (MS-OFFCRYPTO)
+_ENCRYPTION_STREAMS: Set[str] = {'EncryptionInfo', 'EncryptedPackage'}
+
+_END_OF_CHAIN: int = 0xFFFFFFFE
+_DIRECTORY_ENTRY_BYTES: int = 128
+_HEADER_DIFAT_ENTRIES: int = 109
+# Guard against corrupt (cyclic) sector chains
+_MAX_CHAIN_SECTORS: int = 4096
+
+
+def sniff_container(filepath: str) -> str:
+    """Identify a workbook's container from its first bytes, without parsing the workbook.
+
+    Returns CONTAINER_OOXML for a ZIP package (.xlsx and friends), CONTAINER_OLE2
+    for a compound file (legacy .xls), CONTAINER_ENCRYPTED for a password
+    protected OOXML workbook (an OLE2 file holding the EncryptionInfo stream) and
+    CONTAINER_UNKNOWN for anything else.
+    """
+    with open(filepath, 'rb') as f:
+        header: bytes = f.read(512)
+        if header.startswith(_ZIP_SIGNATURES):
+            return CONTAINER_OOXML
+        if not header.startswith(_OLE2_SIGNATURE) or len(header) < 512:
+            return CONTAINER_UNKNOWN
+        try:
+            names: Set[str] = set(_ole2_entry_names(f, header))
+        except (OSError, struct.error, ValueError):
+            return CONTAINER_UNKNOWN
+    return CONTAINER_ENCRYPTED if names & _ENCRYPTION_STREAMS else CONTAINER_OLE2
+
+
+def _ole2_entry_names(f: BinaryIO, header: bytes) -> Iterator[str]:
+    """Names in an OLE2 compound file's directory, reading only the sectors needed to find it."""
+    sector_size: int = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+    if sector_size not in (512, 4096):
+        raise ValueError('Unsupported sector size')
+    first_directory_sector: int = struct.unpack_from('<I', header, 0x30)[0]
+    first_difat_sector, difat_sectors = struct.unpack_from('<II', header, 0x44)
+    entries_per_sector: int = sector_size // 4
+
+    def read_sector(sector: int) -> bytes:
+        f.seek((sector + 1) * sector_size)
+        data: bytes = f.read(sector_size)
+        if len(data) != sector_size:
+            raise ValueError('Truncated sector')
+        return data
+
+    # Locations of the FAT sectors: 109 in the header, the rest in the DIFAT chain (read on demand)
+    fat_sectors: List[int] = list(struct.unpack_from(f'<{_HEADER_DIFAT_ENTRIES}I', header, 0x4C))
+    fat_cache: Dict[int, tuple] = {}
+
+    def next_sector(sector: int) -> int:
+        nonlocal first_difat_sector, difat_sectors
+        index: int = sector // entries_per_sector
+        while index >= len(fat_sectors) and difat_sectors > 0:
+            difat = struct.unpack(f'<{entries_per_sector}I', read_sector(first_difat_sector))
+            fat_sectors.extend(difat[:-1])
+            first_difat_sector, difat_sectors = difat[-1], difat_sectors - 1
+        if index >= len(fat_sectors):
+            raise ValueError('Sector outside the FAT')
+        if index not in fat_cache:
+            fat_cache[index] = struct.unpack(f'<{entries_per_sector}I', read_sector(fat_sectors[index]))
+        return fat_cache[index][sector % entries_per_sector]
+
+    sector: int = first_directory_sector
+    for _ in range(_MAX_CHAIN_SECTORS):
+        if sector == _END_OF_CHAIN:
+            return
+        data: bytes = read_sector(sector)
+        for offset in range(0, sector_size, _DIRECTORY_ENTRY_BYTES):
+            name_bytes: int = struct.unpack_from('<H', data, offset + 0x40)[0]
+            if 2 <= name_bytes <= 64:
+                yield data[offset:offset + name_bytes - 2].decode('utf-16-le', errors='replace')
+        sector = next_sector(sector)
+    raise ValueError('Directory chain too long')
+
+
+def container_extension(container: str, extension: str) -> Optional[str]:
+    """The file extension whose reader engines fit the container: the file's own if it agrees."""
+    if container == CONTAINER_OOXML:
+        return extension if extension in ('xlsx', 'xlsm', 'xlsb') else 'xlsx'
+    if container == CONTAINER_OLE2:
+        return 'xls'
+    return None
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional, Tuple
+
+
+class Database:
+    """A SQLite file shared by the threads of the server processes.
+
+    Its schema is created once per process, on the first connection, together
+    with setup (migrations of databases created by older versions). Each thread
+    then keeps its own connection. A connection is replaced when the file it
+    opened is gone or replaced (the temp folder was cleared), or when it was
+    inherited from the parent of a forked worker.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: str,
+        setup: Optional[Callable[[sqlite3.Connection], None]] = None
+    ) -> None:
+        self.path: str = path
+        self.schema: str = schema
+        self.setup: Optional[Callable[[sqlite3.Connection], None]] = setup
+        self._local: threading.local = threading.local()
+        self._lock: threading.Lock = threading.Lock()
+        # Identity of the file whose schema this process has created
+        self._ready: Optional[Tuple[int, int]] = None
+
+    def _identity(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat: os.stat_result = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def connect(self) -> sqlite3.Connection:
+        """This thread's connection, with autocommit off: use it as a context manager to write."""
+        identity: Optional[Tuple[int, int]] = self._identity()
+        if identity is not None and getattr(self._local, 'key', None) == (os.getpid(), identity):
+            return self._local.connection
+
+        created: bool = identity is None
+        if created:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection: sqlite3.Connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        identity = self._identity()
+        with self._lock:
+            # A new file may reuse the inode of a removed one
+            if created or self._ready != identity:
+                connection.executescript(self.schema)
+                if self.setup is not None:
+                    self.setup(connection)
+                    connection.commit()
+                self._ready = identity
+
+        if getattr(self._local, 'key', (None,))[0] == os.getpid():
+            self._local.connection.close()
+        self._local.connection, self._local.key = connection, (os.getpid(), identity)
+        return connection
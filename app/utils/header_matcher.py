@@ -0,0 +1,124 @@
+import csv
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import Callable, Dict, List, Mapping, Optional
+
+_NO_MATCH: int = -1
+
+
+class HeaderMatcher:
+    """Precompiled lookup for header conversions.
+
+    Resolves a header the same way a linear scan of the conversion table
+    would: exact match first, then case-insensitive match, then the first
+    pattern (in table order) contained in the header. Exact and
+    case-insensitive hits are dict lookups; substring hits use an
+    Aho-Corasick automaton, so one pass over the header finds every
+    pattern regardless of the table size. Results are memoized.
+    """
+
+    def __init__(self, conversions: Mapping[str, str], cache_size: int = 65536) -> None:
+        self._exact: Dict[str, str] = dict(conversions)
+        # Identifies the table, for results computed from it and kept beyond this process
+        self.signature: str = hashlib.sha256(json.dumps(list(self._exact.items())).encode('utf-8')).hexdigest()
+        self._replacements: List[str] = list(self._exact.values())
+        self._folded: Dict[str, str] = {}
+        for pattern, replacement in self._exact.items():
+            self._folded.setdefault(pattern.casefold(), replacement)
+        self._build_automaton([pattern.casefold() for pattern in self._exact])
+        self.convert: Callable[[str], str] = lru_cache(maxsize=cache_size)(self._convert)
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    @classmethod
+    def load(cls, conversions: Mapping[str, str], extra_path: Optional[str] = None) -> 'HeaderMatcher':
+        """Build a matcher from the built-in table, extended by a JSON or CSV conversion file if given."""
+        table: Dict[str, str] = dict(conversions)
+        if extra_path:
+            table.update(cls.read_conversions(extra_path))
+        return cls(table)
+
+    @staticmethod
+    def read_conversions(filepath: str) -> Dict[str, str]:
+        """Read a conversion table: a JSON object, or a CSV whose first two columns are pattern and replacement.
+
+        The CSV's first row is a header and is skipped.
+        """
+        if os.path.splitext(filepath)[1].lower() == '.json':
+            with open(filepath, encoding='utf-8') as f:
+                table = json.load(f)
+            if not isinstance(table, dict):
+                raise ValueError(f"Header conversion file must contain a JSON object: {filepath}")
+            return {str(pattern): str(replacement) for pattern, replacement in table.items()}
+
+        with open(filepath, newline='', encoding='utf-8-sig') as f:
+            rows = csv.reader(f)
+            next(rows, None)
+            return {row[0]: row[1] for row in rows if len(row) >= 2 and row[0]}
+
+    def _build_automaton(self, patterns: List[str]) -> None:
+        # Trie edges, failure links, and for each node the lowest index of a pattern ending there
+        # or at any of its suffixes
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._match: List[int] = [_NO_MATCH]
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._match.append(_NO_MATCH)
+                node = next_node
+            if self._match[node] == _NO_MATCH:
+                self._match[node] = index
+
+        queue: List[int] = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._match[child] = self._earliest(self._match[child], self._match[self._fail[child]])
+                queue.append(child)
+
+    @staticmethod
+    def _earliest(first: int, second: int) -> int:
+        if first == _NO_MATCH:
+            return second
+        if second == _NO_MATCH:
+            return first
+        return min(first, second)
+
+    def _first_substring_match(self, text: str) -> int:
+        best: int = self._match[0]
+        node = 0
+        for char in text:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            best = self._earliest(best, self._match[node])
+        return best
+
+    def _convert(self, header: str) -> str:
+        # First try exact match
+        if header in self._exact:
+            return self._exact[header]
+
+        # Then try case-insensitive match
+        folded = header.casefold()
+        if folded in self._folded:
+            return self._folded[folded]
+
+        # Finally try substring match
+        index = self._first_substring_match(folded)
+        return self._replacements[index] if index != _NO_MATCH else header
@@ -0,0 +1,238 @@
+import abc
+import datetime
+import importlib.util
+import os
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from app.utils.constants import (
+    READER_ENGINES, CALAMINE_ENGINE, OPENPYXL_ENGINE, XLRD_ENGINE, PANDAS_ENGINE,
+    CONTAINER_ENCRYPTED, MSG_ENCRYPTED_FILE, MSG_ERROR
+)
+from app.utils.containers import container_extension, sniff_container
+
+
+class ReaderEngine(abc.ABC):
+    """A way of reading a worksheet of a workbook row by row.
+
+    iter_rows yields every row of the sheet at sheet_index (header row first),
+    sheet_names lists the sheets without reading their cells. Rows are tuples of cell values in
+    the form openpyxl gives them: None for empty cells, int for whole numbers,
+    datetime for dates. Engines are therefore interchangeable and a merge reads
+    the same values whichever one is used, except that calamine reads
+    whitespace-only text not marked xml:space="preserve" as empty. pandas_engine
+    is the name of the matching pd.read_excel engine, for reads that need a whole DataFrame.
+
+    streams tells whether iter_rows parses the sheet as it goes, holding one row
+    at a time. Engines that load the whole sheet first can be faster, but their
+    memory grows with the sheet, so large files are read by a streaming engine.
+    """
+    name: str = ''
+    pandas_engine: Optional[str] = None
+    streams: bool = False
+    # Optional dependency the engine needs
+    module: Optional[str] = None
+
+    def available(self) -> bool:
+        if self.module is None:
+            return True
+        if not hasattr(self, '_available'):
+            self._available: bool = importlib.util.find_spec(self.module) is not None
+        return self._available
+
+    @abc.abstractmethod
+    def iter_rows(self, filepath: str, sheet_index: int = 0) -> Iterator[Tuple]:
+        ...
+
+    def sheet_names(self, filepath: str) -> List[str]:
+        with pd.ExcelFile(filepath, engine=self.pandas_engine) as workbook:
+            return [str(name) for name in workbook.sheet_names]
+
+
+class OpenpyxlEngine(ReaderEngine):
+    """openpyxl in read-only, values-only mode (.xlsx, .xlsm), parsing the sheet as it is read."""
+    name = OPENPYXL_ENGINE
+    pandas_engine = OPENPYXL_ENGINE
+    streams = True
+
+    def iter_rows(self, filepath: str, sheet_index: int = 0) -> Iterator[Tuple]:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+        try:
+            # By name: sheets are numbered as in the workbook part, chartsheets included,
+            # while workbook.worksheets skips them
+            sheet = workbook[workbook.sheetnames[sheet_index]]
+            if not hasattr(sheet, 'iter_rows'):
+                # A chartsheet has no cells
+                return
+            # Dimensions written by some exporters are wrong; let openpyxl discover them
+            sheet.reset_dimensions()
+            yield from sheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    def sheet_names(self, filepath: str) -> List[str]:
+        from openpyxl import load_workbook
+
+        # pandas lists worksheets only; chartsheets keep their place here, as in read_sheet_names
+        workbook = load_workbook(filepath, read_only=True, keep_links=False)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+
+
+class CalamineEngine(ReaderEngine):
+    """python-calamine (Rust), for .xlsx, .xlsm, .xlsb and .xls; optional dependency.
+
+    About ten times faster than openpyxl, but the whole sheet is loaded before
+    the first row is returned.
+    """
+    name = CALAMINE_ENGINE
+    pandas_engine = CALAMINE_ENGINE
+    module = 'python_calamine'
+
+    def iter_rows(self, filepath: str, sheet_index: int = 0) -> Iterator[Tuple]:
+        from python_calamine import CalamineWorkbook
+
+        workbook = CalamineWorkbook.from_path(filepath)
+        try:
+            sheet = workbook.get_sheet_by_index(sheet_index)
+            # Rows start at the first used column; openpyxl's start at column A
+            padding: Tuple = (None,) * sheet.start[1] if sheet.start else ()
+            for row in sheet.iter_rows():
+                yield padding + tuple(self._convert(value) for value in row)
+        finally:
+            close = getattr(workbook, 'close', None)
+            if close:
+                close()
+
+    def sheet_names(self, filepath: str) -> List[str]:
+        from python_calamine import CalamineWorkbook
+
+        # Sheets are only loaded when read, so this stops at the workbook metadata
+        workbook = CalamineWorkbook.from_path(filepath)
+        try:
+            return list(workbook.sheet_names)
+        finally:
+            close = getattr(workbook, 'close', None)
+            if close:
+                close()
+
+    @staticmethod
+    def _convert(value):
+        # Calamine reports empty cells as '', every number as float and date cells as date.
+        # Whole numbers are ints below 1e16, where the stored text has no exponent
+        if value == '':
+            return None
+        if isinstance(value, float) and value.is_integer() and abs(value) < 1e16:
+            return int(value)
+        if type(value) is datetime.date:
+            return datetime.datetime(value.year, value.month, value.day)
+        return value
+
+
+class XlrdEngine(ReaderEngine):
+    """xlrd, for legacy .xls files; optional dependency."""
+    name = XLRD_ENGINE
+    pandas_engine = XLRD_ENGINE
+    module = 'xlrd'
+
+    def iter_rows(self, filepath: str, sheet_index: int = 0) -> Iterator[Tuple]:
+        import xlrd
+
+        workbook = xlrd.open_workbook(filepath, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(sheet_index)
+            for index in range(sheet.nrows):
+                yield tuple(
+                    self._convert(cell, workbook.datemode) for cell in sheet.row(index)
+                )
+        finally:
+            workbook.release_resources()
+
+    def sheet_names(self, filepath: str) -> List[str]:
+        import xlrd
+
+        # on_demand leaves every sheet unparsed
+        workbook = xlrd.open_workbook(filepath, on_demand=True)
+        try:
+            return workbook.sheet_names()
+        finally:
+            workbook.release_resources()
+
+    @staticmethod
+    def _convert(cell, datemode: int):
+        import xlrd
+
+        if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+            return None
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            return xlrd.xldate.xldate_as_datetime(cell.value, datemode)
+        if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(cell.value)
+        if cell.ctype == xlrd.XL_CELL_NUMBER and float(cell.value).is_integer():
+            return int(cell.value)
+        return cell.value
+
+
+class PandasEngine(ReaderEngine):
+    """pd.read_excel with its default engine; reads the whole sheet, as a last resort."""
+    name = PANDAS_ENGINE
+
+    def iter_rows(self, filepath: str, sheet_index: int = 0) -> Iterator[Tuple]:
+        # Keep NA strings as text (missing values are masked downstream, as for the other engines)
+        sheet = pd.read_excel(filepath, sheet_name=sheet_index, header=None, dtype=object, keep_default_na=False)
+        for row in sheet.itertuples(index=False, name=None):
+            yield tuple(None if value == '' or pd.isna(value) else value for value in row)
+
+
+_ENGINES: Dict[str, ReaderEngine] = {}
+
+
+def register_engine(engine: ReaderEngine) -> None:
+    """Add (or replace) an engine, selectable by name in READER_ENGINES."""
+    _ENGINES[engine.name] = engine
+
+
+def get_engine(name: str) -> ReaderEngine:
+    return _ENGINES[name]
+
+
+def available_engines() -> List[str]:
+    return [name for name, engine in _ENGINES.items() if engine.available()]
+
+
+def engine_for(
+    filepath: str,
+    preferences: Mapping[str, Sequence[str]] = READER_ENGINES,
+    container: Optional[str] = None,
+    streaming: bool = False
+) -> ReaderEngine:
+    """The one engine that reads this file: the first available one configured for its type.
+
+    The type comes from the file's first bytes (container, if already sniffed),
+    with the extension only telling apart formats sharing a container. Protected
+    and unrecognized files raise ValueError instead of being tried by each engine.
+    With streaming, the first available engine that streams rows is picked, if
+    one is configured for the type.
+    """
+    container = container or sniff_container(filepath)
+    if container == CONTAINER_ENCRYPTED:
+        raise ValueError(MSG_ENCRYPTED_FILE)
+    extension: Optional[str] = container_extension(container, os.path.splitext(filepath)[1].lstrip('.').lower())
+    if extension is None:
+        raise ValueError(MSG_ERROR)
+
+    engines: List[ReaderEngine] = [
+        _ENGINES[name] for name in preferences.get(extension, ()) if name in _ENGINES and _ENGINES[name].available()
+    ]
+    if streaming:
+        engines = [engine for engine in engines if engine.streams] + engines
+    return engines[0] if engines else _ENGINES[PANDAS_ENGINE]
+
+
+for _engine in (CalamineEngine(), OpenpyxlEngine(), XlrdEngine(), PandasEngine()):
+    register_engine(_engine)
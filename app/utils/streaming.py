@@ -0,0 +1,249 @@
+import io
+import queue
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+from pandas import DataFrame
+
+from app.utils.constants import (
+    GZIP_LEVEL, PARQUET_COMPRESSION, XLSX_SHEET_TITLE, OUTPUT_CHUNK_BYTES, OUTPUT_QUEUE_CHUNKS
+)
+
+_DONE = object()
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable sink whose contents are drained as the archive is written."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def iter_zip(entries: Iterable[Tuple[str, Iterator[str]]]) -> Iterator[bytes]:
+    """Stream a ZIP archive of text entries without holding any entry in memory.
+
+    The archive is written with data descriptors (the sink is not seekable), so
+    each compressed chunk can be sent as soon as it is produced.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            with archive.open(name, 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk.encode('utf-8'))
+                    yield from _nonempty(buffer.drain())
+            yield from _nonempty(buffer.drain())
+    yield from _nonempty(buffer.drain())
+
+
+def iter_gzip(chunks: Iterable[str | bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """Gzip-compress a stream of chunks as they arrive."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield from _nonempty(compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk))
+    yield compressor.flush()
+
+
+def iter_parquet(
+    headers: List[str],
+    batches: Iterable[DataFrame],
+    compression: str = PARQUET_COMPRESSION
+) -> Iterator[bytes]:
+    """Stream a Parquet file of string columns, one row group per batch (empty strings are nulls)."""
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(header, pa.string()) for header in headers])
+    buffer = _ChunkBuffer()
+    writer = pq.ParquetWriter(buffer, schema, compression=compression)
+    try:
+        for batch in batches:
+            arrays: List[pa.Array] = []
+            for position in range(len(headers)):
+                values: np.ndarray = batch.iloc[:, position].to_numpy(dtype=object)
+                arrays.append(pa.array(values, type=pa.string(), mask=values == ''))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield from _nonempty(buffer.drain())
+    finally:
+        writer.close()
+    yield from _nonempty(buffer.drain())
+
+
+def iter_xlsx(headers: List[str], batches: Iterable[DataFrame], title: str = XLSX_SHEET_TITLE) -> Iterator[bytes]:
+    """Stream an XLSX workbook of one sheet, written with openpyxl in write-only mode.
+
+    Rows go to openpyxl's temporary file as batches arrive; the package is then
+    zipped into a bounded queue while it is being sent, so neither the rows nor
+    the file are held in memory. Values are written as text, never as formulas.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    def cell(value):
+        if value == '' or value is None:
+            return None
+        value = ILLEGAL_CHARACTERS_RE.sub('', str(value))
+        if value.startswith('='):
+            formula_text = WriteOnlyCell(sheet, value)
+            formula_text.data_type = 's'
+            return formula_text
+        return value
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(headers)
+    for batch in batches:
+        for row in batch.itertuples(index=False, name=None):
+            sheet.append([cell(value) for value in row])
+    yield from iter_written(workbook.save)
+
+
+def iter_written(write: Callable[[BinaryIO], None], queue_size: int = OUTPUT_QUEUE_CHUNKS) -> Iterator[bytes]:
+    """Turn a function that writes a whole file to a stream into an iterator of its chunks.
+
+    write runs in a thread against a sink feeding a bounded queue, so at most
+    queue_size chunks of OUTPUT_CHUNK_BYTES are buffered. Its exceptions are
+    re-raised here; a consumer that stops early stops the writer too.
+    """
+    stop = threading.Event()
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+
+    def put(item) -> None:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    sink = _QueueSink(put)
+
+    def run() -> None:
+        try:
+            write(sink)
+            sink.flush_chunk()
+            put(_DONE)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            try:
+                put(e)
+            except _Stopped:
+                pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class _Stopped(Exception):
+    """The consumer of iter_written went away."""
+
+
+class _QueueSink(io.RawIOBase):
+    """Write-only, unseekable sink handing its data over in chunks of about OUTPUT_CHUNK_BYTES."""
+
+    def __init__(self, put: Callable[[bytes], None]) -> None:
+        super().__init__()
+        self._put = put
+        self._pending: List[bytes] = []
+        self._pending_bytes: int = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._pending.append(bytes(data))
+        self._pending_bytes += len(data)
+        if self._pending_bytes >= OUTPUT_CHUNK_BYTES:
+            self.flush_chunk()
+        return len(data)
+
+    def flush_chunk(self) -> None:
+        if self._pending:
+            data, self._pending, self._pending_bytes = b''.join(self._pending), [], 0
+            self._put(data)
+
+
+def _nonempty(data: bytes) -> Iterator[bytes]:
+    if data:
+        yield data
+
+
+def iter_prefetched(sources: List[Iterator], workers: int, queue_size: int) -> Iterator[Iterator]:
+    """Run several iterators concurrently in threads and hand them back in order.
+
+    Each source is drained by a worker thread into a bounded queue, so at most
+    workers * queue_size chunks are buffered however large the sources are.
+    Exceptions raised by a source are re-raised when its chunks are consumed.
+    """
+    stop = threading.Event()
+    queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in sources]
+
+    def put(target: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(source: Iterator, target: queue.Queue) -> None:
+        try:
+            for chunk in source:
+                if not put(target, chunk):
+                    return
+            put(target, _DONE)
+        except BaseException as e:
+            put(target, e)
+        finally:
+            close = getattr(source, 'close', None)
+            if close:
+                close()
+
+    def consume(source_queue: queue.Queue) -> Iterator:
+        while True:
+            item = source_queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for source, target in zip(sources, queues):
+            executor.submit(produce, source, target)
+        for target in queues:
+            yield consume(target)
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,180 @@
+import posixpath
+import re
+import zipfile
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+# Relationship type suffixes (transitional and strict OOXML share the tail)
+_OFFICE_DOCUMENT_REL: str = '/officeDocument'
+_SHARED_STRINGS_REL: str = '/sharedStrings'
+_ROOT_RELS: str = '_rels/.rels'
+_COLUMN_REF = re.compile(r'([A-Z]+)')
+
+
+def _local(tag: str) -> str:
+    """Strip the XML namespace so transitional and strict OOXML parse the same way."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _attr(element: ElementTree.Element, name: str) -> Optional[str]:
+    for key, value in element.attrib.items():
+        if _local(key) == name:
+            return value
+    return None
+
+
+def _rels_path(part: str) -> str:
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, '_rels', f'{name}.rels')
+
+
+def _resolve(source_part: str, target: str) -> str:
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def _relationships(archive: zipfile.ZipFile, part: str) -> List[Tuple[str, str, str]]:
+    """Return (id, type, resolved target) for each relationship of a package part."""
+    rels_part = _ROOT_RELS if part == '' else _rels_path(part)
+    try:
+        root = ElementTree.fromstring(archive.read(rels_part))
+    except KeyError:
+        return []
+    return [
+        (rel.get('Id'), rel.get('Type', ''), _resolve(part, rel.get('Target', '')))
+        for rel in root
+        if _local(rel.tag) == 'Relationship'
+    ]
+
+
+def _workbook_part(archive: zipfile.ZipFile) -> str:
+    for _, rel_type, target in _relationships(archive, ''):
+        if rel_type.endswith(_OFFICE_DOCUMENT_REL):
+            return target
+    return 'xl/workbook.xml'
+
+
+def _column_index(reference: Optional[str], fallback: int) -> int:
+    if not reference:
+        return fallback
+    match = _COLUMN_REF.match(reference)
+    if not match:
+        return fallback
+    index = 0
+    for char in match.group(1):
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index - 1
+
+
+def _text(element: ElementTree.Element) -> str:
+    """Concatenate <t> runs of a string item, skipping phonetic (<rPh>) runs."""
+    parts: List[str] = []
+    for child in element:
+        name = _local(child.tag)
+        if name == 't':
+            parts.append(child.text or '')
+        elif name == 'r':
+            parts.extend(t.text or '' for t in child if _local(t.tag) == 't')
+    return ''.join(parts)
+
+
+def _shared_strings(stream: IO[bytes], wanted: set) -> Dict[int, str]:
+    """Stream the shared string table, stopping once the highest wanted index is reached."""
+    found: Dict[int, str] = {}
+    last: int = max(wanted)
+    index: int = 0
+    for _, element in ElementTree.iterparse(stream, events=('end',)):
+        if _local(element.tag) != 'si':
+            continue
+        if index in wanted:
+            found[index] = _text(element)
+        element.clear()
+        if index >= last:
+            break
+        index += 1
+    return found
+
+
+def sheet_parts(archive: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    """List (sheet name, package part) pairs in workbook order, without touching any cells."""
+    workbook_part = _workbook_part(archive)
+    targets = {rel_id: target for rel_id, _, target in _relationships(archive, workbook_part)}
+    workbook = ElementTree.fromstring(archive.read(workbook_part))
+    sheets: List[Tuple[str, str]] = []
+    for element in workbook.iter():
+        if _local(element.tag) == 'sheet':
+            target = targets.get(_attr(element, 'id'))
+            if target:
+                sheets.append((element.get('name', ''), target))
+    return sheets
+
+
+def read_sheet_names(filepath: str) -> List[str]:
+    """Sheet names in workbook order, read from the workbook part only."""
+    with zipfile.ZipFile(filepath) as archive:
+        return [name for name, _ in sheet_parts(archive)]
+
+
+def _iter_row_cells(stream: IO[bytes]) -> Iterator[Tuple[int, List[Tuple[int, Optional[str], str]]]]:
+    """Yield (1-based row number, cells) for each <row>, cells being (column index, cell type, raw value)."""
+    cells: List[Tuple[int, Optional[str], str]] = []
+    row_number: int = 0
+    for _, element in ElementTree.iterparse(stream, events=('end',)):
+        name = _local(element.tag)
+        if name == 'c':
+            cell_type = element.get('t')
+            if cell_type == 'inlineStr':
+                value = ''.join(_text(child) for child in element if _local(child.tag) == 'is')
+            else:
+                value = next((child.text or '' for child in element if _local(child.tag) == 'v'), '')
+            cells.append((_column_index(element.get('r'), len(cells)), cell_type, value))
+        elif name == 'row':
+            row_number = int(element.get('r') or row_number + 1)
+            yield row_number, cells
+            cells = []
+            element.clear()
+
+
+def read_header_row(filepath: str, sheet_index: int = 0) -> List[Optional[str]]:
+    """Read the first row of a sheet straight from the package XML.
+
+    Only the sheet XML up to that row is decompressed, and the shared string
+    table is only read as far as the highest index the header refers to, so
+    the cost does not depend on the number of data rows. Raises ValueError when
+    row 1 is blank, since its width then depends on the data below it.
+    """
+    with zipfile.ZipFile(filepath) as archive:
+        sheets = sheet_parts(archive)
+        if not sheets:
+            raise ValueError('Workbook contains no worksheets')
+        sheet_part = sheets[sheet_index][1]
+
+        with archive.open(sheet_part) as stream:
+            row_number, header = next(_iter_row_cells(stream), (1, []))
+        if row_number != 1 or not any(value for _, _, value in header):
+            raise ValueError('Header row is blank')
+
+        shared: Dict[int, str] = {}
+        wanted = {int(value) for _, cell_type, value in header if cell_type == 's' and value}
+        if wanted:
+            strings_part = next(
+                (target for _, rel_type, target in _relationships(archive, _workbook_part(archive))
+                 if rel_type.endswith(_SHARED_STRINGS_REL)),
+                None
+            )
+            if strings_part:
+                with archive.open(strings_part) as stream:
+                    shared = _shared_strings(stream, wanted)
+
+    width = max((column for column, _, _ in header), default=-1) + 1
+    values: List[Optional[str]] = [None] * width
+    for column, cell_type, value in header:
+        if cell_type == 's':
+            value = shared.get(int(value)) if value else None
+        elif cell_type == 'b':
+            value = 'True' if value == '1' else 'False'
+        elif cell_type in (None, 'n') and value.endswith('.0'):
+            value = value[:-2]
+        values[column] = value if value != '' else None
+    return values
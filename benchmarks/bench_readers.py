@@ -0,0 +1,57 @@
+"""Throughput of each available reader engine on a flow export.
+
+    python -m benchmarks.bench_readers --rows 100000
+    python -m benchmarks.bench_readers --file path/to/export.xlsx
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from app.services.file_service import FileService
+from app.utils.readers import available_engines, get_engine
+from benchmarks.flow_export import write_flow_export
+
+
+def best_of(repeat: int, run: Callable[[], int]) -> Dict[str, float]:
+    timings: List[float] = []
+    rows: int = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run()
+        timings.append(time.perf_counter() - start)
+    seconds: float = min(timings)
+    return {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds else 0.0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help='rows in the generated export')
+    parser.add_argument('--file', help='benchmark this workbook instead of a generated one')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per engine (the best is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path: str = args.file or write_flow_export(os.path.join(directory, 'flows.xlsx'), args.rows)
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"{'engine':<10} {'stage':<8} {'rows':>9} {'seconds':>9} {'rows/s':>11}")
+
+        for name in available_engines():
+            engine = get_engine(name)
+            stages = {
+                'rows': lambda: sum(1 for _ in engine.iter_rows(path)) - 1,
+                'batches': lambda: sum(len(batch) for batch in FileService.iter_input_batches(path, engine=engine)),
+            }
+            for stage, run in stages.items():
+                try:
+                    result = best_of(args.repeat, run)
+                except Exception as e:
+                    print(f"{name:<10} {stage:<8} failed: {str(e)}")
+                    continue
+                print(f"{name:<10} {stage:<8} {result['rows']:>9} {result['seconds']:>9.2f} "
+                      f"{result['rows_per_second']:>11,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Import time of the app, and memory of prefork workers with and without preloading.
+
+    python -m benchmarks.bench_startup --workers 4 --rows 10000
+
+Import time is measured in fresh interpreters (best of --repeat). For memory,
+a master forks --workers workers the way a prefork server does: in the lazy
+mode each worker creates the app after the fork (a server without preloading),
+in the preload mode the master imports wsgi (created, warmed, gc frozen) and
+workers inherit it. Each worker then uploads a generated export and merges it,
+and is measured while all workers are alive: RSS counts shared pages in every
+worker, USS only the worker's own pages and PSS its share of the shared ones.
+Linux only (/proc/<pid>/smaps_rollup).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_seconds(module: str, repeat: int) -> float:
+    """Best time to import a module in a fresh interpreter."""
+    code: str = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return min(
+        float(subprocess.run([sys.executable, '-c', code], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout)
+        for _ in range(repeat)
+    )
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """RSS, PSS and USS of a process, from /proc/<pid>/smaps_rollup."""
+    fields: Dict[str, int] = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as f:
+        for line in f:
+            parts: List[str] = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_mb': fields['Rss'] / 1024,
+        'pss_mb': fields['Pss'] / 1024,
+        'uss_mb': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024
+    }
+
+
+def _serve(app, export_path: str, guideline_path: str) -> None:
+    """What a worker does on its first requests: an upload, then a merge of the uploaded file."""
+    from app.services.file_service import FileService
+    from app.services.session_service import SessionService
+    from app.utils.constants import GUIDELINE_FILE, INPUT_FILE, SESSION_GUIDELINE_PATH
+
+    client = app.test_client()
+    with open(guideline_path, 'rb') as guideline, open(export_path, 'rb') as export:
+        response = client.post('/', data={
+            GUIDELINE_FILE: (guideline, os.path.basename(guideline_path)),
+            INPUT_FILE: (export, os.path.basename(export_path))
+        }, content_type='multipart/form-data')
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed with status {response.status_code}")
+    with client.session_transaction() as session:
+        guideline_upload: str = session[SESSION_GUIDELINE_PATH]
+        saved: List[Dict] = SessionService.list_files(session.sid)
+    response = client.get(f"/merge_and_download/{saved[0]['id']}")
+    if response.status_code != 200:
+        raise RuntimeError(f"Merge failed with status {response.status_code}")
+    for path in [guideline_upload] + [f['path'] for f in saved]:
+        FileService.cleanup_file(path)
+
+
+def measure_workers(preload: bool, workers: int, export_path: str, guideline_path: str) -> Dict:
+    """Fork workers from this process (which must not have imported the app yet) and measure them."""
+    app = None
+    start: float = time.perf_counter()
+    if preload:
+        import wsgi
+        app = wsgi.app
+    master_seconds: float = time.perf_counter() - start
+
+    ready_read, ready_write = os.pipe()
+    release_read, release_write = os.pipe()
+    pids: List[int] = []
+    for _ in range(workers):
+        pid: int = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            os.close(release_write)
+            status: int = 0
+            try:
+                started: float = time.perf_counter()
+                if app is None:
+                    from app import create_app
+                    app = create_app()
+                ready_seconds: float = time.perf_counter() - started
+                _serve(app, export_path, guideline_path)
+                os.write(ready_write, (json.dumps({'pid': os.getpid(), 'ready_seconds': ready_seconds}) + '\n').encode())
+                # Stay alive until every worker has been measured
+                os.read(release_read, 1)
+            except BaseException as e:
+                os.write(ready_write, (json.dumps({'pid': os.getpid(), 'error': str(e)}) + '\n').encode())
+                status = 1
+            finally:
+                os._exit(status)
+        pids.append(pid)
+    os.close(ready_write)
+    os.close(release_read)
+
+    reports: List[Dict] = []
+    with os.fdopen(ready_read, encoding='utf-8') as ready:
+        for _ in range(workers):
+            reports.append(json.loads(ready.readline()))
+    errors: List[str] = [report['error'] for report in reports if 'error' in report]
+    measured: List[Dict] = [{**report, **memory_mb(report['pid'])} for report in reports if 'error' not in report]
+    os.close(release_write)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    if errors:
+        raise RuntimeError(errors[0])
+
+    return {
+        'master_seconds': master_seconds,
+        'master_rss_mb': memory_mb(os.getpid())['rss_mb'],
+        **{
+            key: statistics.mean(worker[key] for worker in measured)
+            for key in ('ready_seconds', 'rss_mb', 'pss_mb', 'uss_mb')
+        }
+    }
+
+
+def _measure_in_subprocess(preload: bool, workers: int, export_path: str, guideline_path: str) -> Dict:
+    # A fresh master per mode, so the lazy one has not imported anything the preload one did
+    code: str = (
+        "import json, sys; from benchmarks.bench_startup import measure_workers; "
+        f"print(json.dumps(measure_workers({preload!r}, {workers}, sys.argv[1], sys.argv[2])))"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code, export_path, guideline_path],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    # Imported here: the measured masters import this module and must start without the app's dependencies
+    from benchmarks.flow_export import write_flow_export, write_guideline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='workers forked by the master')
+    parser.add_argument('--rows', type=int, default=10_000, help='rows in the export each worker uploads and merges')
+    parser.add_argument('--repeat', type=int, default=5, help='imports timed (the best is reported)')
+    args = parser.parse_args()
+
+    # The janitor has no business in a measurement
+    os.environ['JANITOR_ENABLED'] = '0'
+
+    for module in ('app', 'wsgi'):
+        print(f"import {module:<5} {import_seconds(module, args.repeat):.3f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        export_path: str = write_flow_export(os.path.join(directory, 'flows.xlsx'), args.rows)
+        guideline_path: str = write_guideline(os.path.join(directory, 'guideline.csv'))
+        print(f"{'mode':<8} {'master s':>9} {'worker ready s':>15} {'RSS MB':>8} {'PSS MB':>8} {'USS MB':>8}")
+        for preload in (False, True):
+            result: Dict = _measure_in_subprocess(preload, args.workers, export_path, guideline_path)
+            print(f"{'preload' if preload else 'lazy':<8} {result['master_seconds']:>9.2f} {result['ready_seconds']:>15.3f} "
+                  f"{result['rss_mb']:>8.0f} {result['pss_mb']:>8.0f} {result['uss_mb']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
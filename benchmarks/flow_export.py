@@ -0,0 +1,77 @@
+"""Synthetic flow exports shaped like the workbooks the app merges."""
+import datetime
+import random
+from typing import Iterator, List
+
+from openpyxl import Workbook
+
+from app.utils.constants import FULL_HEADER_CONVERSIONS
+
+# Export columns: every vendor header we convert, plus columns no guideline asks for
+EXPORT_HEADERS: List[str] = list(FULL_HEADER_CONVERSIONS) + [
+    'Source IP', 'Destination IP', 'Port', 'Protocol', 'Transmission'
+]
+# Columns that are blank in most rows
+SPARSE_HEADERS: frozenset = frozenset({
+    'Source IP Lists', 'Destination IP Lists', 'Destination Server', 'Boundary Control'
+})
+SPARSE_FILL_RATE: float = 0.15
+
+
+def guideline_headers() -> List[str]:
+    """Guideline columns matching the export: the conversion targets."""
+    return list(dict.fromkeys(FULL_HEADER_CONVERSIONS.values()))
+
+
+def iter_flow_rows(rows: int, seed: int = 0) -> Iterator[list]:
+    """Data rows of a flow export; the same seed gives the same rows."""
+    rng = random.Random(seed)
+    apps: List[str] = [f'app-{index:03d}' for index in range(200)]
+    envs: List[str] = ['prod', 'staging', 'dev', 'N/A']
+    modes: List[str] = ['full', 'selective', 'visibility_only', 'idle']
+    start = datetime.datetime(2024, 1, 1)
+
+    for _ in range(rows):
+        first = start + datetime.timedelta(minutes=rng.randrange(525_600))
+        values = {
+            'Source App Label': rng.choice(apps),
+            'Source Env': rng.choice(envs),
+            'Source Enforcement': rng.choice(modes),
+            'Source IP Lists': f'iplist-{rng.randrange(50)}',
+            'Destination App Label': rng.choice(apps),
+            'Destination Env': rng.choice(envs),
+            'Destination Server': f'srv{rng.randrange(5000)}.example.internal',
+            'Destination IP Lists': f'iplist-{rng.randrange(50)}',
+            'Destination Enforcement': rng.choice(modes),
+            'Boundary Control': rng.choice(['blocked', 'allowed']),
+            'Local Control': rng.choice(['allowed', 'potentially_blocked', 'blocked']),
+            'Total Connection Count': rng.randrange(1, 100_000),
+            'First Detected Date': first,
+            'Last Detected Date': first + datetime.timedelta(hours=rng.randrange(1, 2000)),
+            'Source IP': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+            'Destination IP': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+            'Port': rng.choice([22, 53, 80, 443, 3306, 5432, 8080]),
+            'Protocol': rng.choice(['TCP', 'UDP']),
+            'Transmission': rng.choice(['Unicast', 'Broadcast']),
+        }
+        yield [
+            None if header in SPARSE_HEADERS and rng.random() > SPARSE_FILL_RATE else values[header]
+            for header in EXPORT_HEADERS
+        ]
+
+
+def write_flow_export(path: str, rows: int, seed: int = 0) -> str:
+    """Write a flow export workbook (.xlsx) with the given number of data rows."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Flows')
+    sheet.append(EXPORT_HEADERS)
+    for row in iter_flow_rows(rows, seed):
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def write_guideline(path: str) -> str:
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(guideline_headers()) + '\n')
+    return path
@@ -0,0 +1,306 @@
+"""Wall time and peak memory of the upload and merge paths on generated flow exports.
+
+    python -m benchmarks.suite --rows 10000 100000 --output results.json
+    python -m benchmarks.suite --rows 10000 100000 1000000 --update-baseline
+
+Each case runs in a fresh process on a freshly stored copy of the export, so
+every run starts with cold caches and its peak RSS is its own. The best of
+--repeat runs is kept. Results are compared with benchmarks/baselines.json: a
+case regresses when it is slower or bigger than its baseline by more than the
+thresholds, and the exit status is then 1.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.flow_export import write_flow_export, write_guideline
+
+BENCHMARK_DIR: str = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR: str = os.path.join(BENCHMARK_DIR, 'data')
+BASELINES_PATH: str = os.path.join(BENCHMARK_DIR, 'baselines.json')
+
+DEFAULT_ROWS: List[int] = [10_000, 100_000]
+# Allowed growth over the baseline, relative; timings also get an absolute allowance for noise
+TIME_THRESHOLD: float = 0.25
+RSS_THRESHOLD: float = 0.20
+TIME_SLACK_SECONDS: float = 0.05
+
+
+def _stage(export_path: str) -> str:
+    """Store the export as an upload, as the upload route would."""
+    from app.services.directory_service import DirectoryService
+    from app.services.file_service import FileService
+    from werkzeug.datastructures import FileStorage
+
+    DirectoryService.ensure_upload_dirs()
+    with open(export_path, 'rb') as f:
+        path, _ = FileService.save_input_file(FileStorage(f, filename=os.path.basename(export_path)))
+    return path
+
+
+def _case_process_input_file(export_path: str, guideline_path: str) -> Tuple[Callable[[], int], Callable[[], None]]:
+    from app.services.file_service import FileService
+
+    path: str = _stage(export_path)
+    return lambda: len(FileService.process_input_file(path)), lambda: FileService.cleanup_file(path)
+
+
+def _case_compare_headers(export_path: str, guideline_path: str) -> Tuple[Callable[[], int], Callable[[], None]]:
+    # Header validation of an upload: read the input headers, then compare them with the guideline
+    from app.services.file_service import FileService
+    from app.services.guideline_service import GuidelineService
+    from app.services.merge_service import MergeService
+
+    path: str = _stage(export_path)
+    guideline = GuidelineService.load(guideline_path)
+
+    def run() -> int:
+        result = MergeService.compare_headers(guideline, FileService.read_input_headers(path))
+        return len(result['matched_headers'])
+
+    return run, lambda: FileService.cleanup_file(path)
+
+
+def _case_merge_files(export_path: str, guideline_path: str) -> Tuple[Callable[[], int], Callable[[], None]]:
+    from app.services.file_service import FileService
+    from app.services.merge_service import MergeService
+
+    path: str = _stage(export_path)
+    return (
+        lambda: MergeService.merge_files(guideline_path, path).count('\n') - 1,
+        lambda: FileService.cleanup_file(path)
+    )
+
+
+def _client():
+    from app import create_app
+
+    app = create_app()
+    app.config['TESTING'] = True
+    # Measure processing, not the request size limit
+    app.config['MAX_CONTENT_LENGTH'] = None
+    return app.test_client()
+
+
+def _upload(client, export_path: str, guideline_path: str):
+    from app.utils.constants import GUIDELINE_FILE, INPUT_FILE
+
+    with open(guideline_path, 'rb') as guideline, open(export_path, 'rb') as export:
+        response = client.post('/', data={
+            GUIDELINE_FILE: (guideline, os.path.basename(guideline_path)),
+            INPUT_FILE: (export, os.path.basename(export_path))
+        }, content_type='multipart/form-data')
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed with status {response.status_code}")
+    return response
+
+
+def _cleanup_session(client) -> None:
+    from app.services.file_service import FileService
+    from app.services.session_service import SessionService
+    from app.utils.constants import SESSION_GUIDELINE_PATH
+
+    with client.session_transaction() as session:
+        FileService.cleanup_file(session.get(SESSION_GUIDELINE_PATH))
+        for saved in SessionService.list_files(session.sid):
+            FileService.cleanup_file(saved['path'])
+
+
+def _case_upload_route(export_path: str, guideline_path: str) -> Tuple[Callable[[], int], Callable[[], None]]:
+    client = _client()
+    return lambda: len(_upload(client, export_path, guideline_path).data), lambda: _cleanup_session(client)
+
+
+def _case_merge_route(export_path: str, guideline_path: str) -> Tuple[Callable[[], int], Callable[[], None]]:
+    from app.services.session_service import SessionService
+
+    client = _client()
+    _upload(client, export_path, guideline_path)
+    with client.session_transaction() as session:
+        file_id: str = SessionService.list_files(session.sid)[0]['id']
+
+    def run() -> int:
+        # Consume the stream chunk by chunk, as a client would, rather than buffering the body
+        response = client.get(f'/merge_and_download/{file_id}', buffered=False)
+        if response.status_code != 200:
+            raise RuntimeError(f"Merge failed with status {response.status_code}")
+        try:
+            return sum(chunk.count(b'\n') for chunk in response.iter_encoded()) - 1
+        finally:
+            response.close()
+
+    return run, lambda: _cleanup_session(client)
+
+
+CASES: Dict[str, Callable[[str, str], Tuple[Callable[[], int], Callable[[], None]]]] = {
+    'process_input_file': _case_process_input_file,
+    'compare_headers': _case_compare_headers,
+    'merge_files': _case_merge_files,
+    'upload_route': _case_upload_route,
+    'merge_route': _case_merge_route,
+}
+
+
+def _peak_rss_mb() -> float:
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _run_case(case: str, export_path: str, guideline_path: str, results) -> None:
+    try:
+        run, cleanup = CASES[case](export_path, guideline_path)
+        try:
+            rss_before: float = _peak_rss_mb()
+            start: float = time.perf_counter()
+            count: int = run()
+            seconds: float = time.perf_counter() - start
+            results.put({
+                'seconds': seconds,
+                'peak_rss_mb': _peak_rss_mb(),
+                'rss_growth_mb': _peak_rss_mb() - rss_before,
+                'count': count
+            })
+        finally:
+            cleanup()
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {str(e)}"})
+
+
+def measure(case: str, export_path: str, guideline_path: str, repeat: int) -> Dict:
+    """Best of repeat runs of a case, each in its own process."""
+    context = multiprocessing.get_context('spawn')
+    runs: List[Dict] = []
+    for _ in range(repeat):
+        results = context.Queue()
+        process = context.Process(target=_run_case, args=(case, export_path, guideline_path, results))
+        process.start()
+        result: Dict = results.get()
+        process.join()
+        if 'error' in result:
+            return result
+        runs.append(result)
+    return {
+        'seconds': min(run['seconds'] for run in runs),
+        'peak_rss_mb': min(run['peak_rss_mb'] for run in runs),
+        'rss_growth_mb': min(run['rss_growth_mb'] for run in runs),
+        'count': runs[0]['count']
+    }
+
+
+def export_for(rows: int, seed: int, data_dir: str = DATA_DIR) -> str:
+    """The generated export with rows data rows, written once and reused by later runs."""
+    path: str = os.path.join(data_dir, f'flows-{rows}-{seed}.xlsx')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {path}")
+        temp_path: str = path + '.partial.xlsx'
+        write_flow_export(temp_path, rows, seed)
+        os.replace(temp_path, path)
+    return path
+
+
+def compare(
+    results: List[Dict],
+    baselines: Dict[str, Dict],
+    time_threshold: float = TIME_THRESHOLD,
+    rss_threshold: float = RSS_THRESHOLD
+) -> List[str]:
+    """Describe each measurement that regressed against its baseline (keyed case@rows)."""
+    regressions: List[str] = []
+    for result in results:
+        baseline: Optional[Dict] = baselines.get(f"{result['case']}@{result['rows']}")
+        if baseline is None or 'error' in result:
+            continue
+        allowed_seconds: float = baseline['seconds'] * (1 + time_threshold) + TIME_SLACK_SECONDS
+        if result['seconds'] > allowed_seconds:
+            regressions.append(
+                f"{result['case']}@{result['rows']}: {result['seconds']:.2f}s, baseline {baseline['seconds']:.2f}s"
+            )
+        allowed_rss: float = baseline['peak_rss_mb'] * (1 + rss_threshold)
+        if result['peak_rss_mb'] > allowed_rss:
+            regressions.append(
+                f"{result['case']}@{result['rows']}: {result['peak_rss_mb']:.0f} MB peak RSS, "
+                f"baseline {baseline['peak_rss_mb']:.0f} MB"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='export sizes (data rows)')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case (the best is kept)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated exports')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='where generated exports are kept')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baselines', default=BASELINES_PATH, help='baselines to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the baselines')
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--rss-threshold', type=float, default=RSS_THRESHOLD)
+    args = parser.parse_args()
+
+    # The janitor has no business in a measurement
+    os.environ['JANITOR_ENABLED'] = '0'
+
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as directory:
+        guideline_path: str = write_guideline(os.path.join(directory, 'guideline.csv'))
+        print(f"{'case':<20} {'rows':>9} {'seconds':>9} {'peak MB':>9} {'growth MB':>10}")
+        for rows in args.rows:
+            export_path: str = export_for(rows, args.seed, args.data_dir)
+            for case in args.cases:
+                result: Dict = {'case': case, 'rows': rows, **measure(case, export_path, guideline_path, args.repeat)}
+                results.append(result)
+                if 'error' in result:
+                    print(f"{case:<20} {rows:>9} failed: {result['error']}")
+                    continue
+                print(f"{case:<20} {rows:>9} {result['seconds']:>9.2f} {result['peak_rss_mb']:>9.0f} "
+                      f"{result['rss_growth_mb']:>10.0f}")
+
+    report: Dict = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    baselines: Dict[str, Dict] = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding='utf-8') as f:
+            baselines = json.load(f)['baselines']
+
+    if args.update_baseline:
+        baselines.update({
+            f"{result['case']}@{result['rows']}": {
+                'seconds': round(result['seconds'], 4), 'peak_rss_mb': round(result['peak_rss_mb'], 1)
+            }
+            for result in results if 'error' not in result
+        })
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump({**{k: v for k, v in report.items() if k != 'results'}, 'baselines': baselines},
+                      f, indent=2, sort_keys=True)
+        print(f"Baselines written to {args.baselines}")
+        return
+
+    regressions: List[str] = compare(results, baselines, args.time_threshold, args.rss_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    failed: bool = bool(regressions) or any('error' in result for result in results)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""gunicorn settings for wsgi:app: the app is loaded and warmed once in the master, then forked."""
+import os
+
+from app.services.janitor_service import JanitorService
+from app.utils.constants import JANITOR_ENABLED
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2 * (os.cpu_count() or 1) + 1, 9)))
+# Merges stream for as long as the client reads; threads keep a slow download from holding a whole worker
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+preload_app = True
+
+
+def post_fork(server, worker) -> None:
+    # Not in the master, which keeps forking workers: each worker starts a janitor and the one
+    # holding the janitor lock sweeps, another taking over if that worker exits
+    if JANITOR_ENABLED:
+        JanitorService.start()
@@ -0,0 +1,17 @@
+"""Production entry point for prefork servers, preloaded once in the master:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is created and warmed before workers are forked, so they start ready
+and share its memory copy-on-write. A janitor thread is started in each worker
+after the fork (gunicorn.conf.py), not in the master; only the one holding the
+janitor lock sweeps.
+"""
+import gc
+
+from app import create_app, warm
+
+app = create_app(start_janitor=False)
+warm(app)
+# Objects created so far are never collected, so workers' garbage collections leave their pages shared
+gc.freeze()